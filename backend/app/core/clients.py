@@ -0,0 +1,111 @@
+from typing import Optional
+
+from pydantic import SecretStr
+
+from app.core.config import settings
+from app.core.metrics import model_metrics_callback
+
+
+class AIClients:
+    """
+    One long-lived set of model + vector DB clients for the whole app.
+    Built once in the FastAPI lifespan and injected into the services, so
+    HTTP/gRPC connections are reused instead of re-handshaking per request.
+    The SDKs are imported here, not at module level: importing the app
+    (tests, scripts, tooling) stays fast and needs no credentials.
+    """
+
+    def __init__(self):
+        from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+        from app.core.embedding_cache import CachedEmbeddings
+
+        google_key = SecretStr(settings.GOOGLE_API_KEY or "")
+
+        # === EMBEDDINGS (768 dims, must match the Pinecone index) ===
+        # Cached: repeated questions / memory sentences skip the network call.
+        self.embeddings = CachedEmbeddings(
+            GoogleGenerativeAIEmbeddings(
+                model=settings.EMBEDDING_MODEL,
+                google_api_key=google_key
+            ),
+            model_name=settings.EMBEDDING_MODEL,
+            path=settings.EMBEDDING_CACHE_PATH,
+            lru_size=settings.EMBEDDING_CACHE_LRU_SIZE
+        )
+
+        # === LLMs ===
+        # Vision: OCR of prescriptions + X-ray reading (deterministic)
+        self.vision_llm = ChatGoogleGenerativeAI(
+            model="gemini-2.5-flash",
+            temperature=0.0,
+            google_api_key=google_key,
+            callbacks=[model_metrics_callback("vision")]
+        )
+        # Summary: turns OCR text into structured JSON
+        self.summary_llm = ChatGoogleGenerativeAI(
+            model="gemini-2.5-flash",
+            temperature=0.3,
+            google_api_key=google_key,
+            callbacks=[model_metrics_callback("summary")]
+        )
+        # Chat: longitudinal RAG answers
+        self.chat_llm = ChatGoogleGenerativeAI(
+            model="gemini-flash-latest",
+            temperature=0.3,
+            google_api_key=google_key,
+            callbacks=[model_metrics_callback("chat")]
+        )
+
+        # === KEYWORD INDEX (local BM25, exact-term questions) ===
+        self.keyword_index = None
+        if settings.KEYWORD_SEARCH_ENABLED:
+            from app.core.keyword_index import KeywordIndex
+            self.keyword_index = KeywordIndex(settings.KEYWORD_INDEX_PATH)
+
+        # === VECTORSTORE ===
+        self.pinecone = None
+        self.pinecone_index = None
+        self.vectorstore = self._build_vectorstore()
+
+    def _build_vectorstore(self):
+        """
+        Picks the vector index from VECTOR_BACKEND.
+        "local"    -> per-patient memory-mapped NumPy partitions (offline / tests)
+        "pinecone" -> one Pinecone client + one index handle (default)
+        """
+        if settings.VECTOR_BACKEND == "local":
+            from app.core.vectorstore import LocalVectorStore
+            return LocalVectorStore(embedding=self.embeddings, path=settings.LOCAL_VECTOR_PATH)
+        if settings.VECTOR_BACKEND != "pinecone":
+            raise ValueError(f"Unknown VECTOR_BACKEND: {settings.VECTOR_BACKEND}")
+
+        from pinecone import Pinecone
+        from langchain_pinecone import PineconeVectorStore
+
+        self.pinecone = Pinecone(api_key=settings.PINECONE_API_KEY)
+        self.pinecone_index = self.pinecone.Index(settings.PINECONE_INDEX_NAME)
+        return PineconeVectorStore(
+            index=self.pinecone_index,
+            embedding=self.embeddings
+        )
+
+
+_clients: Optional[AIClients] = None
+
+def init_clients() -> AIClients:
+    """Called once from the FastAPI lifespan."""
+    global _clients
+    if _clients is None:
+        _clients = AIClients()
+    return _clients
+
+def set_clients(clients) -> None:
+    """Swap the registry (used by load tests / benchmarks to inject fakes)."""
+    global _clients
+    _clients = clients
+
+def get_clients() -> AIClients:
+    """FastAPI dependency + accessor for the shared client registry."""
+    if _clients is None:
+        raise RuntimeError("AI clients not initialized. Is the app lifespan running?")
+    return _clients
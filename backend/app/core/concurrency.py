@@ -0,0 +1,374 @@
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+from app.core.config import settings
+from app.core.log import get_logger
+from app.core.metrics import MODEL_BREAKER_OPENED, MODEL_QUEUE_SECONDS, MODEL_REJECTED, MODEL_RETRIES
+
+logger = get_logger("governor")
+
+T = TypeVar("T")
+
+# Max number of in-flight calls for each AI backend.
+# "vision" = Gemini multimodal calls, "llm" = text generation / RAG,
+# "vector" = Pinecone upserts & queries (sync client, runs in a thread).
+LIMITS = {
+    "vision": settings.VISION_CONCURRENCY,
+    "llm": settings.LLM_CONCURRENCY,
+    "vector": settings.VECTOR_CONCURRENCY,
+}
+
+# Requests per minute for each model (0 = no limit). "embedding" calls run in
+# worker threads, so they only get a rate limit, not an in-flight limit.
+RATE_LIMITS = {
+    "vision": settings.VISION_RPM,
+    "llm": settings.LLM_RPM,
+    "embedding": settings.EMBEDDING_RPM,
+}
+
+_semaphores: dict[str, asyncio.Semaphore] = {}
+
+def limiter(backend: str) -> asyncio.Semaphore:
+    """
+    Shared semaphore for one backend.
+    Use as `async with limiter("vector"): ...` around native async calls.
+    Model calls go through call_model() instead (rate limit + retries).
+    """
+    if backend not in _semaphores:
+        _semaphores[backend] = asyncio.Semaphore(LIMITS[backend])
+    return _semaphores[backend]
+
+async def run_blocking(backend: str, fn, *args, **kwargs):
+    """
+    Runs a synchronous client call (e.g. vectorstore.add_documents) in a worker
+    thread so it never stalls the event loop, bounded by the backend's limit.
+    """
+    async with limiter(backend):
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+# --- PRIORITIES ---
+# Lower goes first. Requests are interactive by default; ingestion workers run
+# under model_priority(BACKGROUND), so a doctor's chat question never queues
+# behind an archive import. The value is a contextvar: tasks and
+# asyncio.to_thread() calls started inside inherit it.
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+_priority: ContextVar[int] = ContextVar("model_priority", default=INTERACTIVE)
+
+@contextmanager
+def model_priority(level: int):
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class ModelUnavailable(RuntimeError):
+    """Raised instead of calling a model whose circuit breaker is open."""
+
+
+class PrioritySemaphore:
+    """asyncio.Semaphore that wakes waiters by priority, then first come first served."""
+
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters: list = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+
+    async def acquire(self, priority: int = INTERACTIVE):
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+        entry = (priority, next(self._seq), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, entry)
+        try:
+            await entry[2]
+        except asyncio.CancelledError:
+            if entry[2].done() and not entry[2].cancelled():
+                self.release()  # woken and cancelled at once: hand the slot on
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)  # the slot passes straight to the waiter
+                return
+        self._value += 1
+
+
+class TokenBucket:
+    """
+    Requests-per-minute limit shared by async code and worker threads.
+    Background callers must leave `reserve` tokens in the bucket, so
+    interactive calls still get through while ingestion saturates the quota.
+    """
+
+    def __init__(self, per_minute: float, burst: float, reserve: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, burst)
+        self.reserve = max(0.0, min(reserve, self.capacity - 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, cost: float = 1.0, priority: int = INTERACTIVE) -> float:
+        """Takes `cost` tokens and returns 0, or returns seconds to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            floor = self.reserve if priority == BACKGROUND else 0.0
+            cost = min(cost, self.capacity - floor)  # a big embedding batch must still fit
+            if self._tokens - cost >= floor:
+                self._tokens -= cost
+                return 0.0
+            return (floor + cost - self._tokens) / self.rate
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `threshold` consecutive retryable failures. While open,
+    calls fail fast for `cooldown` seconds; then one probe call goes out
+    (half-open): success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "open" if time.monotonic() < self._opened_at + self.cooldown else "half_open"
+
+    def enter(self) -> float:
+        """0 if a call may go out now (claiming the probe when half-open), else seconds to wait."""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            now = time.monotonic()
+            if now < self._opened_at + self.cooldown:
+                return self._opened_at + self.cooldown - now
+            if now < self._probe_until:
+                return min(1.0, self._probe_until - now)  # someone else is probing
+            self._probe_until = now + self.cooldown  # lease: a lost probe can't wedge the breaker
+            return 0.0
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_until = 0.0
+
+    def failure(self) -> bool:
+        """Counts one failure; True if that (re)opened the breaker."""
+        with self._lock:
+            self._failures += 1
+            self._probe_until = 0.0
+            if self._opened_at is not None or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+
+# Quota / overload / network errors are worth retrying; bad input is not.
+_RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+_RETRYABLE_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+    "InternalServerError", "ConnectTimeout", "ReadTimeout", "ConnectError", "RemoteProtocolError",
+}
+_RETRYABLE_TEXT = ("quota", "rate limit", "resource has been exhausted", "temporarily unavailable", "overloaded")
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, ModelUnavailable):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int) and code in _RETRYABLE_CODES:
+        return True
+    if type(error).__name__ in _RETRYABLE_NAMES:
+        return True
+    text = str(error).lower()
+    return any(marker in text for marker in _RETRYABLE_TEXT)
+
+
+class Governor:
+    """
+    Client-side guard for one model, shared by every service and worker thread:
+    token bucket (RPM) -> circuit breaker -> in-flight limit -> call, with
+    jittered exponential backoff on retryable errors.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        per_minute = RATE_LIMITS.get(model, 0)
+        burst = per_minute / 60.0 * settings.MODEL_BURST_SECONDS
+        self.bucket = TokenBucket(per_minute, burst, burst * settings.MODEL_INTERACTIVE_RESERVE) if per_minute > 0 else None
+        self.breaker = CircuitBreaker(settings.MODEL_BREAKER_THRESHOLD, settings.MODEL_BREAKER_COOLDOWN)
+        self.slots = PrioritySemaphore(LIMITS[model]) if model in LIMITS else None
+
+    def _breaker_wait(self, priority: int) -> float:
+        wait = self.breaker.enter()
+        if wait and priority == INTERACTIVE:
+            MODEL_REJECTED.inc(model=self.model)
+            raise ModelUnavailable(
+                f"The {self.model} model is failing repeatedly; try again in {wait:.0f}s."
+            )
+        return wait  # background work just waits for the next probe
+
+    def _should_retry(self, error: Exception, attempt: int, priority: int) -> bool:
+        if not is_retryable(error):
+            self.breaker.success()  # the model answered; the request itself was bad
+            return False
+        if self.breaker.failure():
+            MODEL_BREAKER_OPENED.inc(model=self.model)
+            logger.warning(f"🔌 {self.model} circuit open for {self.breaker.cooldown:.0f}s after: {error}")
+            if priority == INTERACTIVE:
+                return False
+        if attempt >= settings.MODEL_MAX_RETRIES:
+            return False
+        MODEL_RETRIES.inc(model=self.model, priority=PRIORITY_NAMES[priority])
+        return True
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": spreads retries out so throttled callers don't retry in lockstep
+        return random.uniform(0, min(settings.MODEL_BACKOFF_MAX, settings.MODEL_BACKOFF_BASE * 2 ** attempt))
+
+    async def _admit(self, priority: int, cost: float):
+        queued = time.perf_counter()
+        while wait := self._breaker_wait(priority):
+            await asyncio.sleep(wait)
+        while self.bucket and (wait := self.bucket.take(cost, priority)):
+            await asyncio.sleep(wait)
+        if self.slots:
+            await self.slots.acquire(priority)
+        MODEL_QUEUE_SECONDS.observe(time.perf_counter() - queued, model=self.model, priority=PRIORITY_NAMES[priority])
+
+    async def _retry_later(self, attempt: int):
+        delay = self._backoff(attempt)
+        logger.warning(f"⏳ {self.model} call failed, retry {attempt}/{settings.MODEL_MAX_RETRIES} in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+    async def call(self, fn: Callable[[], Awaitable[T]], cost: float = 1.0) -> T:
+        """`await fn()` under this model's limits; fn must build a fresh awaitable per attempt."""
+        priority = _priority.get()
+        attempt = 0
+        while True:
+            await self._admit(priority, cost)
+            try:
+                result = await fn()
+            except Exception as e:
+                if not self._should_retry(e, attempt, priority):
+                    raise
+            else:
+                self.breaker.success()
+                return result
+            finally:
+                if self.slots:
+                    self.slots.release()
+            attempt += 1
+            await self._retry_later(attempt)
+
+    async def stream(self, fn: Callable[[], AsyncIterator[T]], cost: float = 1.0) -> AsyncIterator[T]:
+        """
+        Yields from `fn()` (e.g. llm.astream) holding one slot for the whole stream.
+        Errors before the first chunk are retried; after it, they are raised
+        (the caller has already sent part of the answer).
+        """
+        priority = _priority.get()
+        attempt = 0
+        while True:
+            await self._admit(priority, cost)
+            started = False
+            try:
+                async for chunk in fn():
+                    started = True
+                    yield chunk
+            except Exception as e:
+                if started:
+                    if is_retryable(e) and self.breaker.failure():
+                        MODEL_BREAKER_OPENED.inc(model=self.model)
+                    raise
+                if not self._should_retry(e, attempt, priority):
+                    raise
+            else:
+                self.breaker.success()
+                return
+            finally:
+                if self.slots:
+                    self.slots.release()
+            attempt += 1
+            await self._retry_later(attempt)
+
+    def call_sync(self, fn: Callable[[], T], cost: float = 1.0) -> T:
+        """Blocking twin of call() for worker threads (embeddings inside vector store calls)."""
+        priority = _priority.get()
+        attempt = 0
+        while True:
+            queued = time.perf_counter()
+            while wait := self._breaker_wait(priority):
+                time.sleep(wait)
+            while self.bucket and (wait := self.bucket.take(cost, priority)):
+                time.sleep(wait)
+            MODEL_QUEUE_SECONDS.observe(time.perf_counter() - queued, model=self.model, priority=PRIORITY_NAMES[priority])
+            try:
+                result = fn()
+            except Exception as e:
+                if not self._should_retry(e, attempt, priority):
+                    raise
+            else:
+                self.breaker.success()
+                return result
+            attempt += 1
+            delay = self._backoff(attempt)
+            logger.warning(f"⏳ {self.model} call failed, retry {attempt}/{settings.MODEL_MAX_RETRIES} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+_governors: dict[str, Governor] = {}
+_governors_lock = threading.Lock()
+
+def governor(model: str) -> Governor:
+    with _governors_lock:
+        if model not in _governors:
+            _governors[model] = Governor(model)
+        return _governors[model]
+
+async def call_model(model: str, fn: Callable[[], Awaitable[T]], cost: float = 1.0) -> T:
+    """
+    Every remote model call goes through here:
+        response = await call_model("vision", lambda: clients.vision_llm.ainvoke([message]))
+    """
+    return await governor(model).call(fn, cost)
+
+async def stream_model(model: str, fn: Callable[[], AsyncIterator[T]], cost: float = 1.0) -> AsyncIterator[T]:
+    """Streaming twin of call_model(): `async for chunk in stream_model("llm", lambda: llm.astream(prompt))`."""
+    async for chunk in governor(model).stream(fn, cost):
+        yield chunk
+
+def call_model_sync(model: str, fn: Callable[[], T], cost: float = 1.0) -> T:
+    return governor(model).call_sync(fn, cost)
+
+def breaker_states() -> dict:
+    return {name: g.breaker.state for name, g in _governors.items()}
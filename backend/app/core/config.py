@@ -10,4 +10,114 @@ class Settings:
     PINECONE_API_KEY: str | None = os.getenv("PINECONE_API_KEY")
     PINECONE_INDEX_NAME: str | None = os.getenv("PINECONE_INDEX_NAME")
 
-settings = Settings()
\ No newline at end of file
+    # --- LOGGING ---
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text")  # "text" or "json" (one object per line)
+
+    # --- AI CONCURRENCY (max in-flight calls per backend, per worker) ---
+    VISION_CONCURRENCY: int = int(os.getenv("VISION_CONCURRENCY", "4"))
+    LLM_CONCURRENCY: int = int(os.getenv("LLM_CONCURRENCY", "8"))
+    VECTOR_CONCURRENCY: int = int(os.getenv("VECTOR_CONCURRENCY", "8"))
+
+    # --- MODEL GOVERNOR (quota limits, retries, circuit breaker per model) ---
+    VISION_RPM: int = int(os.getenv("VISION_RPM", "500"))            # requests/minute, 0 = no limit
+    LLM_RPM: int = int(os.getenv("LLM_RPM", "500"))
+    EMBEDDING_RPM: int = int(os.getenv("EMBEDDING_RPM", "1500"))
+    MODEL_BURST_SECONDS: float = float(os.getenv("MODEL_BURST_SECONDS", "5"))  # bucket holds this much quota
+    MODEL_INTERACTIVE_RESERVE: float = float(os.getenv("MODEL_INTERACTIVE_RESERVE", "0.25"))  # share background can't use
+    MODEL_MAX_RETRIES: int = int(os.getenv("MODEL_MAX_RETRIES", "3"))
+    MODEL_BACKOFF_BASE: float = float(os.getenv("MODEL_BACKOFF_BASE", "0.5"))  # seconds, doubles per retry (jittered)
+    MODEL_BACKOFF_MAX: float = float(os.getenv("MODEL_BACKOFF_MAX", "20"))
+    MODEL_BREAKER_THRESHOLD: int = int(os.getenv("MODEL_BREAKER_THRESHOLD", "5"))  # consecutive failures
+    MODEL_BREAKER_COOLDOWN: float = float(os.getenv("MODEL_BREAKER_COOLDOWN", "30"))
+
+    # --- STARTUP (warm up imports + worker processes before the first request) ---
+    WARMUP_ON_STARTUP: bool = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+
+    # --- LIST ENDPOINTS (cursor pagination) ---
+    DEFAULT_PAGE_SIZE: int = int(os.getenv("DEFAULT_PAGE_SIZE", "50"))
+    MAX_PAGE_SIZE: int = int(os.getenv("MAX_PAGE_SIZE", "200"))
+
+    # --- UPLOADS ---
+    UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "uploads")
+    MAX_UPLOAD_MB: int = int(os.getenv("MAX_UPLOAD_MB", "20"))
+    UPLOAD_CHUNK_SIZE: int = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+    # --- IMAGE PREPROCESSING (before vision calls) ---
+    IMAGE_WORKERS: int = int(os.getenv("IMAGE_WORKERS", "2"))
+    PRESCRIPTION_MAX_DIM: int = int(os.getenv("PRESCRIPTION_MAX_DIM", "2048"))
+    XRAY_MAX_DIM: int = int(os.getenv("XRAY_MAX_DIM", "1536"))
+    IMAGE_JPEG_QUALITY: int = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+    # --- OCR (Tesseract fast path, vision LLM fallback) ---
+    OCR_ENGINE: str = os.getenv("OCR_ENGINE", "auto")  # "auto", "local" or "llm"
+    OCR_MIN_WORDS: int = int(os.getenv("OCR_MIN_WORDS", "15"))
+    OCR_MIN_CONFIDENCE: float = float(os.getenv("OCR_MIN_CONFIDENCE", "80"))
+    OCR_LOW_WORD_CONFIDENCE: float = float(os.getenv("OCR_LOW_WORD_CONFIDENCE", "60"))
+    OCR_MAX_LOW_CONFIDENCE_RATIO: float = float(os.getenv("OCR_MAX_LOW_CONFIDENCE_RATIO", "0.15"))
+    # "two_call": OCR text, then a summary call. "single": one schema-constrained
+    # vision call returns both (falls back to two_call if it fails)
+    PRESCRIPTION_EXTRACTION_MODE: str = os.getenv("PRESCRIPTION_EXTRACTION_MODE", "two_call")
+
+    # --- BATCH UPLOAD ---
+    BATCH_MAX_FILES: int = int(os.getenv("BATCH_MAX_FILES", "20"))
+    BATCH_CONCURRENCY: int = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+    # --- BACKGROUND INGESTION ---
+    INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", "4"))
+    INGEST_MAX_ATTEMPTS: int = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+    INGEST_RETRY_BACKOFF: float = float(os.getenv("INGEST_RETRY_BACKOFF", "2.0"))  # seconds, doubles per attempt
+    INGEST_LEASE_SECONDS: float = float(os.getenv("INGEST_LEASE_SECONDS", "120"))  # running job w/o heartbeat -> reclaimed
+
+    # --- RAG ---
+    RAG_K: int = int(os.getenv("RAG_K", "5"))                  # chunks per answer
+    RAG_SUMMARY_K: int = int(os.getenv("RAG_SUMMARY_K", "2"))  # chunks when the patient summary is in the prompt
+    RAG_FETCH_K: int = int(os.getenv("RAG_FETCH_K", "12"))     # candidates fetched before dedup / ranking
+    RAG_CONTEXT_TOKENS: int = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))  # summary + chunks per prompt
+    RAG_MIN_CHUNK_TOKENS: int = int(os.getenv("RAG_MIN_CHUNK_TOKENS", "100"))  # don't add a cut chunk shorter than this
+    RAG_DEDUP_SIMILARITY: float = float(os.getenv("RAG_DEDUP_SIMILARITY", "0.9"))  # word-set Jaccard = duplicate
+    RAG_RECENCY_WEIGHT: float = float(os.getenv("RAG_RECENCY_WEIGHT", "0.1"))  # added to similarity for a fresh upload
+    RAG_RECENCY_HALF_LIFE_DAYS: float = float(os.getenv("RAG_RECENCY_HALF_LIFE_DAYS", "180"))
+    RAG_RRF_K: int = int(os.getenv("RAG_RRF_K", "60"))         # reciprocal rank fusion constant
+
+    # --- KEYWORD INDEX (local BM25 per patient, fused with vector search) ---
+    KEYWORD_SEARCH_ENABLED: bool = os.getenv("KEYWORD_SEARCH_ENABLED", "true").lower() == "true"
+    KEYWORD_FASTPATH: bool = os.getenv("KEYWORD_FASTPATH", "true").lower() == "true"  # skip vectors on confident hits
+    KEYWORD_INDEX_PATH: str = os.getenv("KEYWORD_INDEX_PATH", "cache/keyword_index.sqlite3")
+
+    # --- ROLLING SUMMARIES (per visit + per patient, updated after each ingest) ---
+    SUMMARY_ENABLED: bool = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+    SUMMARY_MAX_WORDS: int = int(os.getenv("SUMMARY_MAX_WORDS", "250"))       # patient summary
+    VISIT_SUMMARY_MAX_WORDS: int = int(os.getenv("VISIT_SUMMARY_MAX_WORDS", "120"))
+    SUMMARY_FILES_PER_CALL: int = int(os.getenv("SUMMARY_FILES_PER_CALL", "10"))
+
+    # --- CHUNKING + BULK INGESTION (scripts/bulk_ingest.py) ---
+    CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "1000"))          # characters per vector
+    CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "150"))
+    BULK_READ_WORKERS: int = int(os.getenv("BULK_READ_WORKERS", "4"))
+    BULK_OCR_WORKERS: int = int(os.getenv("BULK_OCR_WORKERS", "4"))
+    BULK_EMBED_WORKERS: int = int(os.getenv("BULK_EMBED_WORKERS", "2"))
+    BULK_EMBED_BATCH: int = int(os.getenv("BULK_EMBED_BATCH", "64"))
+    BULK_UPSERT_BATCH: int = int(os.getenv("BULK_UPSERT_BATCH", "100"))
+    BULK_CHECKPOINT_PATH: str = os.getenv("BULK_CHECKPOINT_PATH", "cache/bulk_ingest.sqlite3")
+
+    # --- UPLOAD DEDUP CACHE ---
+    ANALYSIS_CACHE_MAX_ENTRIES: int = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "50000"))
+    ANALYSIS_CACHE_TTL_DAYS: int = int(os.getenv("ANALYSIS_CACHE_TTL_DAYS", "90"))
+
+    # --- EMBEDDING CACHE ---
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "models/text-embedding-004")
+    EMBEDDING_CACHE_PATH: str = os.getenv("EMBEDDING_CACHE_PATH", "cache/embeddings.sqlite3")
+    EMBEDDING_CACHE_LRU_SIZE: int = int(os.getenv("EMBEDDING_CACHE_LRU_SIZE", "10000"))
+
+    # --- ANSWER CACHE (repeated chat questions per patient) ---
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_MAX_ENTRIES: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+    ANSWER_CACHE_TTL_SECONDS: int = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+    ANSWER_CACHE_SIMILARITY: float = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))  # cosine, query embeddings
+
+    # --- VECTOR STORE ---
+    VECTOR_BACKEND: str = os.getenv("VECTOR_BACKEND", "pinecone")  # "pinecone" or "local"
+    LOCAL_VECTOR_PATH: str = os.getenv("LOCAL_VECTOR_PATH", "cache/vectors")
+
+settings = Settings()
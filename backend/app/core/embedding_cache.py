@@ -0,0 +1,146 @@
+import os
+import math
+import sqlite3
+import hashlib
+import time
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.concurrency import call_model_sync
+from app.core.metrics import CACHE_REQUESTS, record_model_call
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Drop-in wrapper around any LangChain Embeddings (e.g. text-embedding-004).
+
+    Lookup order: in-process LRU -> on-disk SQLite -> the real model.
+    Keys are sha256(model + kind + text); "query" and "document" embeddings are
+    cached separately because Gemini embeds them with different task types.
+    All misses of one call are sent to the model as a single batch request.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, path: str, lru_size: int = 10000):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.lru_size = lru_size
+        self._lru: OrderedDict[str, List[float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Hit / miss counters (since process start)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._db.commit()
+
+    # --- KEYS & STORAGE ---
+
+    def _key(self, kind: str, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: List[float]):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def _lookup(self, keys: List[str]) -> dict:
+        """Returns {key: vector} for every key found in memory or on disk."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    found[key] = self._lru[key]
+            self.memory_hits += len(found)
+            CACHE_REQUESTS.inc(len(found), cache="embedding", result="memory_hit")
+
+            missing = [k for k in keys if k not in found]
+            # SQLite caps bound variables per statement, so query in slices
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+                    self._remember(key, found[key])
+                self.disk_hits += len(rows)
+                CACHE_REQUESTS.inc(len(rows), cache="embedding", result="disk_hit")
+        return found
+
+    def _store(self, items: dict):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in items.items()],
+            )
+            self._db.commit()
+            for key, vector in items.items():
+                self._remember(key, vector)
+
+    def _embed(self, kind: str, texts: List[str], embed_fn) -> List[List[float]]:
+        keys = [self._key(kind, t) for t in texts]
+        found = self._lookup(keys)
+
+        # Batch all (unique) misses into ONE model request
+        todo = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                todo.setdefault(key, text)
+        if todo:
+            self.misses += len(todo)
+            CACHE_REQUESTS.inc(len(todo), cache="embedding", result="miss")
+            batch = list(todo.values())
+
+            def remote():
+                start = time.perf_counter()
+                try:
+                    vectors = embed_fn(batch)
+                except Exception:
+                    record_model_call("embedding", time.perf_counter() - start, ok=False)
+                    raise
+                record_model_call("embedding", time.perf_counter() - start,
+                                  input_chars=sum(len(t) for t in batch))
+                return vectors
+
+            # Rate-limited + retried; the Gemini SDK sends 5 texts per request
+            vectors = call_model_sync("embedding", remote, cost=math.ceil(len(batch) / 5))
+            fresh = dict(zip(todo.keys(), vectors))
+            self._store(fresh)
+            found.update(fresh)
+
+        return [found[k] for k in keys]
+
+    # --- LANGCHAIN INTERFACE ---
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed("document", texts, self.underlying.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed("query", [text], lambda batch: [self.underlying.embed_query(batch[0])])[0]
+
+    def stats(self) -> dict:
+        total = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "model": self.model_name,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / total, 3) if total else 0.0,
+            "lru_entries": len(self._lru),
+        }
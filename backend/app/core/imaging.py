@@ -0,0 +1,133 @@
+import io
+import asyncio
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+from app.core.log import get_logger
+from app.core.config import settings
+
+logger = get_logger("imaging")
+
+# Per-document-type settings: how big the image sent to Gemini may be,
+# whether colour matters, and the JPEG quality it's re-encoded at.
+PROFILES = {
+    "xray": {"max_dim": settings.XRAY_MAX_DIM, "grayscale": True, "quality": settings.IMAGE_JPEG_QUALITY},
+    "prescription": {"max_dim": settings.PRESCRIPTION_MAX_DIM, "grayscale": False, "quality": settings.IMAGE_JPEG_QUALITY},
+}
+
+FORMAT_TO_MIME = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+}
+
+
+@dataclass
+class PreparedImage:
+    data: bytes         # Bytes to send to the model
+    mime_type: str      # Real type of `data` (used in the data: URL)
+    original_size: int
+    width: int
+    height: int
+    changed: bool       # False if the original was already small enough
+
+
+# High bit depth modes (16-bit PNG / DICOM exports of X-rays, 32-bit int / float)
+HIGH_DEPTH_MODES = ("I;16", "I;16B", "I;16L", "I;16N", "I", "F")
+
+
+def _to_8bit(img: Image.Image) -> Image.Image:
+    """
+    Maps a 16/32-bit image onto 0-255 over its real value range.
+    convert("L") alone clips every value above 255 to white, which wipes out
+    a 12-bit X-ray (0-4095).
+    """
+    wide = img.convert("F")
+    lo, hi = wide.getextrema()
+    if lo >= 0 and hi <= 255:
+        return wide.convert("L")  # 8-bit data stored in a wide mode
+    scale = 255.0 / (hi - lo) if hi > lo else 0.0
+    return wide.point(lambda v: (v - lo) * scale).convert("L")
+
+
+def _prepare(data: bytes, file_type: str) -> PreparedImage:
+    """
+    CPU-bound part (runs in a worker process):
+    EXIF rotate -> downscale -> grayscale (X-rays) -> JPEG re-encode.
+    """
+    profile = PROFILES.get(file_type, PROFILES["prescription"])
+    img = Image.open(io.BytesIO(data))
+    original_mime = FORMAT_TO_MIME.get(img.format or "", "image/jpeg")
+
+    needs_rotate = img.getexif().get(0x0112, 1) != 1  # EXIF Orientation tag
+    rotated = ImageOps.exif_transpose(img) if needs_rotate else img
+    needs_resize = max(rotated.size) > profile["max_dim"]
+    needs_gray = profile["grayscale"] and rotated.mode != "L"
+    needs_convert = rotated.mode not in ("RGB", "L")
+
+    # Already small, upright and in a model-friendly mode: send as-is
+    if not needs_rotate and not needs_resize and not needs_gray and not needs_convert \
+            and original_mime == "image/jpeg":
+        return PreparedImage(data, original_mime, len(data), img.width, img.height, changed=False)
+
+    if rotated.mode in HIGH_DEPTH_MODES:
+        rotated = _to_8bit(rotated)
+    if needs_resize:
+        rotated.thumbnail((profile["max_dim"], profile["max_dim"]), Image.Resampling.LANCZOS)
+    if profile["grayscale"]:
+        rotated = rotated.convert("L")
+    elif rotated.mode != "RGB":
+        # Flatten transparency (PNG screenshots) onto white paper
+        if rotated.mode in ("RGBA", "LA", "P"):
+            rotated = rotated.convert("RGBA")
+            background = Image.new("RGB", rotated.size, (255, 255, 255))
+            background.paste(rotated, mask=rotated.split()[-1])
+            rotated = background
+        else:
+            rotated = rotated.convert("RGB")
+
+    out = io.BytesIO()
+    rotated.save(out, format="JPEG", quality=profile["quality"], optimize=True)
+    encoded = out.getvalue()
+
+    # Re-encoding a tiny, already-compressed image can make it bigger
+    if len(encoded) >= len(data) and not needs_resize and not needs_rotate:
+        return PreparedImage(data, original_mime, len(data), img.width, img.height, changed=False)
+
+    return PreparedImage(encoded, "image/jpeg", len(data), rotated.width, rotated.height, changed=True)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.IMAGE_WORKERS)
+    return _pool
+
+async def run_in_image_pool(fn, *args):
+    """Runs a picklable CPU-bound function (resize, OCR, ...) in the process pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), fn, *args)
+
+def shutdown_image_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def preprocess_image(data: bytes, file_type: str, mime_type: Optional[str] = None) -> PreparedImage:
+    """
+    Shrinks an upload before it's sent to a vision model.
+    Runs in a process pool so resizing never blocks the event loop.
+    If the image can't be decoded, the original bytes are passed through.
+    """
+    try:
+        return await run_in_image_pool(_prepare, bytes(data), file_type)
+    except Exception as e:
+        logger.warning(f"⚠️ Image preprocessing skipped: {e}")
+        return PreparedImage(bytes(data), mime_type or "image/jpeg", len(data), 0, 0, changed=False)
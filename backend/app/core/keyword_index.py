@@ -0,0 +1,156 @@
+import os
+import re
+import json
+import math
+import sqlite3
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, List, Tuple
+
+if TYPE_CHECKING:  # langchain_core is imported on first use (keeps app import fast)
+    from langchain_core.documents import Document
+
+# BM25 parameters (the usual defaults)
+K1 = 1.2
+B = 0.75
+
+_WORDS = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+# Question filler that never identifies a record ("was she ever on azithromycin?")
+STOPWORDS = frozenset("""
+a an and any are as at be been did do does for from had has have he her him his how i if in is it its
+me my no not of on or she so that the their them they this to was we were what when which who why
+with you your ever ago last current currently patient patients given taking take took prescribed
+history tell show list about please
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words and numbers ("650mg" -> "650mg", "2.5" -> "2.5"), no stopwords."""
+    return [t for t in _WORDS.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+@dataclass
+class KeywordResult:
+    hits: List[Tuple["Document", float]] = field(default_factory=list)  # BM25 score, best first
+    terms: List[str] = field(default_factory=list)    # content terms of the query
+    missing: List[str] = field(default_factory=list)  # terms no record of this patient contains
+    coverage: float = 0.0                             # share of terms the top hit contains
+
+    @property
+    def confident(self) -> bool:
+        """
+        Short exact-term question whose every term is in the top record
+        ("azithromycin", "metformin 500"): keyword hits alone can answer it.
+        """
+        return bool(self.hits) and not self.missing and self.coverage == 1.0
+
+
+class KeywordIndex:
+    """
+    BM25 inverted index over each patient's ingested text, stored in SQLite.
+    Chunks are keyed "<file_id>-<chunk>" (same as bulk ingestion vector ids),
+    so re-adding a chunk replaces it. Statistics (document count, average
+    length, document frequency) are per patient: a term that is rare in
+    this patient's chart scores high even if every other chart has it.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id TEXT PRIMARY KEY, patient_id TEXT NOT NULL,
+                text TEXT NOT NULL, metadata TEXT NOT NULL, length INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS docs_patient ON docs (patient_id);
+            CREATE TABLE IF NOT EXISTS postings (
+                patient_id TEXT NOT NULL, term TEXT NOT NULL, doc_id TEXT NOT NULL, tf INTEGER NOT NULL,
+                PRIMARY KEY (patient_id, term, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+        """)
+        self._db.commit()
+
+    # --- WRITE ---
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[dict]):
+        """Indexes (or re-indexes) chunks; ones without a patient_id are skipped."""
+        with self._lock:
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                patient_id = metadata.get("patient_id")
+                if not patient_id:
+                    continue
+                terms = Counter(tokenize(text))
+                self._db.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+                self._db.execute(
+                    "INSERT OR REPLACE INTO docs (id, patient_id, text, metadata, length) VALUES (?, ?, ?, ?, ?)",
+                    (doc_id, patient_id, text, json.dumps(metadata, default=str), sum(terms.values())),
+                )
+                self._db.executemany(
+                    "INSERT INTO postings (patient_id, term, doc_id, tf) VALUES (?, ?, ?, ?)",
+                    [(patient_id, term, doc_id, tf) for term, tf in terms.items()],
+                )
+            self._db.commit()
+
+    def add_documents(self, documents: List["Document"]):
+        self.add(
+            [f"{d.metadata.get('file_id')}-{d.metadata.get('chunk', 0)}" for d in documents],  # = ingest_service.chunk_id
+            [d.page_content for d in documents],
+            [d.metadata for d in documents],
+        )
+
+    # --- READ ---
+
+    def search(self, patient_id: str, query: str, k: int = 10) -> KeywordResult:
+        from langchain_core.documents import Document
+
+        terms = list(dict.fromkeys(tokenize(query)))
+        result = KeywordResult(terms=terms)
+        if not terms:
+            return result
+
+        with self._lock:
+            n_docs, avg_length = self._db.execute(
+                "SELECT COUNT(*), AVG(length) FROM docs WHERE patient_id = ?", (patient_id,)
+            ).fetchone()
+            if not n_docs:
+                result.missing = terms
+                return result
+            marks = ",".join("?" * len(terms))
+            postings = self._db.execute(
+                f"SELECT term, doc_id, tf FROM postings WHERE patient_id = ? AND term IN ({marks})",
+                (patient_id, *terms),
+            ).fetchall()
+
+            df = Counter(term for term, _, _ in postings)
+            result.missing = [t for t in terms if not df[t]]
+            if not postings:
+                return result
+
+            doc_ids = list({doc_id for _, doc_id, _ in postings})
+            rows = self._db.execute(
+                f"SELECT id, text, metadata, length FROM docs WHERE id IN ({','.join('?' * len(doc_ids))})",
+                doc_ids,
+            ).fetchall()
+
+        docs = {doc_id: (text, metadata, length) for doc_id, text, metadata, length in rows}
+        scores: Counter = Counter()
+        matched: dict = {}
+        avg_length = avg_length or 1.0
+        for term, doc_id, tf in postings:
+            idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+            length = docs[doc_id][2]
+            scores[doc_id] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+            matched.setdefault(doc_id, set()).add(term)
+
+        best = scores.most_common(k)
+        result.coverage = len(matched[best[0][0]]) / len(terms)
+        result.hits = [
+            (Document(page_content=docs[doc_id][0], metadata=json.loads(docs[doc_id][1])), score)
+            for doc_id, score in best
+        ]
+        return result
@@ -0,0 +1,221 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from app.core.log import get_logger
+
+logger = get_logger("span")
+
+# Latency buckets (seconds): covers a cache hit (ms) up to a slow vision call (30 s+)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    """Monotonic counter with labels (Prometheus text format)."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(n, "") for n in self.labelnames), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Latency histogram with labels (cumulative buckets, _sum, _count)."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, list] = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                names = self.labelnames + ("le",)
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_labels(names, key + (f'{bound:g}',))} {count}")
+                lines.append(f"{self.name}_bucket{_labels(names, key + ('+Inf',))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for m in self.metrics for line in m.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "eparchi_stage_duration_seconds", "Time spent in one pipeline stage", ["stage"]))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "eparchi_stage_errors_total", "Pipeline stages that raised", ["stage"]))
+MODEL_CALLS = REGISTRY.register(Counter(
+    "eparchi_model_calls_total", "Calls to remote models", ["model", "status"]))
+MODEL_SECONDS = REGISTRY.register(Histogram(
+    "eparchi_model_call_duration_seconds", "Latency of remote model calls", ["model"]))
+MODEL_TOKENS = REGISTRY.register(Counter(
+    "eparchi_model_tokens_total", "Model tokens (usage metadata, or ~4 chars/token estimate)", ["model", "direction"]))
+MODEL_RETRIES = REGISTRY.register(Counter(
+    "eparchi_model_retries_total", "Model calls retried after a quota / transient error", ["model", "priority"]))
+MODEL_REJECTED = REGISTRY.register(Counter(
+    "eparchi_model_rejected_total", "Calls failed fast by an open circuit breaker", ["model"]))
+MODEL_BREAKER_OPENED = REGISTRY.register(Counter(
+    "eparchi_model_breaker_opened_total", "Times a model's circuit breaker opened", ["model"]))
+MODEL_QUEUE_SECONDS = REGISTRY.register(Histogram(
+    "eparchi_model_queue_seconds", "Time a call waited for rate limit / breaker / in-flight slot", ["model", "priority"]))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "eparchi_cache_requests_total", "Cache lookups by result", ["cache", "result"]))
+CONTEXT_TOKENS = REGISTRY.register(Histogram(
+    "eparchi_rag_context_tokens", "Summary + retrieved chunk tokens per chat prompt", (),
+    buckets=(100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000)))
+RAG_RETRIEVAL = REGISTRY.register(Counter(
+    "eparchi_rag_retrieval_total", "Chat retrievals by path (keyword fast path, hybrid, vector only)", ["mode"]))
+CHAT_TTFT_SECONDS = REGISTRY.register(Histogram(
+    "eparchi_chat_time_to_first_token_seconds", "Streaming chat: request start to first answer token"))
+HTTP_SECONDS = REGISTRY.register(Histogram(
+    "eparchi_http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"]))
+
+
+@contextmanager
+def span(stage: str, **fields):
+    """
+    Times one stage: `with span("ocr", file=filename): ...`
+    Records the latency histogram, counts errors, and logs one structured line.
+    Works the same in async code and in worker threads.
+    """
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.observe(duration, stage=stage)
+        logger.info("span", extra={"stage": stage, "duration_ms": round(duration * 1000, 1),
+                                   "status": status, **fields})
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4) if text else 0
+
+
+def model_metrics_callback(model: str):
+    """
+    LangChain callback that counts calls, latency, tokens and errors for one
+    model role ("vision", "summary", "chat"). Attached to the LLMs in AIClients,
+    so chains (RetrievalQA) are measured too.
+    """
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class ModelMetrics(BaseCallbackHandler):
+        def __init__(self):
+            self._started: Dict[UUID, Tuple[float, int]] = {}
+
+        def _start(self, run_id: UUID, prompt_chars: int):
+            self._started[run_id] = (time.perf_counter(), prompt_chars)
+
+        def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any):
+            self._start(run_id, sum(len(p) for p in prompts))
+
+        def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any):
+            chars = 0
+            for batch in messages:
+                for message in batch:
+                    content = message.content
+                    if isinstance(content, list):  # multimodal: count the text parts only
+                        content = " ".join(p.get("text", "") for p in content if isinstance(p, dict))
+                    chars += len(content)
+            self._start(run_id, chars)
+
+        def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any):
+            started, prompt_chars = self._started.pop(run_id, (time.perf_counter(), 0))
+            MODEL_SECONDS.observe(time.perf_counter() - started, model=model)
+            MODEL_CALLS.inc(model=model, status="ok")
+
+            usage = _usage(response)
+            if usage:
+                MODEL_TOKENS.inc(usage.get("input_tokens", 0), model=model, direction="input")
+                MODEL_TOKENS.inc(usage.get("output_tokens", 0), model=model, direction="output")
+            else:
+                output = "".join(g.text for gens in response.generations for g in gens)
+                MODEL_TOKENS.inc(prompt_chars // 4, model=model, direction="input")
+                MODEL_TOKENS.inc(estimate_tokens(output), model=model, direction="output")
+
+        def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+            started, _ = self._started.pop(run_id, (time.perf_counter(), 0))
+            MODEL_SECONDS.observe(time.perf_counter() - started, model=model)
+            MODEL_CALLS.inc(model=model, status="error")
+
+    return ModelMetrics()
+
+
+def _usage(response: Any) -> Optional[dict]:
+    """Token usage if the SDK reports it (newer langchain-google-genai does)."""
+    for gens in getattr(response, "generations", []):
+        for g in gens:
+            usage = getattr(getattr(g, "message", None), "usage_metadata", None)
+            if usage:
+                return dict(usage)
+    return None
+
+
+def record_model_call(model: str, duration: float, ok: bool = True, input_chars: int = 0):
+    """For model calls made outside LangChain LLMs (embeddings)."""
+    MODEL_CALLS.inc(model=model, status="ok" if ok else "error")
+    MODEL_SECONDS.observe(duration, model=model)
+    if input_chars:
+        MODEL_TOKENS.inc(input_chars // 4, model=model, direction="input")
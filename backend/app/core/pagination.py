@@ -0,0 +1,51 @@
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from beanie import PydanticObjectId
+from fastapi import HTTPException
+
+# Keyset ("seek") pagination: the cursor is the (sort value, _id) of the last
+# item on the previous page, so every page is one indexed range query no matter
+# how deep the client scrolls (no skip/offset).
+
+
+def encode_cursor(value: datetime, doc_id) -> str:
+    raw = f"{value.isoformat()}|{doc_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, PydanticObjectId]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        value, doc_id = raw.split("|", 1)
+        return datetime.fromisoformat(value), PydanticObjectId(doc_id)
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+
+
+def keyset_filter(field: str, cursor: Optional[str]) -> dict:
+    """
+    Mongo filter for "items after the cursor" when sorting by (field desc, _id desc).
+    """
+    if not cursor:
+        return {}
+    value, doc_id = decode_cursor(cursor)
+    return {
+        "$or": [
+            {field: {"$lt": value}},
+            {field: value, "_id": {"$lt": doc_id}},
+        ]
+    }
+
+
+def next_cursor(items: list, limit: int, field: str) -> Optional[str]:
+    """
+    Callers fetch limit + 1 rows; if the extra row exists there is another page.
+    Trims `items` in place to `limit`.
+    """
+    if len(items) <= limit:
+        return None
+    del items[limit:]
+    last = items[-1]
+    return encode_cursor(getattr(last, field), last.id)
@@ -0,0 +1,119 @@
+import os
+import uuid
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import UploadFile, HTTPException
+
+from app.core.config import settings
+
+# Image formats the AI pipeline can read, detected from the file's magic bytes
+# (the client's Content-Type / extension are not trusted).
+ALLOWED_TYPES = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+}
+
+
+def sniff_mime(head: bytes) -> Optional[str]:
+    """Detects the real image type from the first bytes of a file."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+# Multipart framing (boundaries, part headers, form fields) on top of the file bytes
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def max_request_bytes(path: str) -> Optional[int]:
+    """
+    Largest body an upload route accepts, checked against Content-Length
+    before the body is read (None: not an upload route).
+    """
+    if path.endswith("/upload"):
+        return settings.MAX_UPLOAD_MB * 1024 * 1024 + MULTIPART_OVERHEAD
+    if path.endswith("/upload/batch"):
+        return settings.BATCH_MAX_FILES * (settings.MAX_UPLOAD_MB * 1024 * 1024 + MULTIPART_OVERHEAD)
+    return None
+
+
+@dataclass
+class StoredUpload:
+    path: str           # Where the file was saved (under UPLOAD_DIR)
+    filename: str       # Original client filename
+    mime_type: str      # Detected from magic bytes
+    size: int           # Bytes written
+    sha256: str         # Content hash (dedup cache key)
+
+
+async def save_upload(file: UploadFile, prefix: str) -> StoredUpload:
+    """
+    Streams an upload to disk in chunks, in a single pass:
+    - rejects non-image types on the first chunk (415)
+    - stops as soon as MAX_UPLOAD_MB is exceeded (413)
+      Starlette has already spooled the multipart body by then; the
+      reject_oversized_uploads middleware turns away a declared
+      Content-Length that is too big before any of it is read. Chunked
+      bodies (no Content-Length) are only caught here.
+    - computes SHA-256 and size on the fly
+    File writes run in a thread so the event loop never blocks on disk.
+    Nothing is kept in memory: callers read the file back when they need it.
+    """
+    max_bytes = settings.MAX_UPLOAD_MB * 1024 * 1024
+    chunk_size = settings.UPLOAD_CHUNK_SIZE
+
+    # Cheap early reject on the declared type (octet-stream is sniffed below)
+    declared = (file.content_type or "").split(";")[0].strip()
+    if declared and declared not in ALLOWED_TYPES and declared != "application/octet-stream":
+        raise HTTPException(415, f"Unsupported file type: {declared}")
+
+    first = await file.read(chunk_size)
+    mime_type = sniff_mime(first)
+    if not mime_type:
+        raise HTTPException(415, "Unsupported file type. Upload a JPEG, PNG or WEBP image.")
+
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(settings.UPLOAD_DIR, f"{prefix}_{uuid.uuid4()}.{ALLOWED_TYPES[mime_type]}")
+
+    sha256 = hashlib.sha256()
+    size = 0
+    out = await asyncio.to_thread(open, path, "wb")
+    try:
+        chunk = first
+        while chunk:
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(413, f"File too large (max {settings.MAX_UPLOAD_MB} MB)")
+            sha256.update(chunk)
+            await asyncio.to_thread(out.write, chunk)
+            chunk = await file.read(chunk_size)
+    except BaseException:
+        await asyncio.to_thread(out.close)
+        os.remove(path)
+        raise
+    await asyncio.to_thread(out.close)
+
+    return StoredUpload(
+        path=path,
+        filename=file.filename or os.path.basename(path),
+        mime_type=mime_type,
+        size=size,
+        sha256=sha256.hexdigest(),
+    )
+
+
+async def discard_uploads(stored: list[StoredUpload]):
+    """Deletes saved uploads nothing will reference (e.g. the rest of a rejected batch)."""
+    for upload in stored:
+        try:
+            await asyncio.to_thread(os.remove, upload.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,389 @@
+import os
+import json
+import uuid
+import threading
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+
+# Metadata key used to split the index into partitions (one per patient)
+PARTITION_KEY = "patient_id"
+SHARED_PARTITION = "_shared"
+
+# Rewrite a partition once this fraction of its rows are deleted
+COMPACT_RATIO = 0.3
+
+
+def _matches(metadata: dict, filters: Optional[dict]) -> bool:
+    """
+    Pinecone-style metadata filter: {"key": value}, {"key": {"$eq": v}},
+    {"key": {"$ne": v}} or {"key": {"$in": [...]}}.
+    """
+    if not filters:
+        return True
+    for key, cond in filters.items():
+        value = metadata.get(key)
+        if isinstance(cond, dict):
+            if "$eq" in cond and value != cond["$eq"]:
+                return False
+            if "$ne" in cond and value == cond["$ne"]:
+                return False
+            if "$in" in cond and value not in cond["$in"]:
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+class _Partition:
+    """
+    All vectors of one patient.
+
+    vectors.f32 : contiguous float32 rows (L2-normalized), append-only, memory-mapped
+    meta.jsonl  : one line per row {"id", "text", "metadata"}, plus {"deleted": id} tombstones
+    """
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self.vec_path = os.path.join(path, "vectors.f32")
+        self.meta_path = os.path.join(path, "meta.jsonl")
+
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[dict] = []
+        self.row_of: dict[str, int] = {}
+        self.alive = np.zeros(0, dtype=bool)
+        self.matrix: Optional[np.ndarray] = None
+        self._load()
+
+    # --- DISK ---
+
+    def _load(self):
+        os.makedirs(self.path, exist_ok=True)
+        self._recover_compaction()
+
+        # Replayed in order: a tombstone kills the row its id had at that point,
+        # so an upsert (tombstone + same id appended again) keeps the new row.
+        alive, torn = [], False
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except json.JSONDecodeError:
+                        torn = True  # half-written last line (crash mid-append)
+                        break
+                    if "deleted" in row:
+                        if row["deleted"] in self.row_of:
+                            alive[self.row_of[row["deleted"]]] = False
+                        continue
+                    self.row_of[row["id"]] = len(self.ids)
+                    self.ids.append(row["id"])
+                    self.texts.append(row["text"])
+                    self.metadatas.append(row["metadata"])
+                    alive.append(True)
+
+        # append() writes vectors.f32 before meta.jsonl: after a crash in between,
+        # the vector file has rows (or part of one) meta.jsonl doesn't. Cut both
+        # back to the rows they share, or every later append misaligns ids and vectors.
+        row_bytes = 4 * self.dim
+        vec_size = os.path.getsize(self.vec_path) if os.path.exists(self.vec_path) else 0
+        rows = min(vec_size // row_bytes, len(self.ids))
+        if vec_size != rows * row_bytes:
+            with open(self.vec_path, "r+b") as f:
+                f.truncate(rows * row_bytes)
+        if torn or rows < len(self.ids):
+            del self.ids[rows:], self.texts[rows:], self.metadatas[rows:], alive[rows:]
+            self.row_of = {id_: i for i, id_ in enumerate(self.ids)}  # latest row per id
+            self._rewrite_meta(alive)
+
+        self.alive = np.array(alive, dtype=bool)
+        self._map()
+
+    def _recover_compaction(self):
+        """
+        Finishes / undoes a compact() that died half-way. compact() renames
+        vectors then meta to *.old, writes the new files, then deletes vectors.old
+        then meta.old. So: both *.old -> the originals are complete, restore them;
+        only vectors.old -> died between the renames, restore it; only meta.old ->
+        the new files are complete, drop it.
+        """
+        vec_old, meta_old = self.vec_path + ".old", self.meta_path + ".old"
+        if os.path.exists(vec_old):
+            os.replace(vec_old, self.vec_path)
+            if os.path.exists(meta_old):
+                os.replace(meta_old, self.meta_path)
+        elif os.path.exists(meta_old):
+            os.remove(meta_old)
+
+    def _rewrite_meta(self, alive: List[bool]):
+        """Rewrites meta.jsonl for the rows in memory (each dead row followed by its tombstone)."""
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for id_, text, meta, is_alive in zip(self.ids, self.texts, self.metadatas, alive):
+                f.write(json.dumps({"id": id_, "text": text, "metadata": meta}) + "\n")
+                if not is_alive:
+                    f.write(json.dumps({"deleted": id_}) + "\n")
+        os.replace(tmp_path, self.meta_path)
+
+    def _map(self):
+        rows = len(self.ids)
+        if rows == 0:
+            self.matrix = np.zeros((0, self.dim), dtype=np.float32)
+            return
+        self.matrix = np.memmap(self.vec_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    # --- WRITE ---
+
+    def append(self, ids: List[str], texts: List[str], metadatas: List[dict], vectors: np.ndarray):
+        # Upsert semantics (like Pinecone): an id written again replaces the old row
+        existing = [i for i in ids if i in self.row_of and self.alive[self.row_of[i]]]
+        if existing:
+            self.delete(existing)
+        with open(self.vec_path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(self.meta_path, "a", encoding="utf-8") as f:
+            for id_, text, meta in zip(ids, texts, metadatas):
+                f.write(json.dumps({"id": id_, "text": text, "metadata": meta}) + "\n")
+
+        for id_, text, meta in zip(ids, texts, metadatas):
+            self.row_of[id_] = len(self.ids)
+            self.ids.append(id_)
+            self.texts.append(text)
+            self.metadatas.append(meta)
+        self.alive = np.concatenate([self.alive, np.ones(len(ids), dtype=bool)])
+        self._map()
+
+    def delete(self, ids: Iterable[str]) -> int:
+        rows = [self.row_of[i] for i in ids if i in self.row_of and self.alive[self.row_of[i]]]
+        if not rows:
+            return 0
+        with open(self.meta_path, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps({"deleted": self.ids[row]}) + "\n")
+        self.alive[rows] = False
+
+        if (~self.alive).sum() > COMPACT_RATIO * len(self.ids):
+            self.compact()
+        return len(rows)
+
+    def compact(self):
+        """Rewrites the partition without deleted rows."""
+        keep = np.flatnonzero(self.alive)
+        vectors = np.array(self.matrix[keep]) if len(keep) else np.zeros((0, self.dim), dtype=np.float32)
+        ids = [self.ids[i] for i in keep]
+        texts = [self.texts[i] for i in keep]
+        metadatas = [self.metadatas[i] for i in keep]
+
+        self.matrix = None  # release the memmap before replacing the file
+        for p in (self.vec_path, self.meta_path):
+            if os.path.exists(p):
+                os.replace(p, p + ".old")
+        self.ids, self.texts, self.metadatas, self.row_of = [], [], [], {}
+        self.alive = np.zeros(0, dtype=bool)
+        self._map()
+        if ids:
+            self.append(ids, texts, metadatas, vectors)
+        for p in (self.vec_path, self.meta_path):
+            if os.path.exists(p + ".old"):
+                os.remove(p + ".old")
+
+    # --- READ ---
+
+    def search(self, query: np.ndarray, k: int, filters: Optional[dict]) -> List[Tuple[int, float]]:
+        if self.matrix is None or len(self.ids) == 0:
+            return []
+
+        # Vectors are normalized, so one mat-vec product = cosine similarity for every row
+        scores = self.matrix @ query
+        mask = self.alive.copy()
+        if filters:
+            mask &= np.fromiter((_matches(m, filters) for m in self.metadatas), dtype=bool, count=len(self.metadatas))
+
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0:
+            return []
+        k = min(k, len(candidates))
+        cand_scores = scores[candidates]
+        top = np.argpartition(-cand_scores, k - 1)[:k]
+        top = top[np.argsort(-cand_scores[top])]
+        return [(int(candidates[i]), float(cand_scores[i])) for i in top]
+
+
+class LocalVectorStore(VectorStore):
+    """
+    On-disk vector index partitioned per patient (drop-in for PineconeVectorStore).
+
+    A `{"patient_id": ...}` filter only touches that patient's partition, so a
+    query costs a few hundred dot products no matter how many patients exist.
+    Other filters (e.g. file_id) scan every partition.
+    """
+
+    def __init__(self, embedding: Embeddings, path: str):
+        self._embedding = embedding
+        self.path = path
+        self._lock = threading.RLock()
+        self._partitions: dict[str, _Partition] = {}
+        self.dim: Optional[int] = None
+
+        os.makedirs(path, exist_ok=True)
+        info_path = os.path.join(path, "index.json")
+        if os.path.exists(info_path):
+            with open(info_path, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    # --- PARTITIONS ---
+
+    def _partition_dir(self, name: str) -> str:
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+        return os.path.join(self.path, safe)
+
+    def _partition(self, name: str, create: bool = False) -> Optional[_Partition]:
+        folder = self._partition_dir(name)
+        if folder not in self._partitions:
+            if not create and not os.path.isdir(folder):
+                return None
+            self._partitions[folder] = _Partition(folder, self.dim)
+        return self._partitions[folder]
+
+    def _all_partitions(self) -> List[_Partition]:
+        if self.dim is None:
+            return []
+        for name in os.listdir(self.path):
+            folder = os.path.join(self.path, name)
+            if os.path.isdir(folder) and folder not in self._partitions:
+                self._partitions[folder] = _Partition(folder, self.dim)
+        return list(self._partitions.values())
+
+    def _set_dim(self, dim: int):
+        if self.dim is None:
+            self.dim = dim
+            with open(os.path.join(self.path, "index.json"), "w", encoding="utf-8") as f:
+                json.dump({"dim": dim}, f)
+        elif self.dim != dim:
+            raise ValueError(f"Embedding size {dim} does not match index size {self.dim}")
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    # --- WRITE ---
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        vectors = self._normalize(np.asarray(self._embedding.embed_documents(texts), dtype=np.float32))
+
+        return self.add_vectors(vectors, texts, metadatas, ids)
+
+    def add_embeddings(self, texts: List[str], embeddings: List[List[float]], metadatas: List[dict],
+                       ids: List[str]) -> List[str]:
+        """Adds rows embedded elsewhere (bulk ingestion's embed stage)."""
+        if not texts:
+            return []
+        return self.add_vectors(self._normalize(np.asarray(embeddings, dtype=np.float32)), texts, metadatas, ids)
+
+    def add_vectors(self, vectors: np.ndarray, texts: List[str], metadatas: List[dict], ids: List[str]) -> List[str]:
+        """Appends already-embedded, normalized rows (grouped by patient partition)."""
+        with self._lock:
+            self._set_dim(vectors.shape[1])
+            groups: dict[str, List[int]] = {}
+            for i, meta in enumerate(metadatas):
+                groups.setdefault(str(meta.get(PARTITION_KEY) or SHARED_PARTITION), []).append(i)
+            for name, rows in groups.items():
+                self._partition(name, create=True).append(
+                    [ids[i] for i in rows], [texts[i] for i in rows], [metadatas[i] for i in rows], vectors[rows]
+                )
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        with self._lock:
+            removed = sum(p.delete(ids) for p in self._all_partitions())
+        return removed > 0
+
+    def delete_partition(self, patient_id: str) -> None:
+        """Drops every vector of one patient."""
+        with self._lock:
+            partition = self._partition(patient_id)
+            if partition:
+                partition.delete(list(partition.ids))
+
+    # --- READ ---
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: List[float], k: int = 4, filter: Optional[dict] = None
+    ) -> List[Tuple[Document, float]]:
+        if self.dim is None:
+            return []
+        query = self._normalize(np.asarray(embedding, dtype=np.float32))
+
+        with self._lock:
+            partition_name = filter.get(PARTITION_KEY) if filter else None
+            if isinstance(partition_name, str):
+                partition = self._partition(partition_name)
+                partitions = [partition] if partition else []
+            else:
+                partitions = self._all_partitions()
+
+            hits = []
+            for partition in partitions:
+                for row, score in partition.search(query, k, filter):
+                    doc = Document(page_content=partition.texts[row], metadata=dict(partition.metadatas[row]))
+                    hits.append((doc, score))
+
+        hits.sort(key=lambda h: h[1], reverse=True)
+        return hits[:k]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k=k, filter=filter)
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)]
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Cosine similarity [-1, 1] -> relevance [0, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        path: str = "cache/vectors",
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        store = cls(embedding=embedding, path=path)
+        store.add_texts(texts, metadatas=metadatas, **kwargs)
+        return store
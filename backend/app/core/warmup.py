@@ -0,0 +1,34 @@
+import time
+import asyncio
+
+from app.core.clients import AIClients
+from app.core.config import settings
+from app.core.imaging import run_in_image_pool
+
+
+def _noop():
+    return None
+
+
+async def warmup(clients: AIClients) -> dict:
+    """
+    Pays the one-time costs before the first request instead of during it:
+    the text splitter (and the langchain imports behind it) and the image
+    worker processes.
+    No model calls are made (nothing is billed).
+    Returns how long each step took, in ms.
+    """
+    from app.services.ingest_service import _get_splitter
+
+    timings = {}
+
+    start = time.perf_counter()
+    _get_splitter()
+    timings["imports_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    # Fork every image / OCR worker process now (first fork is the slow part)
+    start = time.perf_counter()
+    await asyncio.gather(*(run_in_image_pool(_noop) for _ in range(settings.IMAGE_WORKERS)))
+    timings["image_pool_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    return timings
@@ -2,12 +2,31 @@ import os
 import certifi # <--- You might need to pip install certifi
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
-from app.models import Doctor, Patient, Visit
+from pymongo.errors import DuplicateKeyError
+from app.core.log import get_logger
+from app.models import Doctor, Patient, Visit, VisitFile, ChatMessage, IngestJob, AnalysisCache, RecordSummary
 from dotenv import load_dotenv
 
+logger = get_logger("db")
+
 load_dotenv()
 
-async def init_db():
+DOCUMENT_MODELS = [
+    Doctor,
+    Patient,
+    Visit,
+    VisitFile,
+    ChatMessage,
+    IngestJob,
+    AnalysisCache,
+    RecordSummary
+]
+
+async def init_db(skip_indexes: bool = False):
+    """
+    Connects Beanie. skip_indexes: don't build / verify indexes (migrations
+    that must run before an index can be built, e.g. scripts/renumber_visits.py).
+    """
     # 1. Get Mongo URL
     mongo_url = os.getenv("MONGODB_URL") or "mongodb://localhost:27017"
     
@@ -21,12 +40,37 @@ async def init_db():
     
     db = client.clinic_ai_db
     
-    await init_beanie(
-        database=db,#type: ignore
-        document_models=[
-            Doctor,
-            Patient,
-            Visit
-        ]
-    )
-    print("✅ Database Connected: clinic_ai_db")
\ No newline at end of file
+    # init_beanie also creates any index declared in a model's Settings.indexes
+    try:
+        await init_beanie(
+            database=db,#type: ignore
+            document_models=DOCUMENT_MODELS,
+            skip_indexes=skip_indexes
+        )
+    except DuplicateKeyError:
+        logger.error("❌ A unique index can't be built over duplicate data. "
+                     "Visits numbered twice? Run scripts/renumber_visits.py first.")
+        raise
+    logger.info("✅ Database Connected: clinic_ai_db")
+
+    if not skip_indexes:
+        await verify_indexes()
+
+async def verify_indexes() -> list[str]:
+    """
+    Checks every index declared on the models exists in Mongo.
+    Returns (and logs) the missing ones, e.g. if creation failed on a live cluster.
+    """
+    missing = []
+    for model in DOCUMENT_MODELS:
+        declared = [ix.document["name"] for ix in getattr(model.Settings, "indexes", [])]
+        if not declared:
+            continue
+        existing = await model.get_motor_collection().index_information()
+        missing += [f"{model.Settings.name}.{name}" for name in declared if name not in existing]
+
+    if missing:
+        logger.warning(f"⚠️ Missing MongoDB indexes: {', '.join(missing)}")
+    else:
+        logger.info("✅ MongoDB indexes verified")
+    return missing
\ No newline at end of file
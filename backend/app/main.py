@@ -1,28 +1,71 @@
+import time
+_import_started = time.perf_counter()  # cold start is measured from here
+
 import os
-import shutil
-import uuid
-from typing import List
+import json
+from datetime import datetime
+from typing import List, Optional
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Query, Response, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from beanie import PydanticObjectId
+from pymongo import ReturnDocument
 
+from app.core.log import get_logger, setup_logging
+from app.core.metrics import REGISTRY, HTTP_SECONDS, CHAT_TTFT_SECONDS, span
 from app.database import init_db
-from app.models import Patient, Visit, FileRecord, Message
+from app.core.clients import AIClients, init_clients, get_clients
+from app.core.config import settings
+from app.core.uploads import save_upload, discard_uploads, max_request_bytes
+from app.core.pagination import keyset_filter, next_cursor
+from app.core.imaging import shutdown_image_pool
+from app.core.warmup import warmup
+from app.models import Patient, Visit, VisitFile, ChatMessage, IngestJob, PatientSummary, VisitSummary, RecordSummary
 
 # --- CRITICAL IMPORTS FOR AI ---
-from app.services.ingest_service import process_upload, memorize_report 
-from app.services.rag_service import get_rag_response
-from app.services.vision_service import analyze_xray 
+from app.services.rag_service import get_rag_response, stream_rag_response
+from app.services.job_service import ingest_queue, analyze_batch
+from app.services.cache_service import analysis_cache
+from app.services.answer_cache import answer_cache
+
+setup_logging()
+logger = get_logger("api")
+
+IMPORT_MS = round((time.perf_counter() - _import_started) * 1000, 1)
 
 # 1. LIFESPAN (Startup/Shutdown Logic)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    app.state.ready = False
+    startup = {"import_ms": IMPORT_MS}
+    started = time.perf_counter()
+
     # Startup: Connect to DB
+    step = time.perf_counter()
     await init_db()
+    startup["db_ms"] = round((time.perf_counter() - step) * 1000, 1)
+    # Startup: Build the shared AI clients once (reused by every request)
+    step = time.perf_counter()
+    clients = init_clients()
+    startup["clients_ms"] = round((time.perf_counter() - step) * 1000, 1)
+    # Startup: Start ingestion workers (resumes jobs left over from last run)
+    await ingest_queue.start(clients)
+    # Startup: Warm up imports / chains / worker processes before taking traffic
+    if settings.WARMUP_ON_STARTUP:
+        startup["warmup"] = await warmup(clients)
+
+    startup["total_ms"] = round((time.perf_counter() - started) * 1000, 1) + IMPORT_MS
+    app.state.startup = startup
+    app.state.ready = True
+    logger.info(f"🚀 Ready in {startup['total_ms']} ms (import {IMPORT_MS} ms)")
     yield
-    # Shutdown: (Cleanup if needed)
+    app.state.ready = False
+    # Shutdown: Stop workers (unfinished jobs stay queued in Mongo)
+    await ingest_queue.stop()
+    shutdown_image_pool()
 
 app = FastAPI(title="Clinic AI EMR", lifespan=lifespan)
 
@@ -33,11 +76,59 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Request latency per route (route template, so /visits/{visit_id} is one series)
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_SECONDS.observe(time.perf_counter() - start, method=request.method,
+                             route=getattr(route, "path", "unmatched"), status=status)
+
+# Oversized uploads: 413 from Content-Length, before the multipart body is spooled to disk
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    limit = max_request_bytes(request.url.path) if request.method == "POST" else None
+    declared = request.headers.get("content-length")
+    if limit and declared and declared.isdigit() and int(declared) > limit:
+        return JSONResponse({"detail": f"File too large (max {settings.MAX_UPLOAD_MB} MB per file)"}, status_code=413)
+    return await call_next(request)
+
 # 3. Mount Local Storage (For saving images locally)
-os.makedirs("uploads", exist_ok=True)
-app.mount("/static", StaticFiles(directory="uploads"), name="static")
+os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+app.mount("/static", StaticFiles(directory=settings.UPLOAD_DIR), name="static")
+
+# --- HEALTH ENDPOINTS ---
+
+@app.get("/ready")
+async def readiness():
+    """
+    Readiness probe: 200 once startup (DB, AI clients, warmup) is done and
+    Mongo answers a ping, 503 otherwise. Also reports cold start timings.
+    """
+    if not getattr(app.state, "ready", False):
+        raise HTTPException(503, "Starting up")
+    try:
+        await Patient.get_motor_collection().database.command("ping")
+    except Exception as e:
+        raise HTTPException(503, f"Database unavailable: {e}")
+    return {"status": "ready", "startup": app.state.startup}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus scrape endpoint: per-stage latency histograms, model calls /
+    latency / tokens, cache hits and HTTP latency.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 # --- PATIENT ENDPOINTS ---
 
@@ -52,13 +143,46 @@ async def create_patient(name: str = Form(...), age: int = Form(...), gender: st
     return {"status": "success", "patient": patient}
 
 @app.get("/patients")
-async def list_patients():
+async def list_patients(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE)
+):
     """
-    Get all registered patients for the dashboard
+    Get registered patients for the dashboard, newest first (one page).
+    Pass the `X-Next-Cursor` response header back as `cursor` for the next page.
     """
-    patients = await Patient.find_all().to_list()
+    patients = await Patient.find(keyset_filter("created_at", cursor)) \
+        .sort([("created_at", -1), ("_id", -1)]) \
+        .limit(limit + 1) \
+        .project(PatientSummary) \
+        .to_list()
+
+    cursor_out = next_cursor(patients, limit, "created_at")
+    if cursor_out:
+        response.headers["X-Next-Cursor"] = cursor_out
     return patients
 
+@app.get("/patients/{patient_id}/summary")
+async def get_patient_summary(patient_id: str, version: Optional[int] = None):
+    """
+    Rolling longitudinal summary (latest version, or `version`).
+    Updated in the background after every ingested file; used by chat.
+    """
+    query = RecordSummary.find(RecordSummary.scope == "patient", RecordSummary.scope_id == patient_id)
+    if version is not None:
+        query = query.find(RecordSummary.version == version)
+    summary = await query.sort(-RecordSummary.version).first_or_none()
+    if not summary:
+        raise HTTPException(404, "No summary yet")
+    return {
+        "patient_id": patient_id,
+        "version": summary.version,
+        "text": summary.text,
+        "files": summary.file_count or len(summary.file_refs),  # older versions listed every file
+        "updated_at": summary.created_at,
+    }
+
 # --- VISIT ENDPOINTS ---
 
 @app.post("/visits/create")
@@ -66,149 +190,270 @@ async def start_visit(patient_id: str = Form(...), doctor_id: str = Form("dr_def
     """
     Start a new session for a patient
     """
-    # 1. Get Patient
-    patient = await Patient.get(patient_id)
+    if not PydanticObjectId.is_valid(patient_id):
+        raise HTTPException(404, "Patient not found")
+
+    # 1. Check Patient + Increment Visit Count in ONE atomic round-trip.
+    # Two receptionists opening visits at once get consecutive numbers.
+    patient = await Patient.get_motor_collection().find_one_and_update(
+        {"_id": PydanticObjectId(patient_id)},
+        {"$inc": {"total_visits": 1}},
+        projection={"name": 1, "total_visits": 1},
+        return_document=ReturnDocument.AFTER
+    )
     if not patient:
         raise HTTPException(404, "Patient not found")
     
-    # 2. Increment Visit Count
-    patient.total_visits += 1
-    await patient.save()
-    
-    # 3. Create Visit
+    # 2. Create Visit (unique on patient_id + visit_number)
     visit = Visit(
-        patient_id=str(patient.id),
+        patient_id=patient_id,
         doctor_id=doctor_id,
-        visit_number=patient.total_visits
+        visit_number=patient["total_visits"]
     )
     await visit.insert()
     
-    return {"status": "started", "visit": visit, "patient_name": patient.name}
+    return {"status": "started", "visit": visit, "patient_name": patient["name"]}
 
 @app.get("/visits/history/{patient_id}")
-async def get_patient_history(patient_id: str):
+async def get_patient_history(
+    patient_id: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE)
+):
     """
-    Get previous visits to show timeline
+    Get previous visits to show timeline (summaries only, newest first, one page).
+    Pass the `X-Next-Cursor` response header back as `cursor` for the next page.
     """
-    visits = await Visit.find(Visit.patient_id == patient_id).sort(-Visit.timestamp).to_list()
+    visits = await Visit.find(Visit.patient_id == patient_id, keyset_filter("timestamp", cursor)) \
+        .sort([("timestamp", -1), ("_id", -1)]) \
+        .limit(limit + 1) \
+        .project(VisitSummary) \
+        .to_list()
+
+    cursor_out = next_cursor(visits, limit, "timestamp")
+    if cursor_out:
+        response.headers["X-Next-Cursor"] = cursor_out
     return visits
 
+async def get_visit_summary(visit_id: str) -> VisitSummary:
+    """
+    Loads just the visit header (no files / messages) or raises 404.
+    """
+    if not PydanticObjectId.is_valid(visit_id):
+        raise HTTPException(404, "Visit not found")
+    visit = await Visit.find_one(Visit.id == PydanticObjectId(visit_id)).project(VisitSummary)
+    if not visit:
+        raise HTTPException(404, "Visit not found")
+    return visit
+
+@app.get("/visits/{visit_id}")
+async def get_visit(visit_id: str):
+    """
+    Full details of one visit: files with AI summaries + the latest page of chat
+    messages (oldest first). Older messages: GET /visits/{id}/messages.
+    """
+    visit = await Visit.get(visit_id) if PydanticObjectId.is_valid(visit_id) else None
+    if not visit:
+        raise HTTPException(404, "Visit not found")
+
+    files = await VisitFile.find(VisitFile.visit_id == visit_id).sort(+VisitFile.created_at).to_list()
+    messages = await ChatMessage.find(ChatMessage.visit_id == visit_id) \
+        .sort([("timestamp", -1), ("_id", -1)]) \
+        .limit(settings.DEFAULT_PAGE_SIZE) \
+        .to_list()
+    messages.reverse()
+
+    data = visit.model_dump(mode="json", by_alias=True)
+    # Legacy visits may still carry embedded files / messages
+    data["files"] = data["files"] + [f.model_dump(mode="json", by_alias=True) for f in files]
+    data["messages"] = data["messages"] + [m.model_dump(mode="json", by_alias=True) for m in messages]
+    return data
+
+@app.get("/visits/{visit_id}/messages")
+async def get_visit_messages(
+    visit_id: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE)
+):
+    """
+    Chat history of a visit, newest first (one page).
+    Pass the `X-Next-Cursor` response header back as `cursor` for older messages.
+    """
+    messages = await ChatMessage.find(ChatMessage.visit_id == visit_id, keyset_filter("timestamp", cursor)) \
+        .sort([("timestamp", -1), ("_id", -1)]) \
+        .limit(limit + 1) \
+        .to_list()
+
+    cursor_out = next_cursor(messages, limit, "timestamp")
+    if cursor_out:
+        response.headers["X-Next-Cursor"] = cursor_out
+    return messages
+
 # --- INTELLIGENT UPLOAD ENDPOINT ---
 
-@app.post("/visits/{visit_id}/upload")
+@app.post("/visits/{visit_id}/upload", status_code=202)
 async def upload_medical_file(
     visit_id: str,
     file: UploadFile = File(...),
     type: str = Form("prescription") # "xray" or "prescription"
 ):
     """
-    1. Routes file to correct AI (Vision vs Ingest).
-    2. Memorizes the content in Pinecone (even X-Rays).
-    3. Saves file record to MongoDB.
-    4. ADDS A MESSAGE to the chat history so it appears in the timeline.
+    1. Streams the file to disk (415 for non-images, 413 above MAX_UPLOAD_MB).
+    2. Queues it for the AI workers (Vision vs Ingest + Pinecone memory).
+    3. Returns a job id right away (202 Accepted) so the app can poll /jobs/{id}.
+    The worker saves the FileRecord and the AI chat message when it finishes.
     """
-    visit = await Visit.get(visit_id)
-    if not visit:
-        raise HTTPException(404, "Visit not found")
+    visit = await get_visit_summary(visit_id)
 
-    # 1. Save File Locally
-    file_ext = file.filename.split(".")[-1]
-    unique_name = f"{visit.patient_id}_{uuid.uuid4()}.{file_ext}"
-    file_path = f"uploads/{unique_name}"
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
-    # 2. Read File
-    with open(file_path, "rb") as f:
-        content = f.read()
-
-    print(f"🧠 AI Analyzing {type.upper()} for Patient {visit.patient_id}...")
-    
-    saved_id = None
-    
-    # 3. Intelligent Routing & Processing
-    try:
-        if type == "xray":
-            # --- X-RAY FLOW ---
-            ai_result = await analyze_xray(content, file.filename)
-            ai_summary = ai_result.get("analysis", {})
-            
-            # Create a chat-friendly string
-            chat_text = (
-                f"🩻 **X-Ray Analysis**\n"
-                f"**Finding:** {ai_summary.get('finding', 'Unknown')}\n"
-                f"**Severity:** {ai_summary.get('severity', 'Unknown')}\n"
-                f"**Location:** {ai_summary.get('location', 'Unknown')}"
-            )
-            
-            # === MEMORIZE THIS INTO PINECONE ===
-            # We convert the JSON finding into a sentence so RAG can read it later.
-            memory_text = f"X-Ray Analysis of {file.filename}: Found {ai_summary.get('finding')} in {ai_summary.get('location')}. Severity is {ai_summary.get('severity')}."
-            saved_id = await memorize_report(memory_text, file.filename, visit.patient_id)
-            
-        else:
-            # --- PRESCRIPTION FLOW ---
-            ai_result = await process_upload(content, file.filename, patient_id=visit.patient_id)
-            ai_summary = ai_result.get("analysis", {})
-            saved_id = ai_result.get("file_id") # process_upload already generates an ID
-            
-            # Create a chat-friendly string
-            chat_text = (
-                f"📄 **Prescription Digitized**\n"
-                f"**Summary:** {ai_summary.get('patient_summary', 'Processed')}\n"
-                f"**Medicines:** {', '.join(ai_summary.get('medicines', []))}"
-            )
+    # 1. Stream File to Disk (type + size checked, hash computed on the fly)
+    with span("upload.save", file_type=type):
+        stored = await save_upload(file, prefix=visit.patient_id)
 
-    except Exception as e:
-        print(f"❌ AI Failed: {e}")
-        ai_summary = {"error": str(e)}
-        chat_text = "❌ I encountered an error analyzing this file."
-        saved_id = "error"
-
-    # 4. Save File Record (The Database Copy)
-    record = FileRecord(
-        file_id=saved_id or str(uuid.uuid4()),
-        filename=file.filename,
-        file_type=type,
-        local_path=file_path,
-        ai_summary=ai_summary
-    )
-    visit.files.append(record)
+    # 2. Queue for the AI workers
+    with span("upload.enqueue"):
+        job = await ingest_queue.enqueue(IngestJob(
+            visit_id=visit_id,
+            patient_id=visit.patient_id,
+            filename=stored.filename,
+            file_type=type,
+            local_path=stored.path,
+            sha256=stored.sha256,
+            mime_type=stored.mime_type,
+            size=stored.size
+        ))
 
-    # 5. Save Chat Message (The "Chatbot" Experience)
-    # We add a message from the "ai" so it shows up in the chat window immediately.
-    visit.messages.append(Message(sender="ai", text=chat_text))
-
-    await visit.save()
-    
     return {
-        "status": "processed", 
+        "status": "queued",
+        "job_id": str(job.id),
         "file_type": type,
-        "ai_summary": ai_summary,
-        "chat_message": chat_text # Return this so frontend can append it locally too
+        "chat_message": "⏳ File received. Analyzing in the background..."
     }
 
+@app.post("/visits/{visit_id}/upload/batch")
+async def upload_medical_files_batch(
+    visit_id: str,
+    files: List[UploadFile] = File(...),
+    types: List[str] = Form([]), # one per file, or one for all (default "prescription")
+    clients: AIClients = Depends(get_clients)
+):
+    """
+    Upload a whole stack of documents for one visit.
+    Files are analyzed concurrently; results stream back as NDJSON, one line per
+    file as it completes, then a final {"status": "saved"} line once every
+    vector, file record and chat message has been written (one write each).
+    """
+    visit = await get_visit_summary(visit_id)
+
+    if len(files) > settings.BATCH_MAX_FILES:
+        raise HTTPException(413, f"Too many files (max {settings.BATCH_MAX_FILES})")
+    if types and len(types) not in (1, len(files)):
+        raise HTTPException(400, "Send one `types` value per file, or a single one for all files")
+    file_types = types if len(types) == len(files) else [types[0] if types else "prescription"] * len(files)
+
+    # Stream every file to disk (type + size checked); each one is read back
+    # only while it is being analyzed, so at most BATCH_CONCURRENCY are in memory.
+    # A rejected file (415 / 413) fails the whole batch: delete the ones already saved
+    uploads = []
+    try:
+        for file, file_type in zip(files, file_types):
+            stored = await save_upload(file, prefix=visit.patient_id)
+            uploads.append((stored, file_type))
+    except BaseException:
+        await discard_uploads([stored for stored, _ in uploads])
+        raise
+
+    async def ndjson():
+        async for event in analyze_batch(uploads, visit_id, visit.patient_id, clients):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+# --- JOB STATUS ENDPOINTS ---
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """
+    Poll a single upload job (status, stage, progress, result).
+    """
+    job = await IngestJob.get(job_id)
+    if not job:
+        raise HTTPException(404, "Job not found")
+    return job
+
+@app.get("/visits/{visit_id}/jobs")
+async def get_visit_jobs(visit_id: str, since: Optional[datetime] = None):
+    """
+    Status feed for every upload in a visit.
+    Pass `since` (last updated_at seen) to only get jobs that changed.
+    """
+    query = IngestJob.find(IngestJob.visit_id == visit_id)
+    if since:
+        query = query.find(IngestJob.updated_at > since)
+    return await query.sort(+IngestJob.created_at).to_list()
+
+# --- CACHE ENDPOINTS ---
+
+@app.get("/cache/analysis/stats")
+async def get_analysis_cache_stats():
+    """
+    Hit / miss counters of the upload dedup cache (since last restart).
+    """
+    return await analysis_cache.stats()
+
+@app.get("/cache/embeddings/stats")
+async def get_embedding_cache_stats(clients: AIClients = Depends(get_clients)):
+    """
+    Hit / miss counters of the embedding cache (memory LRU + disk).
+    """
+    return clients.embeddings.stats()
+
+@app.get("/cache/answers/stats")
+async def get_answer_cache_stats():
+    """
+    Hit / miss counters of the chat answer cache (since last restart).
+    """
+    return answer_cache.stats()
+
+@app.delete("/cache/analysis")
+async def invalidate_analysis_cache(file_type: Optional[str] = None):
+    """
+    Clears cached analyses (e.g. after changing a prompt without bumping its version).
+    """
+    removed = await analysis_cache.invalidate(file_type)
+    return {"status": "cleared", "removed": removed}
+
+@app.delete("/cache/answers")
+async def invalidate_answer_cache(patient_id: Optional[str] = None):
+    """
+    Clears cached chat answers (all patients, or one).
+    """
+    removed = await answer_cache.invalidate(patient_id)
+    return {"status": "cleared", "removed": removed}
+
 # --- CHAT ENDPOINT (Longitudinal RAG) ---
 
 @app.post("/visits/{visit_id}/chat")
-async def chat_with_patient_context(visit_id: str, query: str = Form(...)):
+async def chat_with_patient_context(
+    visit_id: str,
+    query: str = Form(...),
+    clients: AIClients = Depends(get_clients)
+):
     """
     Chat with the AI about this specific patient's history.
     DEBUG MODE: Returns full system errors if they occur.
     """
-    visit = await Visit.get(visit_id)
-    if not visit:
-        raise HTTPException(404, "Visit not found")
+    visit = await get_visit_summary(visit_id)
 
-    print(f"🤖 Asking RAG for Patient ID: {visit.patient_id}")
+    logger.info(f"🤖 Asking RAG for Patient ID: {visit.patient_id}")
 
     # 1. AI Retrieval (The "Brain")
-    response_data = get_rag_response(query, patient_id=visit.patient_id)
+    response_data = await get_rag_response(query, clients, patient_id=visit.patient_id)
     
     # 2. DEBUG LOGIC: Check for errors immediately
     if response_data.get("status") == "error":
-        print(f"❌ RAG CRASHED: {response_data}")
+        logger.error(f"❌ RAG CRASHED: {response_data}")
         # Return the error directly to the UI so you can see it
         return {
             "response": f"SYSTEM ERROR: {response_data.get('message')}",
@@ -217,16 +462,79 @@ async def chat_with_patient_context(visit_id: str, query: str = Form(...)):
 
     ai_text = response_data.get("ai_response", "No response generated.")
 
-    # 3. Save Chat History (Only if successful)
-    visit.messages.append(Message(sender="doctor", text=query))
-    visit.messages.append(Message(sender="ai", text=ai_text))
-    await visit.save()
+    # 3. Save Chat History (Only if successful) - one insert, no visit rewrite
+    await ChatMessage.insert_many([
+        ChatMessage(visit_id=visit_id, patient_id=visit.patient_id, sender="doctor", text=query),
+        ChatMessage(visit_id=visit_id, patient_id=visit.patient_id, sender="ai", text=ai_text),
+    ])
     
     return {
         "response": ai_text,
-        "source": response_data.get("source_document")
+        "source": response_data.get("source_document"),
+        "context_tokens": response_data.get("context_tokens"),
+        "retrieval": response_data.get("retrieval")
     }
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.post("/visits/{visit_id}/chat/stream")
+async def stream_chat_with_patient_context(
+    visit_id: str,
+    query: str = Form(...),
+    clients: AIClients = Depends(get_clients)
+):
+    """
+    Same answer as /chat, streamed as Server-Sent Events:
+      event: sources -> the records in the prompt + context_tokens, before the model starts
+      event: token   -> answer text as Gemini produces it
+      event: done    -> full answer + time to first token (the exchange is saved)
+      event: error   -> message (nothing is saved)
+    """
+    visit = await get_visit_summary(visit_id)
+    started = time.perf_counter()
+    logger.info(f"🤖 Streaming RAG for Patient ID: {visit.patient_id}")
+
+    async def events():
+        answer, source, ttft_ms, context_tokens = [], None, None, None
+        try:
+            async for kind, payload in stream_rag_response(query, clients, patient_id=visit.patient_id):
+                if kind == "sources":
+                    source = payload.docs[0].metadata.get("source") if payload.docs else None
+                    context_tokens = payload.context_tokens
+                    yield _sse("sources", {"context_tokens": context_tokens, "retrieval": payload.retrieval, "sources": [
+                        {**doc.metadata, "content": doc.page_content} for doc in payload.docs
+                    ]})
+                    continue
+                if ttft_ms is None:
+                    ttft = time.perf_counter() - started
+                    CHAT_TTFT_SECONDS.observe(ttft)
+                    ttft_ms = round(ttft * 1000, 1)
+                answer.append(payload)
+                yield _sse("token", {"text": payload})
+        except Exception as e:
+            logger.error(f"❌ RAG stream crashed: {e}")
+            yield _sse("error", {"message": str(e)})
+            return
+
+        ai_text = "".join(answer).strip() or "No response generated."
+        # Save only complete exchanges - one insert, no visit rewrite
+        await ChatMessage.insert_many([
+            ChatMessage(visit_id=visit_id, patient_id=visit.patient_id, sender="doctor", text=query),
+            ChatMessage(visit_id=visit_id, patient_id=visit.patient_id, sender="ai", text=ai_text),
+        ])
+        yield _sse("done", {
+            "response": ai_text,
+            "source": source,
+            "context_tokens": context_tokens,
+            "ttft_ms": ttft_ms,
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+
+    # no-cache + X-Accel-Buffering: proxies (nginx) must pass events through immediately
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
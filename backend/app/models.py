@@ -1,7 +1,8 @@
 from typing import List, Optional
 from datetime import datetime
-from beanie import Document
+from beanie import Document, PydanticObjectId
 from pydantic import BaseModel, Field
+from pymongo import IndexModel, ASCENDING, DESCENDING
 
 # --- SUPPORT MODELS (Embedded inside Documents) ---
 
@@ -14,6 +15,9 @@ class FileRecord(BaseModel):
     file_type: str        # "prescription" or "xray"
     local_path: str       # Where we saved the image on the laptop
     ai_summary: Optional[dict] = None # The JSON output from Gemini
+    sha256: Optional[str] = None      # Content hash (dedup cache key)
+    ocr_engine: Optional[str] = None  # "tesseract", "vision_llm" or "cache" (prescriptions)
+    ocr_confidence: Optional[float] = None  # Mean Tesseract word confidence (0-100)
 
 class Message(BaseModel):
     """
@@ -31,6 +35,9 @@ class Doctor(Document):
     
     class Settings:
         name = "doctors"
+        indexes = [
+            IndexModel([("name", ASCENDING)], name="doctor_name"),
+        ]
 
 class Patient(Document):
     name: str
@@ -38,9 +45,16 @@ class Patient(Document):
     gender: str
     created_at: datetime = Field(default_factory=datetime.now)
     total_visits: int = 0  # <--- Critical for "New Patient" logic
+    records_version: int = 0  # Bumped by every ingest / new summary (answer cache validity)
     
     class Settings:
         name = "patients"
+        indexes = [
+            # Dashboard list: newest first, keyset cursor on (created_at, _id)
+            IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="patient_created"),
+            # Lookup by name (+ newest first among namesakes)
+            IndexModel([("name", ASCENDING), ("created_at", DESCENDING)], name="patient_name_created"),
+        ]
 
 class Visit(Document):
     patient_id: str       # Links to Patient
@@ -48,7 +62,8 @@ class Visit(Document):
     visit_number: int     # 1 = New Patient, >1 = Returning
     timestamp: datetime = Field(default_factory=datetime.now)
     
-    # Data Storage
+    # Legacy embedded storage (read-only). New files / messages live in their
+    # own collections (VisitFile, ChatMessage); see scripts/migrate_visit_children.py
     files: List[FileRecord] = []
     messages: List[Message] = []
     
@@ -56,4 +71,157 @@ class Visit(Document):
     visit_summary: Optional[str] = None 
     
     class Settings:
-        name = "visits"
\ No newline at end of file
+        name = "visits"
+        indexes = [
+            # Patient timeline: Visit.patient_id == X sorted by timestamp desc
+            IndexModel(
+                [("patient_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+                name="visit_patient_timestamp"
+            ),
+            # Visit numbers come from an atomic $inc on Patient.total_visits; this
+            # guarantees no duplicates even if the counter is ever edited by hand.
+            # Databases from before need scripts/renumber_visits.py run first.
+            IndexModel([("patient_id", ASCENDING), ("visit_number", ASCENDING)], unique=True, name="visit_patient_number"),
+        ]
+# --- VISIT CHILDREN (one document per file / message) ---
+# Appending is a plain insert: cost doesn't grow with the conversation and
+# concurrent writers to the same visit can never overwrite each other.
+
+class VisitFile(Document, FileRecord):
+    """
+    A FileRecord stored in its own collection, linked to its visit.
+    """
+    visit_id: str
+    patient_id: str
+    created_at: datetime = Field(default_factory=datetime.now)
+    summarized: bool = False  # Folded into the patient's rolling summary
+
+    class Settings:
+        name = "visit_files"
+        indexes = [
+            IndexModel([("visit_id", ASCENDING), ("created_at", ASCENDING)], name="file_visit_created"),
+            # Rolling summary: this patient's files not folded in yet, oldest first
+            IndexModel([("patient_id", ASCENDING), ("created_at", ASCENDING)], name="file_patient_created"),
+        ]
+
+class ChatMessage(Document, Message):
+    """
+    A chat Message stored in its own collection, linked to its visit.
+    """
+    visit_id: str
+    patient_id: str
+
+    class Settings:
+        name = "messages"
+        indexes = [
+            IndexModel([("visit_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="message_visit_timestamp"),
+        ]
+
+# --- ROLLING SUMMARIES ---
+
+class RecordSummary(Document):
+    """
+    One version of a rolling summary, scope "visit" (scope_id = visit id) or
+    "patient" (scope_id = patient id). Every update inserts version + 1, so
+    older versions stay readable; the newest one is what RAG uses.
+    """
+    scope: str            # "visit" or "patient"
+    scope_id: str
+    patient_id: str
+    version: int
+    text: str
+    file_refs: List[str] = []  # VisitFile ids folded into this version
+    file_count: int = 0        # Files folded in so far (all versions)
+    created_at: datetime = Field(default_factory=datetime.now)
+
+    class Settings:
+        name = "record_summaries"
+        indexes = [
+            IndexModel([("scope", ASCENDING), ("scope_id", ASCENDING), ("version", DESCENDING)],
+                       unique=True, name="summary_scope_version"),
+        ]
+
+# --- LIGHTWEIGHT VIEWS (projections for list endpoints) ---
+
+class PatientSummary(BaseModel):
+    """
+    Row of the patient list. Only these fields are read from Mongo.
+    """
+    id: PydanticObjectId = Field(alias="_id")
+    name: str
+    age: int
+    gender: str
+    created_at: datetime
+    total_visits: int = 0
+
+class VisitSummary(BaseModel):
+    """
+    Row of the visit timeline: no files / chat messages (use GET /visits/{id}).
+    """
+    id: PydanticObjectId = Field(alias="_id")
+    patient_id: str
+    doctor_id: str
+    visit_number: int
+    timestamp: datetime
+    visit_summary: Optional[str] = None
+
+# --- BACKGROUND JOBS ---
+
+class IngestJob(Document):
+    """
+    One uploaded file waiting for (or going through) the AI pipeline.
+    Stored in Mongo so queued work survives a server restart.
+    """
+    visit_id: str
+    patient_id: str
+    filename: str
+    file_type: str        # "prescription" or "xray"
+    local_path: str       # File already saved in uploads/
+    sha256: Optional[str] = None  # Hash computed while saving the upload
+    mime_type: Optional[str] = None  # Detected from the file's magic bytes
+    size: Optional[int] = None    # Bytes
+    status: str = "queued"  # queued -> running -> done / failed
+    owner: Optional[str] = None  # Worker process holding the job while running (lease)
+    stage: Optional[str] = None  # Human-readable step (e.g. "analyzing")
+    progress: int = 0     # 0 - 100
+    attempts: int = 0
+    error: Optional[str] = None
+    result: Optional[dict] = None  # ai_summary + chat_message once done
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)  # Lease heartbeat while running
+
+    class Settings:
+        name = "ingest_jobs"
+        indexes = [
+            # Worker startup: resume queued / running jobs in order
+            IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="job_status_created"),
+            # Per-visit status feed
+            IndexModel([("visit_id", ASCENDING), ("created_at", ASCENDING)], name="job_visit_created"),
+        ]
+
+# --- CACHES ---
+
+class AnalysisCache(Document):
+    """
+    Result of the AI pipeline for one file content (SHA-256).
+    Re-uploads of the same photo reuse this instead of calling Gemini again.
+    """
+    key: str              # "<sha256>:<file_type>:<prompt_version>"
+    sha256: str
+    file_type: str
+    prompt_version: str
+    patient_id: str       # Patient whose vectors `file_id` points to
+    file_id: str          # Vector id in Pinecone
+    ai_summary: dict
+    chat_text: str
+    extracted_text: str   # OCR text / X-ray memory sentence (re-embedded for other patients)
+    hits: int = 0
+    created_at: datetime = Field(default_factory=datetime.now)
+    last_used_at: datetime = Field(default_factory=datetime.now)
+
+    class Settings:
+        name = "analysis_cache"
+        indexes = [
+            IndexModel([("key", ASCENDING)], unique=True, name="cache_key"),
+            IndexModel([("last_used_at", ASCENDING)], name="cache_last_used"),
+        ]
@@ -0,0 +1,233 @@
+import re
+import math
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from beanie import PydanticObjectId
+
+from app.core.log import get_logger
+from app.core.clients import AIClients
+from app.core.config import settings
+from app.core.metrics import CACHE_REQUESTS
+from app.models import Patient
+
+logger = get_logger("answer_cache")
+
+_PUNCT = re.compile(r"[^\w\s]")
+
+# Words that change the answer however close the rest of the question is:
+# negations, sides, numbers (doses, dates) and drug names (common INN stems;
+# brand names usually come with a dose, e.g. "dolo 650").
+_WORDS = re.compile(r"[a-z0-9]+(?:'t)?(?:\.[0-9]+)?")
+NEGATIONS = frozenset("no not never without stopped discontinued denies off".split())
+SIDES = frozenset("left right lt rt bilateral".split())
+DRUG_STEM = re.compile(
+    r"(?:mycin|micin|cillin|oxacin|cycline|azole|tidine|pril|sartan|olol|dipine|statin|formin|gliptin|"
+    r"gliflozin|glitazone|lukast|triptan|setron|azepam|zolam|oxetine|parin|semide|thiazide|olone|isone|"
+    r"amol|profen|fenac|coxib|dronate|caine|mab|nib|vir|insulin)$"
+)
+
+
+def normalize_query(text: str) -> str:
+    """ "Current meds?" / "current  meds" -> "current meds" """
+    return " ".join(_PUNCT.sub(" ", text.lower()).split())
+
+
+def key_terms(text: str) -> frozenset:
+    """The words of a question a cached answer must share exactly (see above)."""
+    terms = set()
+    for word in _WORDS.findall(text.lower()):
+        if word.endswith("n't") or word in NEGATIONS:
+            terms.add("not" if word.endswith("n't") else word)
+        elif word in SIDES or DRUG_STEM.search(word) or any(c.isdigit() for c in word):
+            terms.add(word)
+    return frozenset(terms)
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+@dataclass
+class CachedAnswer:
+    patient_id: str
+    query: str                      # normalized
+    text: str                       # as asked (what gets embedded)
+    terms: frozenset                # key_terms(): negations, sides, doses, drug names
+    answer: dict                    # get_rag_response() result
+    generation: int                 # Patient.records_version the answer was built on
+    docs: list = field(default_factory=list)  # Documents in the prompt (stream "sources")
+    vector: Optional[List[float]] = None      # embedded on first comparison
+    created_at: float = field(default_factory=time.time)
+    hits: int = 0
+
+
+class AnswerCache:
+    """
+    In-process cache of chat answers, per patient.
+
+    Lookup: exact normalized question first (no model call), then the
+    question's embedding against this patient's cached questions
+    (cosine >= ANSWER_CACHE_SIMILARITY) that share its key_terms(): a
+    paraphrase hits, but "left knee" never answers "right knee", nor
+    "metformin" "metoprolol", nor "500 mg" "1000 mg". Embeddings go through
+    the embedding cache and are only computed when there is something to
+    compare: a cached question is embedded on its first comparison, usually
+    a cache hit from the vector search of its own miss.
+
+    Entries expire after ANSWER_CACHE_TTL_SECONDS, the least recently used
+    go above ANSWER_CACHE_MAX_ENTRIES. Every answer carries the patient's
+    records_version (a counter in Mongo, bumped by every ingest or new rolling
+    summary) and is only served while it is current, so an ingest handled by
+    another worker, host or the bulk importer invalidates it too.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, similarity: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self._patients: Dict[str, Dict[str, CachedAnswer]] = {}  # patient_id -> query -> entry
+        self._lru: OrderedDict[tuple, None] = OrderedDict()      # (patient_id, query), oldest first
+        self._lock = threading.Lock()
+
+        # Hit / miss counters (since process start)
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    # --- INVALIDATION ---
+
+    async def generation(self, patient_id: str) -> int:
+        """
+        The patient's records_version. Read it before answering and pass it
+        to lookup() / store().
+        """
+        if not PydanticObjectId.is_valid(patient_id):
+            return 0
+        patient = await Patient.get_motor_collection().find_one(
+            {"_id": PydanticObjectId(patient_id)}, projection={"records_version": 1}
+        )
+        return (patient or {}).get("records_version", 0)
+
+    def _drop(self, patient_id: str, queries=None) -> int:
+        """Removes one patient's entries (all, or these queries). Caller holds the lock."""
+        bucket = self._patients.get(patient_id, {})
+        queries = list(bucket) if queries is None else queries
+        for query in queries:
+            del bucket[query]
+            del self._lru[(patient_id, query)]
+        if not bucket:
+            self._patients.pop(patient_id, None)
+        return len(queries)
+
+    async def invalidate(self, patient_id: Optional[str] = None) -> int:
+        """
+        Drops one patient's answers (all answers without a patient_id) here,
+        and bumps records_version so every other worker drops them on lookup.
+        """
+        if patient_id is None:
+            await Patient.get_motor_collection().update_many({}, {"$inc": {"records_version": 1}})
+            with self._lock:
+                removed = len(self._lru)
+                self._patients.clear()
+                self._lru.clear()
+            return removed
+
+        if PydanticObjectId.is_valid(patient_id):
+            await Patient.get_motor_collection().update_one({"_id": PydanticObjectId(patient_id)}, {"$inc": {"records_version": 1}})
+        with self._lock:
+            removed = self._drop(patient_id)
+        if removed:
+            logger.info(f"🧹 Answer cache dropped {removed} answers for Patient {patient_id}")
+        return removed
+
+    # --- LOOKUP / STORE ---
+
+    def _live(self, patient_id: str, generation: int) -> Dict[str, CachedAnswer]:
+        """This patient's current entries (expired / outdated ones are removed). Caller holds the lock."""
+        bucket = self._patients.get(patient_id, {})
+        cutoff = time.time() - self.ttl_seconds
+        stale = [q for q, e in bucket.items() if e.created_at < cutoff or e.generation != generation]
+        if stale:
+            self._drop(patient_id, stale)
+        return self._patients.get(patient_id, {})
+
+    def _hit(self, entry: CachedAnswer, result: str) -> CachedAnswer:
+        self._lru.move_to_end((entry.patient_id, entry.query))
+        entry.hits += 1
+        if result == "exact_hit":
+            self.exact_hits += 1
+        else:
+            self.semantic_hits += 1
+        CACHE_REQUESTS.inc(cache="answer", result=result)
+        return entry
+
+    def _miss(self) -> None:
+        self.misses += 1
+        CACHE_REQUESTS.inc(cache="answer", result="miss")
+
+    async def lookup(self, query_text: str, patient_id: str, clients: AIClients,
+                     generation: int) -> Optional[CachedAnswer]:
+        query = normalize_query(query_text)
+        terms = key_terms(query_text)
+        with self._lock:
+            live = self._live(patient_id, generation)
+            exact = live.get(query)
+            if exact:
+                return self._hit(exact, "exact_hit")
+            candidates = [e for e in live.values() if e.terms == terms]
+        if not candidates:
+            self._miss()
+            return None
+
+        # Only embed when there is something to compare against
+        unembedded = [e for e in candidates if e.vector is None]
+        texts = [query_text] + [e.text for e in unembedded]
+        vector, *vectors = await asyncio.to_thread(lambda: [clients.embeddings.embed_query(t) for t in texts])
+        for entry, entry_vector in zip(unembedded, vectors):
+            entry.vector = entry_vector
+        best = max(candidates, key=lambda e: _cosine(vector, e.vector))
+        with self._lock:
+            if _cosine(vector, best.vector) >= self.similarity and best.query in self._patients.get(patient_id, {}):
+                return self._hit(best, "semantic_hit")
+        self._miss()
+        return None
+
+    def store(self, query_text: str, patient_id: str, answer: dict, docs: list, generation: int):
+        """
+        Saves a successful answer built on records_version `generation`. If the
+        records changed meanwhile, lookups see a newer version and skip it.
+        No embedding here: lookup() embeds the question if it ever needs it.
+        """
+        query = normalize_query(query_text)
+        entry = CachedAnswer(patient_id, query, query_text, key_terms(query_text), answer, generation, docs)
+        with self._lock:
+            self._patients.setdefault(patient_id, {})[query] = entry
+            self._lru[(patient_id, query)] = None
+            self._lru.move_to_end((patient_id, query))
+            while len(self._lru) > self.max_entries:
+                old_patient, old_query = next(iter(self._lru))
+                self._drop(old_patient, [old_query])
+
+    def stats(self) -> dict:
+        total = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / total, 3) if total else 0.0,
+            "entries": len(self._lru),
+        }
+
+
+answer_cache = AnswerCache(
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    similarity=settings.ANSWER_CACHE_SIMILARITY,
+)
@@ -0,0 +1,376 @@
+import os
+import csv
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+from langchain_core.documents import Document
+
+from app.core.log import get_logger
+from app.core.clients import AIClients
+from app.core.concurrency import BACKGROUND, model_priority, run_blocking
+from app.core.config import settings
+from app.core.imaging import preprocess_image
+from app.core.uploads import ALLOWED_TYPES
+from app.services.ingest_service import invalidate_answers, split_documents, upsert_embedded
+from app.services.ocr_service import extract_text
+from app.services.vision_service import analyze_xray
+from app.services.job_service import xray_memory_text
+
+logger = get_logger("bulk")
+
+IMAGE_EXTENSIONS = {"." + ext for ext in ALLOWED_TYPES.values()} | {".jpeg"}
+
+
+# --- SOURCES ---
+
+@dataclass
+class BulkItem:
+    path: str
+    patient_id: str
+    file_type: str = "prescription"
+
+
+def iter_directory(root: str, patient_id: Optional[str] = None, file_type: str = "prescription") -> Iterator[BulkItem]:
+    """
+    Walks an archive folder lazily (never lists the whole tree in memory).
+    Without --patient-id the first sub-folder is the patient: archive/<patient_id>/scan.jpg
+    """
+    for folder, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            path = os.path.join(folder, name)
+            owner = patient_id
+            if not owner:
+                parts = os.path.relpath(path, root).split(os.sep)
+                owner = parts[0] if len(parts) > 1 else "unassigned"
+            yield BulkItem(path, owner, file_type)
+
+
+def iter_manifest(manifest: str, file_type: str = "prescription") -> Iterator[BulkItem]:
+    """
+    Reads a CSV (header: path,patient_id[,file_type]) or JSONL manifest line by line.
+    Relative paths are resolved against the manifest's folder.
+    """
+    base = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, "r", encoding="utf-8") as f:
+        rows = (json.loads(line) for line in f if line.strip()) if manifest.endswith(".jsonl") else csv.DictReader(f)
+        for row in rows:
+            yield BulkItem(
+                path=os.path.join(base, row["path"]),
+                patient_id=str(row["patient_id"]),
+                file_type=row.get("file_type") or file_type,
+            )
+
+
+# --- CHECKPOINT ---
+
+class Checkpoint:
+    """
+    SQLite log of finished files, so an interrupted import resumes where it stopped.
+    Only "done" files are skipped; failed ones are retried on the next run.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, patient_id TEXT, sha256 TEXT, status TEXT, "
+            "chunks INTEGER, error TEXT, updated_at REAL)"
+        )
+        self.db.commit()
+
+    def is_done(self, path: str) -> bool:
+        row = self.db.execute("SELECT status FROM files WHERE path = ?", (path,)).fetchone()
+        return bool(row) and row[0] == "done"
+
+    def mark(self, item: BulkItem, status: str, sha256: Optional[str] = None, chunks: int = 0,
+             error: Optional[str] = None):
+        self.db.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (item.path, item.patient_id, sha256, status, chunks, error, time.time()),
+        )
+
+    def commit(self):
+        self.db.commit()
+
+    def counts(self) -> dict:
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM files GROUP BY status").fetchall())
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+# --- PIPELINE ---
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0      # files for read / ocr, chunks for embed / upsert
+    errors: int = 0
+    busy: float = 0.0  # summed worker seconds
+
+
+@dataclass
+class _File:
+    item: BulkItem
+    sha256: str = ""
+    data: Optional[bytes] = None
+    mime_type: str = "image/jpeg"
+    pending: int = 0           # chunks not upserted yet
+    chunks: int = 0
+    failed: bool = False
+
+
+@dataclass
+class _Chunk:
+    file: _File
+    id: str
+    text: str
+    metadata: dict = field(default_factory=dict)
+
+
+class BulkIngestPipeline:
+    """
+    Streams an archive through bounded stages, each with its own worker pool:
+
+        read (disk + hash + preprocess) -> ocr (+ chunk) -> batch -> embed -> upsert
+
+    Queues between stages are bounded, so memory stays flat however large the
+    archive is, and the slowest stage sets the pace. Embedding and upserts run in
+    batches. A file is checkpointed once all of its chunks are upserted.
+    Only vectors are written (no LLM summary, no visit records): it fills the
+    RAG memory for old paper records.
+    """
+
+    def __init__(self, clients: AIClients, checkpoint: Checkpoint,
+                 read_workers: int = settings.BULK_READ_WORKERS,
+                 ocr_workers: int = settings.BULK_OCR_WORKERS,
+                 embed_workers: int = settings.BULK_EMBED_WORKERS,
+                 embed_batch: int = settings.BULK_EMBED_BATCH,
+                 upsert_batch: int = settings.BULK_UPSERT_BATCH):
+        self.clients = clients
+        self.checkpoint = checkpoint
+        self.read_workers = read_workers
+        self.ocr_workers = ocr_workers
+        self.embed_workers = embed_workers
+        self.embed_batch = embed_batch
+        self.upsert_batch = upsert_batch
+        self.stats = {name: StageStats(name) for name in ("read", "ocr", "embed", "upsert")}
+        self.skipped = 0
+        self.done = 0
+        self.failed = 0
+        self.started = 0.0
+
+    # --- STAGE WORK ---
+
+    async def _read(self, f: _File) -> list:
+        data = await asyncio.to_thread(_read_bytes, f.item.path)
+        f.sha256 = hashlib.sha256(data).hexdigest()
+        image = await preprocess_image(data, f.item.file_type)
+        f.data, f.mime_type = image.data, image.mime_type
+        return [f]
+
+    async def _ocr(self, f: _File) -> list:
+        filename = os.path.basename(f.item.path)
+        if f.item.file_type == "xray":
+            result = await analyze_xray(f.data, filename, self.clients, mime_type=f.mime_type)
+            if result.get("status") == "error":
+                raise RuntimeError(result.get("message"))
+            text = xray_memory_text(filename, result.get("analysis", {}))
+        else:
+            text = (await extract_text(f.data, f.mime_type, self.clients))["text"]
+        f.data = None  # the image isn't needed past OCR
+
+        # Deterministic ids: re-importing the same scan overwrites its vectors
+        file_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{f.item.patient_id}:{f.sha256}"))
+        doc = Document(page_content=text, metadata={
+            "source": filename,
+            "file_id": file_id,
+            "patient_id": f.item.patient_id,
+            "type": f.item.file_type,
+            "upload_timestamp": time.time(),
+        })
+        chunks = [c for c in split_documents([doc]) if c.page_content.strip()]
+        f.pending = f.chunks = len(chunks)
+        if not chunks:
+            self._finish(f)
+            return []
+        return [_Chunk(f, f"{file_id}-{c.metadata['chunk']}", c.page_content, c.metadata) for c in chunks]
+
+    async def _embed(self, batch: list) -> list:
+        vectors = await asyncio.to_thread(self.clients.embeddings.embed_documents, [c.text for c in batch])
+        return [(batch, vectors)]
+
+    async def _upsert(self, embedded: tuple) -> list:
+        batch, vectors = embedded
+        for i in range(0, len(batch), self.upsert_batch):
+            part = batch[i:i + self.upsert_batch]
+            await run_blocking(
+                "vector", upsert_embedded, self.clients,
+                [c.id for c in part], vectors[i:i + self.upsert_batch],
+                [c.text for c in part], [c.metadata for c in part],
+            )
+        await invalidate_answers([c.metadata for c in batch])
+        for c in batch:
+            c.file.pending -= 1
+            if c.file.pending == 0:
+                self._finish(c.file)
+        self.checkpoint.commit()
+        return []
+
+    # --- BOOKKEEPING ---
+
+    def _finish(self, f: _File):
+        if f.failed:
+            return
+        self.checkpoint.mark(f.item, "done", f.sha256, f.chunks)
+        self.done += 1
+
+    def _fail(self, stage: str, work, error: Exception):
+        for f in _files_of(work):
+            if f.failed:
+                continue
+            f.failed = True
+            f.data = None
+            self.failed += 1
+            self.checkpoint.mark(f.item, "failed", f.sha256 or None, f.chunks, f"{stage}: {error}")
+            logger.error(f"❌ {stage} failed for {f.item.path}: {error}")
+        self.checkpoint.commit()
+
+    # --- WIRING ---
+
+    async def _stage(self, name: str, fn, inbox: asyncio.Queue, outbox: Optional[asyncio.Queue],
+                     workers: int, downstream: int):
+        stats = self.stats[name]
+
+        async def worker():
+            while (work := await inbox.get()) is not None:
+                start = time.perf_counter()
+                try:
+                    results = await fn(work)
+                    stats.items += _size(work)
+                except Exception as e:
+                    stats.errors += 1
+                    self._fail(name, work, e)
+                    results = []
+                finally:
+                    stats.busy += time.perf_counter() - start
+                for result in results:
+                    await outbox.put(result)
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        for _ in range(downstream):
+            await outbox.put(None)
+
+    async def _batcher(self, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        """Groups chunks from many files into embed_batch-sized embedding calls."""
+        batch = []
+        while True:
+            try:
+                chunk = await asyncio.wait_for(inbox.get(), timeout=1.0)
+            except asyncio.TimeoutError:
+                chunk = _FLUSH  # upstream is slow: don't hold a partial batch forever
+            if chunk is None:
+                break
+            if chunk is not _FLUSH:
+                batch.append(chunk)
+            if batch and (len(batch) >= self.embed_batch or chunk is _FLUSH):
+                await outbox.put(batch)
+                batch = []
+        if batch:
+            await outbox.put(batch)
+        for _ in range(self.embed_workers):
+            await outbox.put(None)
+
+    async def _feed(self, items, outbox: asyncio.Queue):
+        for item in items:
+            if self.checkpoint.is_done(item.path):
+                self.skipped += 1
+                continue
+            await outbox.put(_File(item))
+        for _ in range(self.read_workers):
+            await outbox.put(None)
+
+    async def _progress(self, every: float):
+        while True:
+            await asyncio.sleep(every)
+            elapsed = time.perf_counter() - self.started
+            logger.info(f"⏳ {self.done} files done, {self.failed} failed, {self.skipped} skipped "
+                  f"({self.done / elapsed:.2f} files/s)")
+
+    async def run(self, items, progress_every: float = 10.0) -> dict:
+        """Runs the whole import; returns the per-stage report."""
+        to_read = asyncio.Queue(maxsize=self.read_workers * 2)
+        to_ocr = asyncio.Queue(maxsize=self.ocr_workers * 2)
+        to_batch = asyncio.Queue(maxsize=self.embed_batch * 2)
+        to_embed = asyncio.Queue(maxsize=self.embed_workers * 2)
+        to_upsert = asyncio.Queue(maxsize=self.embed_workers * 2)
+
+        self.started = time.perf_counter()
+        reporter = asyncio.create_task(self._progress(progress_every))
+        try:
+            with model_priority(BACKGROUND):  # stage tasks inherit it; chat keeps its share of the quota
+                await asyncio.gather(
+                    self._feed(items, to_read),
+                    self._stage("read", self._read, to_read, to_ocr, self.read_workers, self.ocr_workers),
+                    self._stage("ocr", self._ocr, to_ocr, to_batch, self.ocr_workers, 1),
+                    self._batcher(to_batch, to_embed),
+                    self._stage("embed", self._embed, to_embed, to_upsert, self.embed_workers, 1),
+                    self._stage("upsert", self._upsert, to_upsert, None, 1, 0),
+                )
+        finally:
+            reporter.cancel()
+            self.checkpoint.commit()
+        return self.report()
+
+    def report(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "files_done": self.done,
+            "files_failed": self.failed,
+            "files_skipped": self.skipped,
+            "files_per_s": round(self.done / elapsed, 3) if elapsed else 0.0,
+            "stages": {
+                s.name: {
+                    "items": s.items,
+                    "errors": s.errors,
+                    "busy_s": round(s.busy, 2),
+                    "avg_ms": round(s.busy / s.items * 1000, 1) if s.items else 0.0,
+                    "per_s": round(s.items / elapsed, 2) if elapsed else 0.0,
+                }
+                for s in self.stats.values()
+            },
+        }
+
+
+_FLUSH = object()
+
+
+def _files_of(work) -> list:
+    """The files behind one unit of stage work (file, chunk batch or embedded batch)."""
+    if isinstance(work, _File):
+        return [work]
+    chunks = work[0] if isinstance(work, tuple) else work
+    return list({id(c.file): c.file for c in chunks}.values())
+
+
+def _size(work) -> int:
+    if isinstance(work, _File):
+        return 1
+    return len(work[0] if isinstance(work, tuple) else work)
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from app.core.log import get_logger
+from app.core.config import settings
+from app.core.metrics import CACHE_REQUESTS
+from app.models import AnalysisCache
+from app.services import ingest_service, vision_service
+
+logger = get_logger("cache")
+
+
+def current_prompt_version(file_type: str) -> str:
+    """Prompt version of the pipeline that handles this file type."""
+    if file_type == "xray":
+        return vision_service.PROMPT_VERSION
+    return ingest_service.prompt_version()
+
+
+def cache_key(sha256: str, file_type: str) -> str:
+    return f"{sha256}:{file_type}:{current_prompt_version(file_type)}"
+
+
+class AnalysisCacheService:
+    """
+    Persistent dedup cache for the upload pipeline, keyed by
+    content hash + analysis type + prompt version.
+    """
+
+    # Run eviction every N new entries instead of on every insert
+    EVICT_EVERY = 100
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    async def lookup(self, sha256: Optional[str], file_type: str) -> Optional[AnalysisCache]:
+        if not sha256:
+            return None
+        entry = await AnalysisCache.find_one(AnalysisCache.key == cache_key(sha256, file_type))
+        if not entry:
+            self.misses += 1
+            CACHE_REQUESTS.inc(cache="analysis", result="miss")
+            return None
+
+        self.hits += 1
+        CACHE_REQUESTS.inc(cache="analysis", result="hit")
+        await entry.set({"last_used_at": datetime.now(), "hits": entry.hits + 1})
+        return entry
+
+    async def store(self, sha256: Optional[str], file_type: str, patient_id: str, result: dict):
+        """
+        Saves a successful analysis. `result` is what job_service.analyze_file returns.
+        """
+        if not sha256:
+            return
+        key = cache_key(sha256, file_type)
+        if await AnalysisCache.find_one(AnalysisCache.key == key):
+            return
+
+        try:
+            await AnalysisCache(
+                key=key,
+                sha256=sha256,
+                file_type=file_type,
+                prompt_version=current_prompt_version(file_type),
+                patient_id=patient_id,
+                file_id=result["file_id"],
+                ai_summary=result["ai_summary"],
+                chat_text=result["chat_text"],
+                extracted_text=result.get("extracted_text") or "",
+            ).insert()
+        except DuplicateKeyError:
+            return  # another worker cached the same file first
+
+        self.stores += 1
+        if self.stores % self.EVICT_EVERY == 0:
+            await self.evict()
+
+    async def evict(self) -> int:
+        """
+        Drops entries unused for ANALYSIS_CACHE_TTL_DAYS, then the least recently
+        used ones above ANALYSIS_CACHE_MAX_ENTRIES. Returns how many were removed.
+        """
+        cutoff = datetime.now() - timedelta(days=settings.ANALYSIS_CACHE_TTL_DAYS)
+        result = await AnalysisCache.find(AnalysisCache.last_used_at < cutoff).delete()
+        removed = result.deleted_count if result else 0
+
+        overflow = await AnalysisCache.count() - settings.ANALYSIS_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            oldest = await AnalysisCache.find_all().sort(+AnalysisCache.last_used_at).limit(overflow).to_list()
+            ids = [entry.id for entry in oldest]
+            result = await AnalysisCache.find({"_id": {"$in": ids}}).delete()
+            removed += result.deleted_count if result else 0
+
+        if removed:
+            logger.info(f"🧹 Analysis cache evicted {removed} entries")
+        return removed
+
+    async def purge_stale_prompts(self) -> int:
+        """
+        Deletes entries made with an older prompt version (they can never hit again).
+        """
+        removed = 0
+        for query in (
+            {"file_type": "xray", "prompt_version": {"$ne": vision_service.PROMPT_VERSION}},
+            {"file_type": {"$ne": "xray"}, "prompt_version": {"$ne": ingest_service.prompt_version()}},
+        ):
+            result = await AnalysisCache.find(query).delete()
+            removed += result.deleted_count if result else 0
+        if removed:
+            logger.info(f"🧹 Analysis cache dropped {removed} entries from old prompt versions")
+        return removed
+
+    async def invalidate(self, file_type: Optional[str] = None) -> int:
+        """
+        Manually clears the cache (all entries, or one file type).
+        """
+        query = AnalysisCache.find(AnalysisCache.file_type == file_type) if file_type else AnalysisCache.find_all()
+        result = await query.delete()
+        return result.deleted_count if result else 0
+
+    async def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "entries": await AnalysisCache.count(),
+            "prompt_versions": {
+                "xray": vision_service.PROMPT_VERSION,
+                "prescription": ingest_service.prompt_version(),
+            },
+        }
+
+
+analysis_cache = AnalysisCacheService()
@@ -1,58 +1,170 @@
-import os
+import asyncio
 import time
 import uuid
-import base64
 import json
-from pydantic import SecretStr
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
-from langchain_core.documents import Document
-from langchain_core.messages import HumanMessage
-from dotenv import load_dotenv
-
-load_dotenv()
-
-# Setup Models
-vision_llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    api_key=SecretStr(os.getenv("GOOGLE_API_KEY") or "")
-)
-
-summary_llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0.3,
-    api_key=SecretStr(os.getenv("GOOGLE_API_KEY") or "")
-)
-
-#
-embeddings = GoogleGenerativeAIEmbeddings(
-    model="models/text-embedding-004",
-    google_api_key=SecretStr(os.getenv("GOOGLE_API_KEY") or "") # <--- THE MISSING PIECE
-)
+from typing import TYPE_CHECKING
+
+from app.core.log import get_logger
+from app.core.clients import AIClients
+from app.core.concurrency import call_model, run_blocking
+from app.core.config import settings
+from app.core.metrics import span
+from app.services.answer_cache import answer_cache
+from app.services.ocr_service import extract_text
+
+logger = get_logger("ingest")
+
+if TYPE_CHECKING:  # langchain_core is imported on first use (keeps app import fast)
+    from langchain_core.documents import Document
+
+# Bump whenever the OCR / summary prompts change: cached analyses
+# made with an older prompt are ignored and purged (see cache_service).
+PROMPT_VERSION = "rx-v1"
+
+
+def prompt_version() -> str:
+    """
+    Version of the prompts in use. PRESCRIPTION_EXTRACTION_MODE="single" runs
+    a different prompt (EXTRACTION_PROMPT), so its analyses are cached apart.
+    """
+    if settings.PRESCRIPTION_EXTRACTION_MODE == "single":
+        return f"{PROMPT_VERSION}-single"
+    return PROMPT_VERSION
+
+_splitter = None
+
+def _get_splitter():
+    global _splitter
+    if _splitter is None:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        _splitter = RecursiveCharacterTextSplitter(
+            chunk_size=settings.CHUNK_SIZE,
+            chunk_overlap=settings.CHUNK_OVERLAP,
+        )
+    return _splitter
+
+def split_documents(docs: list["Document"]) -> list["Document"]:
+    """
+    Splits long OCR text into overlapping chunks (one vector each), so a
+    multi-page report isn't squashed into a single embedding.
+    Every chunk keeps the file's metadata plus its "chunk" number.
+    """
+    from langchain_core.documents import Document
+
+    chunks = []
+    for doc in docs:
+        for i, text in enumerate(_get_splitter().split_text(doc.page_content) or [doc.page_content]):
+            chunks.append(Document(page_content=text, metadata={**doc.metadata, "chunk": i}))
+    return chunks
+
+def chunk_id(metadata: dict) -> str:
+    """Vector / keyword index id of one chunk (same scheme as bulk ingestion)."""
+    return f"{metadata.get('file_id')}-{metadata.get('chunk', 0)}"
+
+async def store_documents(docs: list["Document"], clients: AIClients):
+    """
+    Chunks, embeds + upserts documents in ONE vector store call
+    (the embedding cache sends all misses as a single batch),
+    adds the same chunks to the local keyword index and drops the
+    patients' cached chat answers.
+    Ids come from file_id + chunk number, so storing a file again
+    (a retried job) overwrites its chunks instead of duplicating them.
+    """
+    if docs:
+        chunks = split_documents(docs)
+        ids = [chunk_id(chunk.metadata) for chunk in chunks]
+        with span("vector.upsert", chunks=len(chunks)):
+            await run_blocking("vector", clients.vectorstore.add_documents, chunks, ids=ids)
+        if clients.keyword_index:
+            with span("keyword.index", chunks=len(chunks)):
+                await asyncio.to_thread(clients.keyword_index.add_documents, chunks)
+        await invalidate_answers([chunk.metadata for chunk in chunks])
+
+async def invalidate_answers(metadatas: list[dict]):
+    """Cached chat answers of these patients no longer cover all their records."""
+    for patient_id in {meta.get("patient_id") for meta in metadatas if meta.get("patient_id")}:
+        await answer_cache.invalidate(patient_id)
+
+def upsert_embedded(clients: AIClients, ids: list[str], vectors: list[list[float]],
+                    texts: list[str], metadatas: list[dict]):
+    """
+    Writes already-embedded chunks (bulk ingestion embeds in its own stage).
+    Blocking; run it with run_blocking("vector", ...), then await invalidate_answers().
+    Ids are deterministic, so re-running a batch overwrites instead of duplicating.
+    """
+    from app.core.vectorstore import LocalVectorStore
+
+    store = clients.vectorstore
+    if isinstance(store, LocalVectorStore):
+        store.add_embeddings(texts, vectors, metadatas, ids)
+    else:
+        # Same record shape PineconeVectorStore.add_texts writes (text under "text")
+        clients.pinecone_index.upsert(vectors=[
+            (id_, vector, {**meta, "text": text})
+            for id_, vector, text, meta in zip(ids, vectors, texts, metadatas)
+        ])
+    if clients.keyword_index:
+        clients.keyword_index.add(ids, texts, metadatas)
+
+async def summarize_text(extracted_text: str, clients: AIClients) -> dict:
+    """Second call of the two-call path: OCR text -> structured JSON summary."""
+    logger.info("🧠 Generating Instant Summary...")
+    
+    summary_prompt = f"""
+    You are an expert medical AI. Analyze the following extracted medical text.
+    
+    EXTRACTED TEXT:
+    {extracted_text}
+    
+    OUTPUT FORMAT (JSON):
+    - "patient_summary": "Brief summary...",
+    - "differential_diagnoses": [
+        "1. Most likely: [Condition] (Reason)",
+        "2. Potential alternative: [Condition] (Reason)"
+    ],
+    - "medicines": ["List of medicines..."],
+    - "advice": "Non-medicine advice..."
+    """
+    
+    with span("llm.summary"):
+        summary_response = await call_model("llm", lambda: clients.summary_llm.ainvoke(summary_prompt))
+    content = summary_response.content
+    if isinstance(content, list):
+        content = " ".join(str(item) for item in content)
+    clean_json_text = content.replace("```json", "").replace("```", "").strip()
+    
+    try:
+        parsed_summary = json.loads(clean_json_text)
+    except:
+        parsed_summary = {
+            "patient_summary": "Analysis complete.", 
+            "diagnosis": "See text", 
+            "medicines": [],
+            "raw_text": clean_json_text
+        }
+
+    return parsed_summary
 
 # --- UPDATE: Accept patient_id ---
-async def process_upload(file_bytes: bytes, filename: str, patient_id: str | None = None):
+# store=False: skip the upsert and return the Document in result["documents"]
+# so a caller (batch upload) can upsert many files at once.
+# file_id: pass a stable id (the ingest job's) so a retry overwrites the same vectors.
+async def process_upload(file_bytes: bytes, filename: str, clients: AIClients, patient_id: str | None = None,
+                         mime_type: str = "image/jpeg", store: bool = True, file_id: str | None = None):
     try:
-        print(f"👀 Reading file: {filename}...")
+        logger.info(f"👀 Reading file: {filename}...")
         
-        # --- STEP 1: OCR (Read Image) ---
-        image_b64 = base64.b64encode(file_bytes).decode("utf-8")
-        
-        ocr_message = HumanMessage(
-            content=[
-                {"type": "text", "text": "Transcribe this medical document exactly. Output ONLY the text found."},
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"}}
-            ]
-        )
-        
-        ai_response = vision_llm.invoke([ocr_message])
-        extracted_text = ai_response.content
-        if isinstance(extracted_text, list):
-            extracted_text = " ".join(str(item) for item in extracted_text)
-        print(f"✅ Text Extracted ({len(extracted_text)} chars)")
+        # --- STEP 1: OCR (Tesseract fast path, vision LLM for handwriting) ---
+        # "single" mode: the vision LLM tier also returns the summary in the same call
+        single_call = settings.PRESCRIPTION_EXTRACTION_MODE == "single"
+        with span("ocr", file=filename):
+            ocr = await extract_text(file_bytes, mime_type, clients, structured=single_call)
+        extracted_text = ocr["text"]
+        logger.info(f"✅ Text Extracted ({len(extracted_text)} chars via {ocr['engine']})")
 
         # --- STEP 2: Save to Brain (Pinecone) ---
-        file_id = str(uuid.uuid4())
+        from langchain_core.documents import Document
+        file_id = file_id or str(uuid.uuid4())
         
         # LOGIC: If App sends a patient_id, use it. If not, use file_id as a fallback.
         final_patient_id = patient_id if patient_id else file_id
@@ -67,92 +179,67 @@ async def process_upload(file_bytes: bytes, filename: str, patient_id: str | Non
             }
         )
 
-        vectorstore = PineconeVectorStore(
-            index_name=os.getenv("PINECONE_INDEX_NAME"),
-            embedding=embeddings
-        )
-        vectorstore.add_documents([doc])
-        print(f"💾 Memorized with ID: {file_id} (Patient: {final_patient_id})")
+        if store:
+            await store_documents([doc], clients)
+            logger.info(f"💾 Memorized with ID: {file_id} (Patient: {final_patient_id})")
 
-        # --- STEP 3: Auto-Generate Summary ---
-        print("🧠 Generating Instant Summary...")
-        
-        summary_prompt = f"""
-        You are an expert medical AI. Analyze the following extracted medical text.
-        
-        EXTRACTED TEXT:
-        {extracted_text}
-        
-        OUTPUT FORMAT (JSON):
-        - "patient_summary": "Brief summary...",
-        - "differential_diagnoses": [
-            "1. Most likely: [Condition] (Reason)",
-            "2. Potential alternative: [Condition] (Reason)"
-        ],
-        - "medicines": ["List of medicines..."],
-        - "advice": "Non-medicine advice..."
-        """
-        
-        summary_response = summary_llm.invoke(summary_prompt)
-        content = summary_response.content
-        if isinstance(content, list):
-            content = " ".join(str(item) for item in content)
-        clean_json_text = content.replace("```json", "").replace("```", "").strip()
-        
-        try:
-            parsed_summary = json.loads(clean_json_text)
-        except:
-            parsed_summary = {
-                "patient_summary": "Analysis complete.", 
-                "diagnosis": "See text", 
-                "medicines": [],
-                "raw_text": clean_json_text
-            }
+        # --- STEP 3: Auto-Generate Summary (skipped if the OCR call already made it) ---
+        parsed_summary = ocr.get("analysis")
+        if parsed_summary is None:
+            parsed_summary = await summarize_text(extracted_text, clients)
 
         return {
             "status": "success",
             "file_id": file_id,
             "patient_id": final_patient_id, # Return this so App can track session
             "extracted_text_preview": extracted_text[:100] + "...",
-            "analysis": parsed_summary
+            "extracted_text": extracted_text,
+            "ocr_engine": ocr["engine"],
+            "ocr_confidence": ocr["confidence"],
+            "analysis": parsed_summary,
+            "documents": [] if store else [doc]
         }
 
     except Exception as e:
-        print(f"❌ Error in processing: {e}")
+        logger.error(f"❌ Error in processing: {e}")
         return {"status": "error", "message": str(e)}
 
+def build_report_document(text_summary: str, filename: str, patient_id: str, file_id: str | None = None) -> "Document":
+    """
+    Wraps a text summary (like an X-Ray finding) as a Document for the vector store.
+    """
+    from langchain_core.documents import Document
+
+    return Document(
+        page_content=text_summary,
+        metadata={
+            "source": filename,
+            "file_id": file_id or str(uuid.uuid4()),
+            "patient_id": patient_id, # Link to Patient
+            "type": "medical_report",
+            "upload_timestamp": time.time()
+        }
+    )
+
 # ADD THIS FUNCTION AT THE END OF THE FILE
-async def memorize_report(text_summary: str, filename: str, patient_id: str):
+async def memorize_report(text_summary: str, filename: str, patient_id: str, clients: AIClients,
+                          file_id: str | None = None):
     """
     Manually saves a text summary (like an X-Ray finding) into Pinecone.
     This allows RAG to answer questions about X-Rays.
     """
     try:
-        # 1. Create a unique ID
-        file_id = str(uuid.uuid4())
-        
-        # 2. Prepare the Document
-        doc = Document(
-            page_content=text_summary,
-            metadata={
-                "source": filename,
-                "file_id": file_id,
-                "patient_id": patient_id, # Link to Patient
-                "type": "medical_report",
-                "upload_timestamp": time.time()
-            }
-        )
+        # 1. Prepare the Document (with a unique ID)
+        doc = build_report_document(text_summary, filename, patient_id, file_id)
+        file_id = doc.metadata["file_id"]
 
-        # 3. Push to Pinecone
-        vectorstore = PineconeVectorStore(
-            index_name=os.getenv("PINECONE_INDEX_NAME"),
-            embedding=embeddings
-        )
-        vectorstore.add_documents([doc])
+        # 2. Push to Pinecone (shared client, no per-call setup)
+        with span("memorize_report"):
+            await store_documents([doc], clients)
         
-        print(f"💾 Manually Memorized Report: {file_id}")
+        logger.info(f"💾 Manually Memorized Report: {file_id}")
         return file_id
 
     except Exception as e:
-        print(f"❌ Failed to memorize report: {e}")
+        logger.error(f"❌ Failed to memorize report: {e}")
         return None
\ No newline at end of file
@@ -0,0 +1,493 @@
+import os
+import uuid
+import socket
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from app.core.log import get_logger
+from app.core.clients import AIClients
+from app.core.concurrency import BACKGROUND, model_priority
+from app.core.config import settings
+from app.core.imaging import preprocess_image
+from app.core.metrics import span
+from app.models import IngestJob, VisitFile, ChatMessage, AnalysisCache
+from app.services.cache_service import analysis_cache
+from app.services.ingest_service import process_upload, memorize_report, build_report_document, store_documents
+from app.services.vision_service import analyze_xray
+from app.services.summary_service import summary_updater
+
+logger = get_logger("jobs")
+
+
+class AnalysisError(Exception):
+    """Raised when the AI pipeline fails for a file (the job may be retried)."""
+
+
+def xray_memory_text(filename: str, ai_summary: dict) -> str:
+    """The sentence an X-ray finding is memorized as (what RAG reads later)."""
+    return (f"X-Ray Analysis of {filename}: Found {ai_summary.get('finding')} in {ai_summary.get('location')}. "
+            f"Severity is {ai_summary.get('severity')}.")
+
+
+async def analyze_file(content: bytes, filename: str, file_type: str, patient_id: str, clients: AIClients,
+                       mime_type: str | None = None, store: bool = True, file_id: str | None = None):
+    """
+    Shrinks the image, routes it to the correct AI (Vision vs Ingest) and memorizes it.
+    Returns {"file_id", "ai_summary", "chat_text", "extracted_text", "ocr_engine", "ocr_confidence", "documents"}.
+    With store=False nothing is upserted; the vector documents are returned in
+    "documents" so the caller can upsert a whole batch at once.
+    file_id (default: a new uuid) keys the vectors; a retry with the same id overwrites them.
+    """
+    # Downscale / rotate / re-encode off the event loop (smaller payload = faster, cheaper call)
+    with span("image.preprocess", file_type=file_type):
+        image = await preprocess_image(content, file_type, mime_type)
+    content = image.data
+
+    if file_type == "xray":
+        # --- X-RAY FLOW ---
+        ai_result = await analyze_xray(content, filename, clients, mime_type=image.mime_type)
+        if ai_result.get("status") == "error":
+            raise AnalysisError(ai_result.get("message"))
+        ai_summary = ai_result.get("analysis", {})
+
+        # Create a chat-friendly string
+        chat_text = (
+            f"🩻 **X-Ray Analysis**\n"
+            f"**Finding:** {ai_summary.get('finding', 'Unknown')}\n"
+            f"**Severity:** {ai_summary.get('severity', 'Unknown')}\n"
+            f"**Location:** {ai_summary.get('location', 'Unknown')}"
+        )
+
+        # === MEMORIZE THIS INTO PINECONE ===
+        # We convert the JSON finding into a sentence so RAG can read it later.
+        memory_text = xray_memory_text(filename, ai_summary)
+        if store:
+            saved_id = await memorize_report(memory_text, filename, patient_id, clients, file_id=file_id)
+            if not saved_id:  # memorize_report logs and returns None on failure
+                raise AnalysisError("failed to store report")
+            documents = []
+        else:
+            doc = build_report_document(memory_text, filename, patient_id, file_id)
+            saved_id = doc.metadata["file_id"]
+            documents = [doc]
+        extracted_text = memory_text
+        ocr_engine, ocr_confidence = None, None
+
+    else:
+        # --- PRESCRIPTION FLOW ---
+        ai_result = await process_upload(content, filename, clients, patient_id=patient_id,
+                                         mime_type=image.mime_type, store=store, file_id=file_id)
+        if ai_result.get("status") == "error":
+            raise AnalysisError(ai_result.get("message"))
+        ai_summary = ai_result.get("analysis", {})
+        saved_id = ai_result.get("file_id") # process_upload already generates an ID
+        extracted_text = ai_result.get("extracted_text", "")
+        ocr_engine, ocr_confidence = ai_result.get("ocr_engine"), ai_result.get("ocr_confidence")
+        documents = ai_result.get("documents", [])
+
+        # Create a chat-friendly string
+        chat_text = (
+            f"📄 **Prescription Digitized**\n"
+            f"**Summary:** {ai_summary.get('patient_summary', 'Processed')}\n"
+            f"**Medicines:** {', '.join(ai_summary.get('medicines', []))}"
+        )
+
+    return {
+        "file_id": saved_id,
+        "ai_summary": ai_summary,
+        "chat_text": chat_text,
+        "extracted_text": extracted_text,
+        "ocr_engine": ocr_engine,
+        "ocr_confidence": ocr_confidence,
+        "documents": documents,
+    }
+
+
+async def reuse_cached_analysis(entry: AnalysisCache, filename: str, patient_id: str, clients: AIClients,
+                                store: bool = True, file_id: str | None = None):
+    """
+    Builds an analyze_file()-style result from a dedup cache hit.
+    Same patient: the existing vectors are reused, no model calls at all.
+    Other patient: only the cached text is embedded under this patient's id
+    (vectors are filtered per patient, so they can't be shared), keyed by
+    `file_id` when given.
+    """
+    documents = []
+    if entry.patient_id == patient_id:
+        file_id = entry.file_id
+    else:
+        if store:
+            file_id = await memorize_report(entry.extracted_text, filename, patient_id, clients, file_id=file_id)
+            if not file_id:
+                raise AnalysisError("failed to store report")
+        else:
+            doc = build_report_document(entry.extracted_text, filename, patient_id, file_id)
+            file_id = doc.metadata["file_id"]
+            documents = [doc]
+
+    return {
+        "file_id": file_id,
+        "ai_summary": entry.ai_summary,
+        "chat_text": entry.chat_text,
+        "extracted_text": entry.extracted_text,
+        "ocr_engine": "cache",
+        "ocr_confidence": None,
+        "documents": documents,
+    }
+
+
+# Running batches (kept referenced so they finish even if the client disconnects)
+_batches: set[asyncio.Task] = set()
+
+
+async def analyze_batch(uploads: list, visit_id: str, patient_id: str, clients: AIClients):
+    """
+    Analyzes many files of one visit concurrently (BATCH_CONCURRENCY at a time).
+    `uploads` is a list of (StoredUpload, file_type) already saved to disk; each
+    file is read back inside its concurrency slot and dropped once analyzed.
+
+    Yields one event per file as soon as it finishes, then - after the last one -
+    does ONE vector upsert for the whole batch and ONE insert each for the file
+    records and chat messages, and yields a final "saved" event.
+    The work runs in its own task, so a dropped connection doesn't lose it.
+    """
+    events: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(_run_batch(events, uploads, visit_id, patient_id, clients))
+    _batches.add(task)
+    task.add_done_callback(_batches.discard)
+
+    while True:
+        event = await events.get()
+        if event is None:
+            break
+        yield event
+
+
+async def _run_batch(events: asyncio.Queue, uploads: list, visit_id: str, patient_id: str, clients: AIClients):
+    semaphore = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
+
+    async def run_one(index, stored, file_type):
+        async with semaphore:
+            cached = None
+            try:
+                cached = await analysis_cache.lookup(stored.sha256, file_type)
+                if cached:
+                    result = await reuse_cached_analysis(cached, stored.filename, patient_id, clients, store=False)
+                else:
+                    content = await asyncio.to_thread(_read_file, stored.path)
+                    result = await analyze_file(content, stored.filename, file_type, patient_id, clients,
+                                                mime_type=stored.mime_type, store=False)
+                error = None
+            except Exception as e:
+                logger.error(f"❌ AI Failed on {stored.filename}: {e}")
+                result = {
+                    "file_id": "error",
+                    "ai_summary": {"error": str(e)},
+                    "chat_text": "❌ I encountered an error analyzing this file.",
+                    "documents": [],
+                }
+                error = str(e)
+            return index, stored, file_type, result, cached is not None, error
+
+    try:
+        finished = []
+        tasks = [run_one(i, stored, file_type) for i, (stored, file_type) in enumerate(uploads)]
+        for next_done in asyncio.as_completed(tasks):
+            index, stored, file_type, result, cache_hit, error = await next_done
+            finished.append((index, stored, file_type, result, cache_hit, error))
+            await events.put({
+                "index": index,
+                "filename": stored.filename,
+                "file_type": file_type,
+                "status": "error" if error else "processed",
+                "ai_summary": result["ai_summary"],
+                "chat_message": result["chat_text"],
+                "cache_hit": cache_hit,
+            })
+        finished.sort(key=lambda f: f[0])
+
+        # --- ONE upsert for every vector in the batch ---
+        documents = [doc for f in finished for doc in f[3]["documents"]]
+        memorize_error = None
+        try:
+            await store_documents(documents, clients)
+        except Exception as e:
+            logger.error(f"❌ Batch memorize failed: {e}")
+            memorize_error = str(e)
+
+        # Only cache analyses whose vectors actually exist
+        if not memorize_error:
+            for _, stored, file_type, result, cache_hit, error in finished:
+                if not error and not cache_hit:
+                    await analysis_cache.store(stored.sha256, file_type, patient_id, result)
+
+        # --- ONE write for all file records, ONE for all chat messages ---
+        await VisitFile.insert_many([
+            VisitFile(
+                visit_id=visit_id,
+                patient_id=patient_id,
+                file_id=result["file_id"] or str(uuid.uuid4()),
+                filename=stored.filename,
+                file_type=file_type,
+                local_path=stored.path,
+                ai_summary=result["ai_summary"],
+                sha256=stored.sha256,
+                ocr_engine=result.get("ocr_engine"),
+                ocr_confidence=result.get("ocr_confidence")
+            )
+            for _, stored, file_type, result, _, _ in finished
+        ])
+        await ChatMessage.insert_many([
+            ChatMessage(visit_id=visit_id, patient_id=patient_id, sender="ai", text=result["chat_text"])
+            for _, _, _, result, _, _ in finished
+        ])
+
+        summary_updater.schedule(clients, patient_id)
+
+        await events.put({
+            "status": "saved",
+            "files": len(finished),
+            "errors": sum(1 for f in finished if f[5]),
+            "vectors": len(documents),
+            "memorize_error": memorize_error,
+        })
+    except Exception as e:
+        logger.error(f"❌ Batch upload failed: {e}")
+        await events.put({"status": "error", "message": str(e)})
+    finally:
+        await events.put(None)
+
+
+async def _insert_once(document):
+    try:
+        await document.insert()
+    except DuplicateKeyError:
+        pass  # saved by an earlier run of the same job
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class IngestQueue:
+    """
+    In-process worker pool for uploaded files.
+    Mongo (IngestJob) is the source of truth; the asyncio.Queue only carries job ids,
+    so on restart every queued job is simply re-enqueued.
+
+    A running job is leased: `owner` names the process running it and
+    `updated_at` is its heartbeat. With several server processes, only jobs
+    whose heartbeat is older than INGEST_LEASE_SECONDS (the owner died) are
+    taken back - never one another process is still working on.
+    """
+
+    def __init__(self):
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._workers: list[asyncio.Task] = []
+        self._clients: Optional[AIClients] = None
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    async def start(self, clients: AIClients):
+        self._clients = clients
+        await analysis_cache.purge_stale_prompts()
+        await analysis_cache.evict()
+        await self.resume()
+        for i in range(settings.INGEST_WORKERS):
+            self._workers.append(asyncio.create_task(self._worker(i)))
+        self._workers.append(asyncio.create_task(self._reaper()))
+        logger.info(f"👷 Ingestion workers started: {settings.INGEST_WORKERS}")
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    async def resume(self):
+        """
+        Re-enqueue work that was queued (or interrupted mid-run) before a restart.
+        """
+        await self._reclaim_stale()
+        pending = await IngestJob.find(IngestJob.status == "queued").sort(+IngestJob.created_at).to_list()
+        for job in pending:
+            self._queue.put_nowait(str(job.id))
+        if pending:
+            logger.info(f"🔁 Resumed {len(pending)} ingestion jobs")
+
+    async def _reclaim_stale(self) -> list[str]:
+        """Running jobs whose owner stopped heartbeating -> queued again. Returns their ids."""
+        cutoff = datetime.now() - timedelta(seconds=settings.INGEST_LEASE_SECONDS)
+        stale = await IngestJob.find(IngestJob.status == "running", IngestJob.updated_at < cutoff).to_list()
+        reclaimed = []
+        for job in stale:
+            # Conditional on the same heartbeat: a job that just came back to life is left alone
+            result = await IngestJob.find_one(
+                IngestJob.id == job.id, IngestJob.status == "running", IngestJob.updated_at == job.updated_at
+            ).update({"$set": {"status": "queued", "stage": "resumed", "owner": None}})
+            if result and result.modified_count == 1:
+                logger.warning(f"⚠️ Reclaimed job {job.id} from {job.owner} (lease expired)")
+                reclaimed.append(str(job.id))
+        return reclaimed
+
+    async def _reaper(self):
+        """Periodically takes back jobs of worker processes that died mid-run."""
+        while True:
+            await asyncio.sleep(settings.INGEST_LEASE_SECONDS / 2)
+            try:
+                for job_id in await self._reclaim_stale():
+                    self._queue.put_nowait(job_id)
+            except Exception as e:
+                logger.error(f"❌ Job reaper failed: {e}")
+
+    async def _heartbeat(self, job: IngestJob):
+        """Keeps this process's lease on a running job fresh."""
+        while True:
+            await asyncio.sleep(settings.INGEST_LEASE_SECONDS / 4)
+            try:
+                await IngestJob.find_one(
+                    IngestJob.id == job.id, IngestJob.owner == self.owner, IngestJob.status == "running"
+                ).update({"$set": {"updated_at": datetime.now()}})
+            except Exception as e:
+                # Keep beating: one missed write is fine, a dead heartbeat loses the lease
+                logger.warning(f"⚠️ Heartbeat failed for job {job.id}: {e}")
+
+    async def enqueue(self, job: IngestJob):
+        await job.insert()
+        self._queue.put_nowait(str(job.id))
+        return job
+
+    async def _claim(self, job_id: str) -> Optional[IngestJob]:
+        """
+        Atomically flips queued -> running, so two workers (or two server
+        processes) never run the same job.
+        """
+        job = await IngestJob.get(job_id)
+        if not job:
+            return None
+        result = await IngestJob.find_one(
+            IngestJob.id == job.id, IngestJob.status == "queued"
+        ).update({
+            "$set": {"status": "running", "stage": "starting", "progress": 5, "owner": self.owner,
+                     "updated_at": datetime.now()},
+            "$inc": {"attempts": 1}
+        })
+        if not result or result.modified_count != 1:
+            return None
+        return await IngestJob.get(job_id)
+
+    async def _set(self, job: IngestJob, **fields):
+        fields["updated_at"] = datetime.now()
+        await job.set(fields)
+
+    async def _worker(self, worker_id: int):
+        # Model calls from here yield to interactive requests (chat) under quota pressure
+        with model_priority(BACKGROUND):
+            while True:
+                job_id = await self._queue.get()
+                try:
+                    job = await self._claim(job_id)
+                    if job:
+                        heartbeat = asyncio.create_task(self._heartbeat(job))
+                        try:
+                            with span("job.total", file_type=job.file_type):
+                                await self._run(job)
+                        finally:
+                            heartbeat.cancel()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"❌ Worker {worker_id} crashed on job {job_id}: {e}")
+                finally:
+                    self._queue.task_done()
+
+    async def _run(self, job: IngestJob):
+        logger.info(f"🧠 AI Analyzing {job.file_type.upper()} for Patient {job.patient_id} (job {job.id}, attempt {job.attempts})...")
+        try:
+            # Same bytes already analyzed with the current prompts? Skip the AI.
+            with span("job.cache_lookup"):
+                cached = await analysis_cache.lookup(job.sha256, job.file_type)
+            if cached:
+                logger.info(f"♻️ Dedup cache hit for {job.filename} ({job.sha256[:12]})")
+                await self._set(job, stage="cached", progress=50)
+                result = await reuse_cached_analysis(cached, job.filename, job.patient_id, self._clients,
+                                                     file_id=str(job.id))
+            else:
+                await self._set(job, stage="reading", progress=10)
+                with span("job.read_file"):
+                    content = await asyncio.to_thread(_read_file, job.local_path)
+
+                await self._set(job, stage="analyzing", progress=30)
+                result = await analyze_file(
+                    content, job.filename, job.file_type, job.patient_id, self._clients,
+                    mime_type=job.mime_type, file_id=str(job.id)  # stable across retries
+                )
+
+        except Exception as e:
+            if job.attempts < settings.INGEST_MAX_ATTEMPTS:
+                delay = settings.INGEST_RETRY_BACKOFF * (2 ** (job.attempts - 1))
+                logger.warning(f"⚠️ Job {job.id} failed ({e}), retrying in {delay:.0f}s...",
+                               extra={"job_id": str(job.id), "attempt": job.attempts})
+                await self._set(job, status="queued", stage="retrying", error=str(e), owner=None)
+                asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, str(job.id))
+                return
+
+            logger.error(f"❌ AI Failed: {e}", extra={"job_id": str(job.id), "attempt": job.attempts})
+            ai_summary = {"error": str(e)}
+            chat_text = "❌ I encountered an error analyzing this file."
+            await self._save_to_visit(job, {"file_id": "error", "ai_summary": ai_summary, "chat_text": chat_text})
+            await self._set(job, status="failed", stage="failed", progress=100, error=str(e),
+                            result={"ai_summary": ai_summary, "chat_message": chat_text})
+            return
+
+        # Outside the retry block: a failed cache write must not redo the analysis
+        if not cached:
+            try:
+                await analysis_cache.store(job.sha256, job.file_type, job.patient_id, result)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not cache the analysis of {job.filename}: {e}")
+
+        await self._set(job, stage="saving", progress=90)
+        with span("mongo.save", job_id=str(job.id)):
+            await self._save_to_visit(job, result)
+        await self._set(job, status="done", stage="done", progress=100, error=None,
+                        result={"ai_summary": result["ai_summary"], "chat_message": result["chat_text"],
+                                "cache_hit": cached is not None, "ocr_engine": result.get("ocr_engine")})
+        logger.info(f"✅ Job {job.id} done", extra={"job_id": str(job.id), "file_type": job.file_type})
+        summary_updater.schedule(self._clients, job.patient_id)
+
+    async def _save_to_visit(self, job: IngestJob, result: dict):
+        """
+        Idempotent: both rows take the job's id as their _id, so a job re-run
+        after a crash or a lease reclaim keeps the rows it saved first.
+        """
+        # Save File Record (The Database Copy)
+        await _insert_once(VisitFile(
+            id=job.id,
+            visit_id=job.visit_id,
+            patient_id=job.patient_id,
+            file_id=result["file_id"] or str(uuid.uuid4()),
+            filename=job.filename,
+            file_type=job.file_type,
+            local_path=job.local_path,
+            ai_summary=result["ai_summary"],
+            sha256=job.sha256,
+            ocr_engine=result.get("ocr_engine"),
+            ocr_confidence=result.get("ocr_confidence")
+        ))
+
+        # Save Chat Message (The "Chatbot" Experience)
+        # We add a message from the "ai" so it shows up in the chat window.
+        await _insert_once(ChatMessage(
+            id=job.id,
+            visit_id=job.visit_id,
+            patient_id=job.patient_id,
+            sender="ai",
+            text=result["chat_text"]
+        ))
+
+
+ingest_queue = IngestQueue()
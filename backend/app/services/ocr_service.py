@@ -0,0 +1,197 @@
+import io
+import base64
+from typing import Optional
+
+from PIL import Image
+from pydantic import BaseModel, ValidationError
+
+from app.core.log import get_logger
+from app.core.clients import AIClients
+from app.core.concurrency import call_model, is_retryable
+from app.core.config import settings
+from app.core.imaging import run_in_image_pool
+from app.core.metrics import span
+
+logger = get_logger("ocr")
+
+OCR_PROMPT = "Transcribe this medical document exactly. Output ONLY the text found."
+
+EXTRACTION_PROMPT = """
+You are an expert medical AI. Read this medical document.
+1. "transcription": transcribe ALL the text exactly as written.
+2. Then analyze it:
+   - "patient_summary": brief summary
+   - "differential_diagnoses": ["1. Most likely: [Condition] (Reason)", "2. Potential alternative: [Condition] (Reason)"]
+   - "medicines": list of medicines
+   - "advice": non-medicine advice
+"""
+
+
+class PrescriptionExtraction(BaseModel):
+    """Single-call output: the transcription + the same summary the two-call path builds."""
+    transcription: str
+    patient_summary: str
+    differential_diagnoses: list[str] = []
+    medicines: list[str] = []
+    advice: str = ""
+
+
+# Gemini response_schema (OpenAPI subset) matching PrescriptionExtraction
+EXTRACTION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "transcription": {"type": "STRING"},
+        "patient_summary": {"type": "STRING"},
+        "differential_diagnoses": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "medicines": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "advice": {"type": "STRING"},
+    },
+    "required": ["transcription", "patient_summary", "differential_diagnoses", "medicines", "advice"],
+}
+
+
+def _tesseract(data: bytes) -> dict:
+    """
+    CPU-bound part (runs in a worker process): Tesseract with per-word confidence.
+    """
+    import pytesseract
+
+    img = Image.open(io.BytesIO(data)).convert("L")
+    result = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
+
+    lines: dict[tuple, list[str]] = {}
+    confidences = []
+    for i, word in enumerate(result["text"]):
+        conf = float(result["conf"][i])
+        if conf < 0 or not word.strip():
+            continue  # layout rows (blocks / lines) carry conf = -1
+        confidences.append(conf)
+        key = (result["block_num"][i], result["par_num"][i], result["line_num"][i])
+        lines.setdefault(key, []).append(word)
+
+    words = len(confidences)
+    low = sum(1 for c in confidences if c < settings.OCR_LOW_WORD_CONFIDENCE)
+    return {
+        "text": "\n".join(" ".join(ws) for _, ws in sorted(lines.items())),
+        "words": words,
+        "mean_confidence": round(sum(confidences) / words, 1) if words else 0.0,
+        "low_confidence_ratio": round(low / words, 3) if words else 1.0,
+    }
+
+
+def is_confident(local: dict) -> bool:
+    """
+    Printed slips / lab reports: many words, high average confidence, few shaky words.
+    Handwriting scores low on all three and gets escalated to the vision LLM.
+    """
+    return (
+        local["words"] >= settings.OCR_MIN_WORDS
+        and local["mean_confidence"] >= settings.OCR_MIN_CONFIDENCE
+        and local["low_confidence_ratio"] <= settings.OCR_MAX_LOW_CONFIDENCE_RATIO
+    )
+
+
+async def local_ocr(file_bytes: bytes) -> Optional[dict]:
+    """Runs Tesseract in the image process pool. None if Tesseract isn't usable."""
+    try:
+        with span("ocr.tesseract"):
+            return await run_in_image_pool(_tesseract, bytes(file_bytes))
+    except Exception as e:
+        logger.warning(f"⚠️ Local OCR unavailable: {e}")
+        return None
+
+
+async def llm_ocr(file_bytes: bytes, mime_type: str, clients: AIClients) -> str:
+    from langchain_core.messages import HumanMessage
+
+    image_b64 = base64.b64encode(file_bytes).decode("utf-8")
+
+    ocr_message = HumanMessage(
+        content=[
+            {"type": "text", "text": OCR_PROMPT},
+            {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{image_b64}"}}
+        ]
+    )
+
+    with span("ocr.vision_llm"):
+        ai_response = await call_model("vision", lambda: clients.vision_llm.ainvoke([ocr_message]))
+    extracted_text = ai_response.content
+    if isinstance(extracted_text, list):
+        extracted_text = " ".join(str(item) for item in extracted_text)
+    return extracted_text
+
+
+async def llm_extract(file_bytes: bytes, mime_type: str, clients: AIClients) -> Optional[PrescriptionExtraction]:
+    """
+    ONE multimodal call that returns transcription + summary as schema-constrained
+    JSON (no code-fence stripping). None if the answer doesn't parse / validate,
+    so the caller can fall back to the two-call path. Model errors (rate limits,
+    open breaker, outages) propagate: the fallback would hit the same model.
+    """
+    from langchain_core.messages import HumanMessage
+
+    image_b64 = base64.b64encode(file_bytes).decode("utf-8")
+    message = HumanMessage(
+        content=[
+            {"type": "text", "text": EXTRACTION_PROMPT},
+            {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{image_b64}"}}
+        ]
+    )
+    structured_llm = clients.vision_llm.bind(generation_config={
+        "response_mime_type": "application/json",
+        "response_schema": EXTRACTION_SCHEMA,
+    })
+
+    try:
+        with span("ocr.structured_extract"):
+            ai_response = await call_model("vision", lambda: structured_llm.ainvoke([message]))
+        content = ai_response.content
+        if isinstance(content, list):
+            content = "".join(str(item) for item in content)
+        return PrescriptionExtraction.model_validate_json(content)
+    except (ValidationError, ValueError) as e:
+        if is_retryable(e):
+            raise
+        logger.warning(f"⚠️ Structured extraction invalid, using two-call path: {e}")
+    return None
+
+
+async def extract_text(file_bytes: bytes, mime_type: str, clients: AIClients, structured: bool = False) -> dict:
+    """
+    Tiered OCR. OCR_ENGINE:
+      "auto"  -> Tesseract first, vision LLM only for low-confidence / handwritten pages
+      "local" -> Tesseract only
+      "llm"   -> vision LLM only (old behaviour)
+    Returns {"text", "engine", "confidence"} so each record shows which path was taken.
+    With structured=True the vision LLM tier uses llm_extract(), and the result
+    also carries "analysis" (the summary), so no second call is needed.
+    """
+    engine = settings.OCR_ENGINE
+    local = None
+
+    if engine in ("auto", "local"):
+        local = await local_ocr(file_bytes)
+        if local and (engine == "local" or is_confident(local)):
+            logger.info(f"⚡ Local OCR: {local['words']} words, conf {local['mean_confidence']}")
+            return {"text": local["text"], "engine": "tesseract", "confidence": local["mean_confidence"]}
+        if local:
+            logger.info(f"↗️ Escalating to vision LLM (conf {local['mean_confidence']}, "
+                  f"low-conf words {local['low_confidence_ratio']:.0%})")
+
+    confidence = local["mean_confidence"] if local else None
+    if structured:
+        extraction = await llm_extract(file_bytes, mime_type, clients)
+        if extraction:
+            return {
+                "text": extraction.transcription,
+                "engine": "vision_llm",
+                "confidence": confidence,
+                "analysis": extraction.model_dump(exclude={"transcription"}),
+            }
+
+    text = await llm_ocr(file_bytes, mime_type, clients)
+    return {
+        "text": text,
+        "engine": "vision_llm",
+        "confidence": confidence,
+    }
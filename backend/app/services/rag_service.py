@@ -1,52 +1,25 @@
-import os
-from typing import Optional
-from dotenv import load_dotenv
-from pinecone import Pinecone
-from pydantic import SecretStr
-
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
-from langchain.chains import RetrievalQA
-from langchain_core.prompts import PromptTemplate
-
-load_dotenv()
-
-# === ENV VARS ===
-pinecone_key = os.getenv("PINECONE_API_KEY")
-pinecone_index = os.getenv("PINECONE_INDEX_NAME")
-google_key = os.getenv("GOOGLE_API_KEY")
-
-assert pinecone_key, "Missing PINECONE_API_KEY"
-assert pinecone_index, "Missing PINECONE_INDEX_NAME"
-assert google_key, "Missing GOOGLE_API_KEY"
-
-# === INIT PINECONE CLIENT ===
-pc = Pinecone(api_key=pinecone_key)
-
-# === EMBEDDINGS ===
-embeddings = GoogleGenerativeAIEmbeddings(
-    model="models/text-embedding-004",
-    google_api_key=SecretStr(google_key)
-)
-
-# === VECTORSTORE ===
-vectorstore = PineconeVectorStore(
-    index_name=pinecone_index,
-    embedding=embeddings
-)
-
-# === LLM ===
-# ✅ USING gemini-flash-latest for stability & global knowledge
-llm = ChatGoogleGenerativeAI(
-    model="gemini-flash-latest",
-    temperature=0.3,
-    google_api_key=google_key
-)
-
-# --- THE FIX: HYBRID PROMPT (Context + Global Knowledge) ---
+import re
+import time
+import asyncio
+from typing import TYPE_CHECKING, AsyncIterator, List, NamedTuple, Optional, Tuple
+
+from app.core.clients import AIClients
+from app.core.concurrency import call_model, run_blocking, stream_model
+from app.core.config import settings
+from app.core.metrics import CONTEXT_TOKENS, RAG_RETRIEVAL, estimate_tokens, span
+from app.services.answer_cache import answer_cache
+from app.services.summary_service import latest_summary
+
+if TYPE_CHECKING:  # langchain_core is imported on first use (keeps app import fast)
+    from langchain_core.documents import Document
+
+# --- THE FIX: HYBRID PROMPT (Summary + Context + Global Knowledge) ---
 template = """
 You are E-parchi, an expert medical assistant.
-You have access to the patient's records (Context), but you also possess extensive general medical knowledge.
+You have access to the patient's records (Summary + Context), but you also possess extensive general medical knowledge.
+
+Patient summary (all visits so far):
+{summary}
 
 Context from records:
 {context}
@@ -55,8 +28,8 @@ Doctor's Question:
 {question}
 
 Instructions:
-1. **First, check the Context:** Look for specific details about *this* patient (past meds, X-ray findings, allergies).
-2. **If Context is missing the answer:** (e.g., Doctor asks "How do I treat this fracture?" but no prescription exists yet):
+1. **First, check the Summary and Context:** Look for specific details about *this* patient (past meds, X-ray findings, allergies).
+2. **If they are missing the answer:** (e.g., Doctor asks "How do I treat this fracture?" but no prescription exists yet):
    - You **MUST** use your general medical knowledge.
    - Provide standard medical treatment guidelines, dosage recommendations, or next steps.
    - Start these answers with: *"Based on standard medical guidelines..."* or *"General treatment for this condition includes..."*
@@ -66,54 +39,247 @@ Instructions:
 Answer:
 """
 
-QA_PROMPT = PromptTemplate.from_template(template)
 
+# --- CONTEXT ASSEMBLY ---
+
+class RagContext(NamedTuple):
+    prompt: str
+    docs: list              # Documents in the prompt, best first
+    context_tokens: int     # summary + chunks (~4 chars/token)
+    retrieval: str          # "keyword" (fast path), "hybrid", "vector" or "cache" (answer cache hit)
+
+
+_WORDS = re.compile(r"\w+")
+
+def _word_set(text: str) -> frozenset:
+    return frozenset(_WORDS.findall(text.lower()))
+
+def _near_duplicate(a: frozenset, b: frozenset) -> bool:
+    if not a or not b:
+        return a == b
+    return len(a & b) / len(a | b) >= settings.RAG_DEDUP_SIMILARITY
+
+
+def assemble_context(hits: List[Tuple["Document", float]], max_docs: int, budget_tokens: int) -> Tuple[list, int]:
+    """
+    Turns raw (document, similarity) hits into the chunks that go in the prompt:
+      1. dedupe: same file + chunk, or (near-)identical text (re-uploaded
+         prescriptions, repeated X-ray memory sentences) -> keep the best one
+      2. rank: similarity + a recency bonus from upload_timestamp
+      3. trim: at most `max_docs` chunks and `budget_tokens` tokens; the last
+         chunk that doesn't fit is cut to the remaining budget
+    Returns (documents, tokens used).
+    """
+    now = time.time()
+
+    def rank(hit) -> float:
+        doc, score = hit
+        age_days = max(0.0, now - float(doc.metadata.get("upload_timestamp") or 0)) / 86400
+        return score + settings.RAG_RECENCY_WEIGHT * 0.5 ** (age_days / settings.RAG_RECENCY_HALF_LIFE_DAYS)
+
+    kept, seen_ids, seen_words = [], set(), []
+    for doc, score in sorted(hits, key=rank, reverse=True):
+        chunk_id = (doc.metadata.get("file_id"), doc.metadata.get("chunk"))
+        if chunk_id[0] and chunk_id in seen_ids:
+            continue
+        words = _word_set(doc.page_content)
+        if any(_near_duplicate(words, other) for other in seen_words):
+            continue
+        seen_ids.add(chunk_id)
+        seen_words.append(words)
+        kept.append(doc)
+
+    docs, used = [], 0
+    for doc in kept[:max_docs]:
+        tokens = estimate_tokens(doc.page_content)
+        if used + tokens > budget_tokens:
+            remaining = budget_tokens - used
+            if remaining >= settings.RAG_MIN_CHUNK_TOKENS:
+                doc = doc.copy(update={"page_content": doc.page_content[:remaining * 4]})
+                docs.append(doc)
+                used += estimate_tokens(doc.page_content)
+            break
+        docs.append(doc)
+        used += tokens
+    return docs, used
+
+
+def _hit_key(doc: "Document") -> tuple:
+    meta = doc.metadata
+    if meta.get("file_id"):
+        return meta["file_id"], meta.get("chunk", 0)
+    return None, doc.page_content
+
+
+def fuse_hits(*rankings: List[Tuple["Document", float]]) -> List[Tuple["Document", float]]:
+    """
+    Reciprocal rank fusion: each list adds 1 / (RAG_RRF_K + rank) to a chunk,
+    so BM25 and cosine scores never have to be compared directly. Fused
+    scores are scaled to 0..1 (best = 1), the range assemble_context's
+    recency bonus was tuned for.
+    """
+    fused: dict = {}
+    for hits in rankings:
+        for rank, (doc, _) in enumerate(hits, start=1):
+            key = _hit_key(doc)
+            doc_, score = fused.get(key, (doc, 0.0))
+            fused[key] = (doc_, score + 1 / (settings.RAG_RRF_K + rank))
+    if not fused:
+        return []
+    top = max(score for _, score in fused.values())
+    return sorted(((doc, score / top) for doc, score in fused.values()), key=lambda h: h[1], reverse=True)
+
+
+async def _retrieve(query_text: str, clients: AIClients, filters: Optional[dict],
+                    patient_id: Optional[str], k: int) -> Tuple[list, str]:
+    """
+    Keyword (BM25) + vector candidates for one question -> (hits, mode).
+    A confident keyword match ("was she ever on azithromycin?": every term is
+    in the top record) answers from keyword hits alone, skipping the query
+    embedding and the vector store round-trip.
+    """
+    fetch_k = max(k, settings.RAG_FETCH_K)
+    keyword = None
+    if patient_id and clients.keyword_index:
+        with span("rag.keyword", patient_id=patient_id):
+            keyword = await asyncio.to_thread(clients.keyword_index.search, patient_id, query_text, fetch_k)
+        if settings.KEYWORD_FASTPATH and keyword.confident:
+            top = keyword.hits[0][1]
+            return [(doc, score / top) for doc, score in keyword.hits], "keyword"
+
+    # Over-fetch candidates so dedup still leaves k distinct chunks.
+    # Vector search is a sync client call: off the event loop, bounded like other vector calls.
+    with span("rag.retrieve", patient_id=patient_id, k=k):
+        hits = await run_blocking("vector", clients.vectorstore.similarity_search_with_score,
+                                  query_text, k=fetch_k, filter=filters)
+    if keyword and keyword.hits:
+        return fuse_hits(hits, keyword.hits), "hybrid"
+    return hits, "vector"
 
-def get_rag_response(query_text: str, file_id: Optional[str] = None, patient_id: Optional[str] = None):
+
+async def _prepare(query_text: str, clients: AIClients, file_id: Optional[str], patient_id: Optional[str]) -> RagContext:
+    """
+    Retrieval + context assembly + prompt, shared by both answer paths.
+    When the patient has a rolling summary, the prompt gets it plus at most
+    RAG_SUMMARY_K targeted chunks instead of RAG_K: the summary already covers
+    the rest of the chart. Summary + chunks stay within RAG_CONTEXT_TOKENS, so a
+    large chart costs the same per question as a small one.
+    """
+    # === FILTERS ===
+    filters = None
+    if patient_id:
+        filters = {"patient_id": patient_id}
+    elif file_id:
+        filters = {"file_id": file_id}
+
+    summary = await latest_summary("patient", patient_id) if patient_id else None
+    summary_text = f"(version {summary.version}) {summary.text}" if summary else "(no summary yet)"
+    k = settings.RAG_SUMMARY_K if summary else settings.RAG_K
+
+    hits, mode = await _retrieve(query_text, clients, filters, patient_id, k)
+    RAG_RETRIEVAL.inc(mode=mode)
+
+    summary_tokens = estimate_tokens(summary.text) if summary else 0
+    with span("rag.context", candidates=len(hits)):
+        docs, chunk_tokens = assemble_context(hits, k, max(0, settings.RAG_CONTEXT_TOKENS - summary_tokens))
+    CONTEXT_TOKENS.observe(summary_tokens + chunk_tokens)
+
+    prompt = template.format(
+        summary=summary_text,
+        context="\n\n".join(doc.page_content for doc in docs),
+        question=query_text,
+    )
+    return RagContext(prompt, docs, summary_tokens + chunk_tokens, mode)
+
+
+def _use_answer_cache(patient_id: Optional[str]) -> bool:
+    return bool(patient_id) and settings.ANSWER_CACHE_ENABLED
+
+
+async def get_rag_response(query_text: str, clients: AIClients, file_id: Optional[str] = None, patient_id: Optional[str] = None):
     try:
-        # === FILTERS ===
-        filters = None
-        if patient_id:
-            filters = {"patient_id": patient_id}
-        elif file_id:
-            filters = {"file_id": file_id}
-
-        # === RETRIEVER ===
-        retriever = vectorstore.as_retriever(
-            search_kwargs={
-                "k": 5, 
-                **({"filter": filters} if filters else {})
-            }
-        )
-
-        # === QA CHAIN ===
-        qa = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=retriever,
-            chain_type_kwargs={"prompt": QA_PROMPT},
-            return_source_documents=True
-        )
-
-        result = qa.invoke({"query": query_text})
+        # === ANSWER CACHE (same question, same records -> same answer, no model call) ===
+        if _use_answer_cache(patient_id):
+            generation = await answer_cache.generation(patient_id)
+            with span("rag.answer_cache", patient_id=patient_id):
+                cached = await answer_cache.lookup(query_text, patient_id, clients, generation)
+            if cached:
+                return {**cached.answer, "retrieval": "cache"}
+
+        context = await _prepare(query_text, clients, file_id, patient_id)
+
+        # Native async: the Gemini call is awaited, so one slow answer doesn't
+        # stall other clinics' requests. The model part alone is in
+        # eparchi_model_call_duration_seconds{model="chat"}
+        with span("rag.answer", patient_id=patient_id):
+            response = await call_model("llm", lambda: clients.chat_llm.ainvoke(context.prompt))
 
         # === CLEAN OUTPUT ===
-        clean_output = result["result"].strip()
+        content = response.content
+        if isinstance(content, list):
+            content = "".join(str(item) for item in content)
+        clean_output = content.strip()
 
         # === SOURCE DOC ===
         source = None
-        docs = result.get("source_documents", [])
-        if docs and len(docs) > 0:
-            source = docs[0].metadata.get("source", None)
+        if context.docs:
+            source = context.docs[0].metadata.get("source", None)
 
-        return {
+        result = {
             "status": "success",
             "ai_response": clean_output,
-            "source_document": source
+            "source_document": source,
+            "context_tokens": context.context_tokens,
+            "retrieval": context.retrieval
         }
+        if clean_output and _use_answer_cache(patient_id):
+            answer_cache.store(query_text, patient_id, result, context.docs, generation)
+        return result
 
     except Exception as e:
         return {
             "status": "error",
             "message": str(e)
-        }
\ No newline at end of file
+        }
+
+
+async def stream_rag_response(query_text: str, clients: AIClients, file_id: Optional[str] = None,
+                              patient_id: Optional[str] = None) -> AsyncIterator[Tuple[str, object]]:
+    """
+    Streaming twin of get_rag_response(), same retrieval / prompt.
+    Yields ("sources", RagContext) as soon as the context is assembled, then
+    ("token", text) chunks as the chat model produces them. Errors are raised.
+    A cached answer comes back as one token; a completed stream is cached.
+    """
+    if _use_answer_cache(patient_id):
+        generation = await answer_cache.generation(patient_id)
+        with span("rag.answer_cache", patient_id=patient_id):
+            cached = await answer_cache.lookup(query_text, patient_id, clients, generation)
+        if cached:
+            yield "sources", RagContext("", cached.docs, cached.answer["context_tokens"], "cache")
+            yield "token", cached.answer["ai_response"]
+            return
+
+    context = await _prepare(query_text, clients, file_id, patient_id)
+    yield "sources", context
+
+    answer = []
+    with span("rag.stream", patient_id=patient_id):
+        async for chunk in stream_model("llm", lambda: clients.chat_llm.astream(context.prompt)):
+            text = chunk.content
+            if isinstance(text, list):
+                text = "".join(str(item) for item in text)
+            if text:
+                answer.append(text)
+                yield "token", text
+
+    clean_output = "".join(answer).strip()
+    if clean_output and _use_answer_cache(patient_id):
+        result = {
+            "status": "success",
+            "ai_response": clean_output,
+            "source_document": context.docs[0].metadata.get("source") if context.docs else None,
+            "context_tokens": context.context_tokens,
+            "retrieval": context.retrieval
+        }
+        answer_cache.store(query_text, patient_id, result, context.docs, generation)
@@ -0,0 +1,175 @@
+import json
+import asyncio
+import weakref
+from typing import Optional
+
+from beanie import PydanticObjectId
+
+from app.core.log import get_logger
+from app.core.clients import AIClients
+from app.core.concurrency import BACKGROUND, call_model, model_priority
+from app.core.config import settings
+from app.core.metrics import span
+from app.models import RecordSummary, Visit, VisitFile, VisitSummary
+from app.services.answer_cache import answer_cache
+
+logger = get_logger("summary")
+
+SUMMARY_PROMPT = """
+You maintain a running medical summary of one patient for their doctor.
+
+CURRENT PATIENT SUMMARY (all visits so far):
+{patient_summary}
+
+CURRENT SUMMARY OF THE VISIT ON {visit_date}:
+{visit_summary}
+
+NEW RECORDS FROM THAT VISIT:
+{records}
+
+Fold the new records into both summaries. Keep every clinically relevant fact:
+diagnoses, medicines with doses, allergies, X-ray findings, advice, dates.
+Drop repetition and OCR noise. Never invent facts.
+- "patient_summary": at most {patient_words} words, whole history, most recent first
+- "visit_summary": at most {visit_words} words, this visit only
+
+OUTPUT FORMAT (JSON):
+{{"patient_summary": "...", "visit_summary": "..."}}
+"""
+
+# Per-file budget in the prompt: the analysis JSON, not the raw OCR transcript
+RECORD_CHARS = 1500
+
+
+async def latest_summary(scope: str, scope_id: str) -> Optional[RecordSummary]:
+    return await RecordSummary.find(
+        RecordSummary.scope == scope, RecordSummary.scope_id == scope_id
+    ).sort(-RecordSummary.version).first_or_none()
+
+
+def _record_line(f: VisitFile) -> str:
+    analysis = json.dumps(f.ai_summary or {}, ensure_ascii=False)[:RECORD_CHARS]
+    return f"- {f.created_at:%Y-%m-%d} {f.file_type} {f.filename}: {analysis}"
+
+
+async def _fold(clients: AIClients, visit: Optional[VisitSummary], files: list[VisitFile],
+                patient: Optional[RecordSummary], current_visit: Optional[RecordSummary]) -> dict:
+    """ONE summary call: previous summaries + new records -> both new summaries."""
+    prompt = SUMMARY_PROMPT.format(
+        patient_summary=patient.text if patient else "(none yet)",
+        visit_date=f"{visit.timestamp:%Y-%m-%d}" if visit else "unknown date",
+        visit_summary=current_visit.text if current_visit else "(none yet)",
+        records="\n".join(_record_line(f) for f in files),
+        patient_words=settings.SUMMARY_MAX_WORDS,
+        visit_words=settings.VISIT_SUMMARY_MAX_WORDS,
+    )
+    json_llm = clients.summary_llm.bind(generation_config={"response_mime_type": "application/json"})
+    response = await call_model("llm", lambda: json_llm.ainvoke(prompt))
+    content = response.content
+    if isinstance(content, list):
+        content = "".join(str(item) for item in content)
+    parsed = json.loads(content.replace("```json", "").replace("```", "").strip())
+    if not parsed.get("patient_summary"):
+        raise ValueError("summary response has no patient_summary")
+    return parsed
+
+
+async def _mark_summarized(refs: list[str]):
+    ids = [PydanticObjectId(ref) for ref in refs if PydanticObjectId.is_valid(ref)]
+    await VisitFile.find({"_id": {"$in": ids}}).update({"$set": {"summarized": True}})
+
+
+async def update_summaries(clients: AIClients, patient_id: str):
+    """
+    Folds every file of this patient that isn't summarized yet into new
+    versions of the visit + patient summaries (oldest visit first).
+    Idempotent: a file is folded in once, however often this runs. Files are
+    flagged after their version is inserted; a crash in between is repaired
+    from the latest version's file_refs (only its own files, so it stays small).
+    """
+    patient = await latest_summary("patient", patient_id)
+    if patient and patient.file_refs:
+        await _mark_summarized(patient.file_refs)
+
+    pending = await VisitFile.find(
+        VisitFile.patient_id == patient_id,
+        {"summarized": {"$ne": True}},
+        {"file_id": {"$ne": "error"}},
+    ).sort(+VisitFile.created_at).to_list()
+    if not pending:
+        return
+    file_count = (patient.file_count or len(patient.file_refs)) if patient else 0
+
+    by_visit: dict[str, list[VisitFile]] = {}
+    for f in pending:
+        by_visit.setdefault(f.visit_id, []).append(f)
+
+    for visit_id, group in by_visit.items():
+        visit = None
+        if PydanticObjectId.is_valid(visit_id):
+            visit = await Visit.find_one(Visit.id == PydanticObjectId(visit_id)).project(VisitSummary)
+        for i in range(0, len(group), settings.SUMMARY_FILES_PER_CALL):
+            files = group[i:i + settings.SUMMARY_FILES_PER_CALL]
+            current_visit = await latest_summary("visit", visit_id)
+            with span("summary.update", patient_id=patient_id, files=len(files)):
+                parsed = await _fold(clients, visit, files, patient, current_visit)
+
+            refs = [str(f.id) for f in files]
+            file_count += len(files)
+            visit_text = parsed.get("visit_summary") or (current_visit.text if current_visit else "")
+            patient = RecordSummary(scope="patient", scope_id=patient_id, patient_id=patient_id,
+                                    version=(patient.version if patient else 0) + 1,
+                                    text=parsed["patient_summary"], file_refs=refs, file_count=file_count)
+            await RecordSummary.insert_many([
+                RecordSummary(scope="visit", scope_id=visit_id, patient_id=patient_id,
+                              version=(current_visit.version if current_visit else 0) + 1,
+                              text=visit_text, file_refs=refs),
+                patient,
+            ])
+            await _mark_summarized(refs)
+            # The timeline shows the newest visit summary (Visit.visit_summary)
+            if visit:
+                await Visit.find_one(Visit.id == visit.id).update({"$set": {"visit_summary": visit_text}})
+            # Cached chat answers were built on the previous summary
+            await answer_cache.invalidate(patient_id)
+            logger.info(f"📝 Summary v{patient.version} for Patient {patient_id} (+{len(files)} files)")
+
+
+class SummaryUpdater:
+    """
+    Runs update_summaries() in the background after each ingest, one update
+    at a time per patient (each version builds on the previous one), at
+    background model priority. A failed update is simply retried by the next
+    ingest of that patient, since the pending files are read from Mongo.
+    """
+
+    def __init__(self):
+        # A patient's lock lives only while an update for them holds it
+        self._locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
+        self._tasks: set[asyncio.Task] = set()
+
+    def schedule(self, clients: AIClients, patient_id: str):
+        if not settings.SUMMARY_ENABLED:
+            return
+        task = asyncio.create_task(self._run(clients, patient_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, clients: AIClients, patient_id: str):
+        lock = self._locks.get(patient_id)
+        if lock is None:
+            lock = self._locks[patient_id] = asyncio.Lock()
+        try:
+            with model_priority(BACKGROUND):
+                async with lock:
+                    await update_summaries(clients, patient_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Summary update failed for Patient {patient_id}: {e}")
+
+    async def drain(self):
+        """Waits for the updates in flight (shutdown, scripts)."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+summary_updater = SummaryUpdater()
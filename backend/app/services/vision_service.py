@@ -1,19 +1,16 @@
-import os
 import base64
 import json
 import re
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage
-from dotenv import load_dotenv
 
-load_dotenv()
+from app.core.log import get_logger
+from app.core.clients import AIClients
+from app.core.concurrency import call_model
+from app.core.metrics import span
 
-# We use the latest Flash model for Vision capabilities.
-vision_llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0.0,
-    google_api_key=os.getenv("GOOGLE_API_KEY") 
-)
+logger = get_logger("vision")
+
+# Bump whenever the radiologist prompt changes (invalidates cached analyses).
+PROMPT_VERSION = "xray-v1"
 
 def clean_json_string(s):
     """
@@ -31,9 +28,11 @@ def clean_json_string(s):
         return match.group(0)
     return s
 
-async def analyze_xray(file_bytes: bytes, filename: str):
+async def analyze_xray(file_bytes: bytes, filename: str, clients: AIClients, mime_type: str = "image/jpeg"):
+    from langchain_core.messages import HumanMessage
+
     try:
-        print(f"🩻 Scanning X-Ray: {filename}...")
+        logger.info(f"🩻 Scanning X-Ray: {filename}...")
         
         # 1. Prepare Image for the AI
         image_b64 = base64.b64encode(file_bytes).decode("utf-8")
@@ -58,12 +57,13 @@ async def analyze_xray(file_bytes: bytes, filename: str):
         message = HumanMessage(
             content=[
                 {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"}}
+                {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{image_b64}"}}
             ]
         )
         
         # 3. Invoke the Vision Model
-        response = vision_llm.invoke([message])
+        with span("llm.xray", file=filename):
+            response = await call_model("vision", lambda: clients.vision_llm.ainvoke([message]))
         
         # 4. Handle Response Content
         content = response.content
@@ -71,7 +71,7 @@ async def analyze_xray(file_bytes: bytes, filename: str):
             content = content[0]
         content_str = str(content)
         
-        print(f"🔍 Raw AI Output: {content_str}") # Debug print
+        logger.debug(f"🔍 Raw AI Output: {content_str}")
 
         # 5. Clean & Parse
         clean_json = clean_json_string(content_str)
@@ -79,7 +79,7 @@ async def analyze_xray(file_bytes: bytes, filename: str):
         try:
             analysis_result = json.loads(clean_json)
         except json.JSONDecodeError:
-            print("⚠️ Standard JSON parse failed. Trying repair...")
+            logger.warning("⚠️ Standard JSON parse failed. Trying repair...")
             # Fallback: Sometimes AI leaves a trailing comma like {"a":1,}
             # We try to remove it.
             clean_json = re.sub(r",\s*}", "}", clean_json)
@@ -101,7 +101,7 @@ async def analyze_xray(file_bytes: bytes, filename: str):
         }
 
     except Exception as e:
-        print(f"❌ X-Ray Analysis Failed: {e}")
+        logger.error(f"❌ X-Ray Analysis Failed: {e}")
         return {
             "status": "error", 
             "message": str(e),
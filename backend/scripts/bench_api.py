@@ -0,0 +1,488 @@
+"""
+Offline benchmark of the real FastAPI app (no Gemini, Pinecone or MongoDB needed).
+
+Drives /patients/create, /visits/create, /visits/{id}/upload (until the job is
+done), /visits/{id}/chat and /visits/{id}/chat/stream (latency = time to first
+token) in-process, with deterministic fakes:
+- FakeChatModel      : stands in for ChatGoogleGenerativeAI (vision / summary / chat)
+- FakeEmbeddings     : stands in for GoogleGenerativeAIEmbeddings (behind the real embedding cache)
+- FakePineconeStore  : LocalVectorStore + network-like latency, stands in for PineconeVectorStore
+- mongomock-motor    : in-memory MongoDB (pip install mongomock-motor)
+Every fake has a latency and an error rate (model / embedding errors are 429
+quota errors, so the retry governor is exercised); the random stream is seeded,
+so two runs with the same flags do the same work.
+
+Reports p50 / p95 / p99 latency, requests/s and peak memory per endpoint and
+concurrency level. Save a run with --json and compare commits with --compare.
+
+Usage (from backend/):
+    python scripts/bench_api.py
+    python scripts/bench_api.py --concurrency 1 8 32 --requests 64 --llm-latency 0.2
+    python scripts/bench_api.py --json before.json
+    python scripts/bench_api.py --compare before.json
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import itertools
+import argparse
+import tempfile
+import resource
+import tracemalloc
+from typing import Any, List, Optional
+from urllib.parse import urlencode
+
+# Make `app` importable when run as a script
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# Settings are read at import: point everything at throwaway local paths first
+_TMP = tempfile.mkdtemp(prefix="eparchi_bench_")
+os.environ.setdefault("OCR_ENGINE", "llm")  # Tesseract isn't part of the measured path
+os.environ["UPLOAD_DIR"] = os.path.join(_TMP, "uploads")
+os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(_TMP, "embeddings.sqlite3")
+os.environ["KEYWORD_INDEX_PATH"] = os.path.join(_TMP, "keyword_index.sqlite3")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+# --- FAKES ---
+
+class FakeQuotaError(RuntimeError):
+    """What Gemini raises at the quota ceiling (429 ResourceExhausted)."""
+    code = 429
+
+
+class FakeBackend:
+    """Shared latency + seeded error injection."""
+
+    def __init__(self, latency: float, error_rate: float, seed: int):
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and self._random.random() < self.error_rate
+
+
+def build_fake_chat_model(backend: FakeBackend):
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, AIMessageChunk
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+    def _text(messages) -> str:
+        parts = []
+        for message in messages:
+            content = message.content
+            if isinstance(content, list):
+                content = " ".join(p.get("text", "") for p in content if isinstance(p, dict))
+            parts.append(content)
+        return "\n".join(parts)
+
+    def _answer(prompt: str, kwargs: dict) -> str:
+        if "running medical summary" in prompt:
+            return json.dumps({
+                "patient_summary": "Viral fever with cough; on Paracetamol 650mg SOS and Ascoril D.",
+                "visit_summary": "Fever with cough, Paracetamol + Ascoril D prescribed.",
+            })
+        if "generation_config" in kwargs:  # single-call structured extraction
+            return json.dumps({
+                "transcription": "Tab. Paracetamol 650mg SOS. Syp. Ascoril D 2 tsp TDS.",
+                "patient_summary": "Fever with cough.",
+                "differential_diagnoses": ["1. Most likely: Viral fever (fever + cough)"],
+                "medicines": ["Paracetamol 650mg", "Ascoril D"],
+                "advice": "Steam inhalation.",
+            })
+        if "Radiologist" in prompt:
+            return '{"finding": "Normal", "location": "Chest", "severity": "Mild", "notes": "No acute findings."}'
+        if "Transcribe" in prompt:
+            return "Tab. Paracetamol 650mg SOS. Syp. Ascoril D 2 tsp TDS. Review after 5 days."
+        if "EXTRACTED TEXT" in prompt:
+            return ('{"patient_summary": "Fever with cough.", "differential_diagnoses": [], '
+                    '"medicines": ["Paracetamol 650mg", "Ascoril D"], "advice": "Steam inhalation."}')
+        return "Based on the records, the patient was prescribed Paracetamol 650mg SOS."
+
+    class FakeChatModel(BaseChatModel):
+        """Answers like Gemini would for each prompt this app sends."""
+
+        @property
+        def _llm_type(self) -> str:
+            return "fake-gemini"
+
+        def _result(self, messages, kwargs) -> ChatResult:
+            if backend.should_fail():
+                raise FakeQuotaError("fake model error: quota exceeded")
+            content = _answer(_text(messages), kwargs)
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+            time.sleep(backend.latency)
+            return self._result(messages, kwargs)
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+            await asyncio.sleep(backend.latency)
+            return self._result(messages, kwargs)
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+            # First chunk after a quarter of the latency, the rest word by word
+            await asyncio.sleep(backend.latency / 4)
+            words = self._result(messages, kwargs).generations[0].text.split(" ")
+            for i, word in enumerate(words):
+                if i:
+                    await asyncio.sleep(backend.latency * 0.75 / len(words))
+                yield ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+
+    return FakeChatModel()
+
+
+def build_fake_embeddings(backend: FakeBackend, dim: int = 768):
+    import numpy as np
+    from langchain_core.embeddings import Embeddings
+
+    class FakeEmbeddings(Embeddings):
+        """Deterministic vectors (seeded by the text hash); sync, like the real client."""
+
+        def _vector(self, text: str) -> List[float]:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            return np.random.default_rng(seed).standard_normal(dim).astype(np.float32).tolist()
+
+        def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            time.sleep(backend.latency)
+            if backend.should_fail():
+                raise FakeQuotaError("fake embedding error: quota exceeded")
+            return [self._vector(t) for t in texts]
+
+        def embed_query(self, text: str) -> List[float]:
+            return self.embed_documents([text])[0]
+
+    return FakeEmbeddings()
+
+
+def build_fake_vectorstore(embeddings, backend: FakeBackend, path: str):
+    from app.core.vectorstore import LocalVectorStore
+
+    class FakePineconeStore(LocalVectorStore):
+        """Real local index + a network round-trip per upsert / query."""
+
+        def add_vectors(self, *args, **kwargs):
+            time.sleep(backend.latency)
+            if backend.should_fail():
+                raise RuntimeError("fake vector store error")
+            return super().add_vectors(*args, **kwargs)
+
+        def similarity_search_by_vector_with_score(self, *args, **kwargs):
+            time.sleep(backend.latency)
+            return super().similarity_search_by_vector_with_score(*args, **kwargs)
+
+    return FakePineconeStore(embedding=embeddings, path=path)
+
+
+def build_fake_clients(args):
+    from app.core.clients import AIClients
+    from app.core.keyword_index import KeywordIndex
+    from app.core.embedding_cache import CachedEmbeddings
+    from app.core.metrics import model_metrics_callback
+    from app.core.config import settings
+
+    class FakeClients(AIClients):
+        """Same attributes as AIClients, built from fakes (no SDKs, no keys)."""
+
+        def __init__(self):
+            llm = FakeBackend(args.llm_latency, args.error_rate, args.seed)
+            vision = FakeBackend(args.vision_latency, args.error_rate, args.seed + 1)
+            embed = FakeBackend(args.embed_latency, args.error_rate, args.seed + 2)
+            vector = FakeBackend(args.vector_latency, args.error_rate, args.seed + 3)
+
+            self.embeddings = CachedEmbeddings(
+                build_fake_embeddings(embed), model_name="fake-embedding",
+                path=settings.EMBEDDING_CACHE_PATH, lru_size=settings.EMBEDDING_CACHE_LRU_SIZE
+            )
+            self.vision_llm = build_fake_chat_model(vision)
+            self.summary_llm = build_fake_chat_model(llm)
+            self.chat_llm = build_fake_chat_model(llm)
+            for name, model in (("vision", self.vision_llm), ("summary", self.summary_llm), ("chat", self.chat_llm)):
+                model.callbacks = [model_metrics_callback(name)]
+            self.pinecone = None
+            self.pinecone_index = None
+            self.vectorstore = build_fake_vectorstore(self.embeddings, vector, os.path.join(_TMP, "vectors"))
+            self.keyword_index = KeywordIndex(settings.KEYWORD_INDEX_PATH) if settings.KEYWORD_SEARCH_ENABLED else None
+
+    return FakeClients()
+
+
+def fake_image(level: int, i: int) -> bytes:
+    """
+    A small JPEG, unique per (concurrency level, upload): unique bytes = no
+    dedup cache hits, including against the uploads of earlier levels.
+    """
+    from PIL import Image, ImageDraw
+    img = Image.new("RGB", (900, 1200), (250, 250, 245))
+    draw = ImageDraw.Draw(img)
+    rng = random.Random(f"{level}-{i}")
+    for line in range(30):
+        draw.text((40, 40 + line * 36), f"Rx {level}/{i}-{line} " + "x" * rng.randint(10, 60), fill=(20, 20, 20))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=80)
+    return out.getvalue()
+
+
+# --- MEASUREMENT ---
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    low, high = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+async def sse_first_token(app, path: str, form: dict) -> Optional[float]:
+    """
+    POSTs a form to an SSE endpoint over raw ASGI (httpx's ASGITransport buffers
+    the whole body, which would hide streaming). Seconds to the first token
+    event, or None if the stream didn't end with "done".
+    """
+    body = urlencode(form).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "client": ("127.0.0.1", 0), "server": ("bench", 80),
+        "headers": [(b"host", b"bench"), (b"content-type", b"application/x-www-form-urlencoded"),
+                    (b"content-length", str(len(body)).encode())],
+    }
+    request = [{"type": "http.request", "body": body, "more_body": False}]
+    start, ttft, stream = time.perf_counter(), None, b""
+
+    async def receive():
+        if request:
+            return request.pop()
+        await asyncio.Event().wait()  # never disconnects; cancelled when the response ends
+
+    async def send(message):
+        nonlocal ttft, stream
+        if message["type"] == "http.response.body":
+            stream += message.get("body", b"")
+            if ttft is None and b"event: token" in stream:
+                ttft = time.perf_counter() - start
+
+    await app(scope, receive, send)
+    return ttft if b"event: done" in stream else None
+
+
+async def run_level(name: str, concurrency: int, total: int, call) -> dict:
+    """
+    Runs `total` calls of `call(i)` with at most `concurrency` in flight.
+    `call` returns ok, or the latency to record (streaming: time to first token).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                ok = await call(i)
+            except Exception:
+                ok = False
+            if isinstance(ok, float):
+                latencies.append(ok)
+            else:
+                latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+
+    return {
+        "endpoint": name,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "rps": round(total / wall, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "peak_mb": round(peak / 1024 / 1024, 1),
+    }
+
+
+async def bench(args) -> List[dict]:
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        print("❌ The benchmark needs an in-memory Mongo: pip install mongomock-motor")
+        sys.exit(1)
+    import httpx
+    from beanie import init_beanie
+
+    from app.main import app
+    from app.database import DOCUMENT_MODELS
+    from app.core.clients import set_clients
+    from app.core.imaging import shutdown_image_pool
+    from app.core.warmup import warmup
+    from app.services.job_service import ingest_queue
+
+    # Same startup as the lifespan, with the fakes swapped in
+    await init_beanie(database=AsyncMongoMockClient()["bench"], document_models=DOCUMENT_MODELS)
+    clients = build_fake_clients(args)
+    set_clients(clients)
+    await ingest_queue.start(clients)
+    await warmup(clients)
+    app.state.ready, app.state.startup = True, {}
+
+    # Built before timing starts; one set per level (see fake_image)
+    images = {}
+    if "upload->done" in args.endpoints:
+        images = {level: [fake_image(level, i) for i in range(args.requests)] for level in args.concurrency}
+    active = {"level": args.concurrency[0]}  # level being measured (picks the upload images)
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as http:
+
+        async def create_patient(i):
+            r = await http.post("/patients/create", data={"name": f"Patient {i}", "age": 30 + i % 50, "gender": "F"})
+            return r.status_code == 200
+
+        # A fixed pool of patients / visits for the other endpoints
+        patient_ids, visit_ids = [], []
+        for i in range(max(args.concurrency)):
+            r = await http.post("/patients/create", data={"name": f"Seed {i}", "age": 40, "gender": "M"})
+            patient_ids.append(r.json()["patient"]["_id"])
+            r = await http.post("/visits/create", data={"patient_id": patient_ids[-1]})
+            visit_ids.append(r.json()["visit"]["_id"])
+
+        async def create_visit(i):
+            r = await http.post("/visits/create", data={"patient_id": patient_ids[i % len(patient_ids)]})
+            return r.status_code == 200
+
+        async def upload(i):
+            """202 accept + background analysis, until the job is done / failed."""
+            visit_id = visit_ids[i % len(visit_ids)]
+            r = await http.post(f"/visits/{visit_id}/upload", data={"type": "prescription"},
+                                files={"file": (f"rx_{i}.jpg", images[active["level"]][i], "image/jpeg")})
+            if r.status_code != 202:
+                return False
+            job_id = r.json()["job_id"]
+            while True:
+                await asyncio.sleep(0.01)
+                job = (await http.get(f"/jobs/{job_id}")).json()
+                if job["status"] in ("done", "failed"):
+                    return job["status"] == "done"
+
+        # Unique questions (across concurrency levels too): chat / chat/stream
+        # measure the full RAG path, not the answer cache
+        question_ids = itertools.count()
+
+        async def chat(i):
+            visit_id = visit_ids[i % len(visit_ids)]
+            query = f"What was prescribed? (chat q{next(question_ids)})"
+            r = await http.post(f"/visits/{visit_id}/chat", data={"query": query})
+            return r.status_code == 200 and "debug_info" not in r.json()
+
+        async def chat_cached(i):
+            """The same question again and again: the first one per patient misses."""
+            visit_id = visit_ids[i % len(visit_ids)]
+            r = await http.post(f"/visits/{visit_id}/chat", data={"query": "Any allergies?"})
+            return r.status_code == 200 and "debug_info" not in r.json()
+
+        async def chat_stream(i):
+            """SSE chat; the latency recorded is time to the first token event."""
+            visit_id = visit_ids[i % len(visit_ids)]
+            ttft = await sse_first_token(app, f"/visits/{visit_id}/chat/stream",
+                                         {"query": f"What was prescribed? (stream q{next(question_ids)})"})
+            return ttft if ttft is not None else False
+
+        scenarios = {
+            "patients/create": create_patient,
+            "visits/create": create_visit,
+            "upload->done": upload,
+            "chat": chat,
+            "chat/stream": chat_stream,
+            "chat/cached": chat_cached,
+        }
+        for name in args.endpoints:
+            for level in args.concurrency:
+                active["level"] = level
+                row = await run_level(name, level, args.requests, scenarios[name])
+                results.append(row)
+                print_row(row)
+
+    await ingest_queue.stop()
+    shutdown_image_pool()
+    return results
+
+
+# --- REPORT ---
+
+HEADER = f"{'endpoint':18} {'conc':>5} {'reqs':>6} {'err':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak MB':>8}"
+
+
+def print_row(row: dict, baseline: Optional[dict] = None):
+    line = (f"{row['endpoint']:18} {row['concurrency']:5} {row['requests']:6} {row['errors']:5} "
+            f"{row['rps']:9.1f} {row['p50_ms']:9.1f} {row['p95_ms']:9.1f} {row['p99_ms']:9.1f} {row['peak_mb']:8.1f}")
+    if baseline:
+        def delta(key, lower_is_better=True):
+            before = baseline[key]
+            if not before:
+                return "   n/a"
+            change = (row[key] - before) / before
+            better = change < 0 if lower_is_better else change > 0
+            return f"{change:+6.0%}{'✅' if better else '⚠️' if abs(change) > 0.1 else '  '}"
+        line += f"   rps {delta('rps', False)}  p95 {delta('p95_ms')}"
+    print(line)
+
+
+def compare(results: List[dict], path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        baseline = {(r["endpoint"], r["concurrency"]): r for r in json.load(f)["results"]}
+    print(f"\n📊 Compared with {path}")
+    print(HEADER)
+    for row in results:
+        print_row(row, baseline.get((row["endpoint"], row["concurrency"])))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64, help="requests per endpoint and level")
+    parser.add_argument("--endpoints", nargs="+", default=["patients/create", "visits/create", "upload->done", "chat", "chat/stream", "chat/cached"])
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="fake seconds per text LLM call")
+    parser.add_argument("--vision-latency", type=float, default=0.8, help="fake seconds per vision call")
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--vector-latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="0..1, per fake call")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="save results here (to --compare a later run against)")
+    parser.add_argument("--compare", help="results file of an earlier run")
+    args = parser.parse_args()
+
+    print(f"🧪 Offline API benchmark (llm {args.llm_latency}s, vision {args.vision_latency}s, "
+          f"errors {args.error_rate:.0%}, seed {args.seed})")
+    print(HEADER)
+    tracemalloc.start()
+    results = asyncio.run(bench(args))
+    tracemalloc.stop()
+
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"\n🧠 Peak RSS: {rss_mb:.0f} MB (peak MB column = Python allocations per level)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "peak_rss_mb": round(rss_mb, 1), "results": results}, f, indent=2)
+        print(f"💾 Saved to {args.json}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark for the image preprocessing stage (app/core/imaging.py).
+
+For every image it reports the original vs. preprocessed size, the base64
+payload that would be sent to Gemini, and how long preprocessing took.
+It always ends with a synthetic 16-bit X-ray (12-bit values, 0-4095) and
+fails if the 8-bit output is washed out (values above 255 clipped to white).
+
+Usage (from backend/):
+    python scripts/bench_preprocess.py                      # all images in uploads/
+    python scripts/bench_preprocess.py scan1.jpg scan2.png --type xray
+"""
+import os
+import sys
+import glob
+import io
+import time
+import asyncio
+import argparse
+
+import numpy as np
+from PIL import Image
+
+# Make `app` importable when run as a script
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.core.imaging import preprocess_image, shutdown_image_pool
+
+
+def b64_size(n: int) -> int:
+    return 4 * ((n + 2) // 3)
+
+
+def synthetic_xray_16bit(size: int = 2500) -> bytes:
+    """A 16-bit grayscale PNG with a diagonal 0-4095 ramp (12-bit detector range)."""
+    ramp = np.add.outer(np.arange(size), np.arange(size)) * 4095 // (2 * size - 2)
+    out = io.BytesIO()
+    Image.fromarray(ramp.astype(np.uint16)).save(out, format="PNG")
+    return out.getvalue()
+
+
+async def check_16bit() -> bool:
+    data = synthetic_xray_16bit()
+    start = time.perf_counter()
+    image = await preprocess_image(data, "xray")
+    ms = (time.perf_counter() - start) * 1000
+    pixels = np.asarray(Image.open(io.BytesIO(image.data)).convert("L"))
+    white = (pixels >= 250).mean()
+    print(f"🩻 16-bit X-ray: {len(data) / 1024:.1f} KB -> {len(image.data) / 1024:.1f} KB, "
+          f"{image.width}x{image.height}, {ms:.1f} ms, range {pixels.min()}-{pixels.max()}, {white:.1%} white")
+    if white > 0.05:
+        print("❌ 16-bit image was clipped instead of rescaled.")
+        return False
+    return True
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="*", help="images (default: uploads/*)")
+    parser.add_argument("--type", default="prescription", choices=["prescription", "xray"])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per image (best time is reported)")
+    args = parser.parse_args()
+
+    files = args.files or sorted(
+        f for ext in ("jpg", "jpeg", "png", "webp") for f in glob.glob(f"uploads/*.{ext}")
+    )
+    if not files:
+        print("⚠️ No images found, running the 16-bit check only.")
+        ok = await check_16bit()
+        shutdown_image_pool()
+        sys.exit(0 if ok else 1)
+
+    # Warm up the process pool so the first image doesn't pay the fork cost
+    with open(files[0], "rb") as f:
+        await preprocess_image(f.read(), args.type)
+
+    total_in = total_out = 0
+    total_ms = 0.0
+    print(f"{'file':40} {'in KB':>8} {'out KB':>8} {'saved':>7} {'size':>11} {'ms':>7}")
+    for path in files:
+        with open(path, "rb") as f:
+            data = f.read()
+
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            image = await preprocess_image(data, args.type)
+            best = min(best, (time.perf_counter() - start) * 1000)
+
+        saved = 1 - len(image.data) / len(data)
+        total_in += len(data)
+        total_out += len(image.data)
+        total_ms += best
+        print(f"{os.path.basename(path)[:40]:40} {len(data) / 1024:8.1f} {len(image.data) / 1024:8.1f} "
+              f"{saved:7.1%} {f'{image.width}x{image.height}':>11} {best:7.1f}")
+
+    print("-" * 86)
+    print(f"📦 Payload: {total_in / 1024:.1f} KB -> {total_out / 1024:.1f} KB "
+          f"({1 - total_out / total_in:.1%} smaller)")
+    print(f"📡 Base64 sent to Gemini: {b64_size(total_in) / 1024:.1f} KB -> {b64_size(total_out) / 1024:.1f} KB")
+    print(f"⏱️ Preprocessing: {total_ms / len(files):.1f} ms per image")
+
+    ok = await check_16bit()
+    shutdown_image_pool()
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+"""
+Bulk importer for a clinic's scanned paper archive (app/services/bulk_ingest_service.py).
+
+Streams every image through preprocess -> OCR -> chunk -> batched embed ->
+batched upsert, checkpointing each finished file. Re-running the same command
+after a crash or Ctrl+C skips everything already imported.
+Connects to MongoDB (MONGODB_URL) to mark each imported patient's records as
+changed, so running servers stop serving cached chat answers for them.
+
+Sources:
+    archive/                      folder; first sub-folder = patient id (archive/<patient_id>/scan.jpg)
+    manifest.csv | manifest.jsonl path,patient_id[,file_type] per row
+
+Usage (from backend/):
+    python scripts/bulk_ingest.py archive/
+    python scripts/bulk_ingest.py scans/ --patient-id 65f1c0... --type xray
+    python scripts/bulk_ingest.py manifest.csv --ocr-workers 8 --embed-batch 100
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import itertools
+
+# Make `app` importable when run as a script
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.core.config import settings
+from app.core.clients import init_clients
+from app.core.imaging import shutdown_image_pool
+from app.core.log import setup_logging
+from app.database import init_db
+from app.services.bulk_ingest_service import BulkIngestPipeline, Checkpoint, iter_directory, iter_manifest
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source", help="archive folder, or a .csv / .jsonl manifest")
+    parser.add_argument("--patient-id", help="put every file of a folder under this patient")
+    parser.add_argument("--type", default="prescription", choices=["prescription", "xray"])
+    parser.add_argument("--checkpoint", default=settings.BULK_CHECKPOINT_PATH)
+    parser.add_argument("--limit", type=int, help="only look at the first N files")
+    parser.add_argument("--read-workers", type=int, default=settings.BULK_READ_WORKERS)
+    parser.add_argument("--ocr-workers", type=int, default=settings.BULK_OCR_WORKERS)
+    parser.add_argument("--embed-workers", type=int, default=settings.BULK_EMBED_WORKERS)
+    parser.add_argument("--embed-batch", type=int, default=settings.BULK_EMBED_BATCH)
+    parser.add_argument("--upsert-batch", type=int, default=settings.BULK_UPSERT_BATCH)
+    parser.add_argument("--progress-every", type=float, default=10.0, help="seconds between progress lines")
+    args = parser.parse_args()
+    setup_logging()
+
+    if os.path.isdir(args.source):
+        items = iter_directory(args.source, args.patient_id, args.type)
+    elif os.path.isfile(args.source):
+        items = iter_manifest(args.source, args.type)
+    else:
+        print(f"❌ Not found: {args.source}")
+        sys.exit(1)
+    if args.limit:
+        items = itertools.islice(items, args.limit)
+
+    await init_db()
+    checkpoint = Checkpoint(args.checkpoint)
+    pipeline = BulkIngestPipeline(
+        init_clients(), checkpoint,
+        read_workers=args.read_workers,
+        ocr_workers=args.ocr_workers,
+        embed_workers=args.embed_workers,
+        embed_batch=args.embed_batch,
+        upsert_batch=args.upsert_batch,
+    )
+
+    print(f"🚚 Importing {args.source} (checkpoint: {args.checkpoint})")
+    try:
+        report = await pipeline.run(items, progress_every=args.progress_every)
+    finally:
+        checkpoint.close()
+        shutdown_image_pool()
+
+    print(f"\n{'stage':8} {'items':>8} {'errors':>7} {'busy s':>9} {'avg ms':>9} {'per s':>8}")
+    for name, s in report["stages"].items():
+        print(f"{name:8} {s['items']:8} {s['errors']:7} {s['busy_s']:9.2f} {s['avg_ms']:9.1f} {s['per_s']:8.2f}")
+    print("-" * 54)
+    print(f"✅ {report['files_done']} imported, {report['files_skipped']} already done, "
+          f"{report['files_failed']} failed in {report['elapsed_s']}s ({report['files_per_s']} files/s)")
+    if report["files_failed"]:
+        print("↩️ Re-run the same command to retry the failed files.")
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
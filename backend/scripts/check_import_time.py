@@ -0,0 +1,88 @@
+"""
+Import-time regression check for the API.
+
+Imports `app.main` in fresh interpreters (python -X importtime) and fails if:
+- the best run is over the budget, or
+- a heavy SDK (Gemini, Pinecone, langchain chains, ...) is imported eagerly.
+Those must stay behind the lazy accessors / lifespan (see app/core/clients.py).
+No credentials, network or database are needed.
+
+Usage (from backend/):
+    python scripts/check_import_time.py                 # exits 1 on regression
+    python scripts/check_import_time.py --budget-ms 1200 --top 15
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Must not be imported by `import app.main`
+LAZY_MODULES = [
+    "langchain_google_genai",
+    "google.generativeai",
+    "pinecone",
+    "langchain_pinecone",
+    "langchain.chains",
+    "langchain.text_splitter",
+    "pytesseract",
+]
+
+
+def import_profile() -> dict[str, int]:
+    """module -> cumulative import time in microseconds, for one fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND, capture_output=True, text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        print("❌ `import app.main` failed")
+        sys.exit(1)
+
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            profile[name.strip()] = int(cumulative.strip())
+        except ValueError:
+            continue  # header row
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget-ms", type=float, default=1500.0)
+    parser.add_argument("--runs", type=int, default=3, help="best of N (first run warms the disk cache)")
+    parser.add_argument("--top", type=int, default=10, help="show the N slowest top-level imports")
+    args = parser.parse_args()
+
+    runs = [import_profile() for _ in range(args.runs)]
+    best = min(runs, key=lambda p: p.get("app.main", 0))
+    total_ms = best.get("app.main", 0) / 1000
+
+    print(f"⏱️ import app.main: {total_ms:.0f} ms (best of {args.runs}, budget {args.budget_ms:.0f} ms)")
+    top = sorted(((us, name) for name, us in best.items() if "." not in name and name != "app"), reverse=True)
+    for us, name in top[:args.top]:
+        print(f"   {us / 1000:8.1f} ms  {name}")
+
+    failed = False
+    eager = [m for m in LAZY_MODULES if m in best]
+    if eager:
+        print(f"❌ Imported eagerly (should be lazy): {', '.join(eager)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"❌ Over the import budget by {total_ms - args.budget_ms:.0f} ms")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print("✅ Import time OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Explain-plan check for the hot MongoDB queries.
+
+Runs `explain()` on every query the API issues per request and fails (exit 1)
+if any of them falls back to a collection scan (COLLSCAN). In-memory sorts
+(a blocking SORT stage) are reported as warnings.
+
+Run it against a database with the app's indexes (start the API once, or
+this script calls init_db which creates them):
+    python scripts/check_query_plans.py
+
+The same check runs in the test suite (tests/test_query_plans.py) against a
+throwaway database; it is skipped when no MongoDB is reachable.
+"""
+import os
+import sys
+import asyncio
+from datetime import datetime
+
+# Make `app` importable when run as a script
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.database import init_db
+from app.models import Patient, Visit, VisitFile, ChatMessage, IngestJob, AnalysisCache, RecordSummary
+
+SAMPLE_ID = "000000000000000000000000"
+SAMPLE_DATE = datetime(2000, 1, 1)
+
+# (label, model, filter, sort)
+HOT_QUERIES = [
+    ("patients list", Patient, {}, [("created_at", -1), ("_id", -1)]),
+    ("visit history", Visit, {"patient_id": SAMPLE_ID}, [("timestamp", -1), ("_id", -1)]),
+    ("visit files", VisitFile, {"visit_id": SAMPLE_ID}, [("created_at", 1)]),
+    ("summary pending", VisitFile,
+     {"patient_id": SAMPLE_ID, "summarized": {"$ne": True}, "file_id": {"$ne": "error"}}, [("created_at", 1)]),
+    ("latest summary", RecordSummary, {"scope": "patient", "scope_id": SAMPLE_ID}, [("version", -1)]),
+    ("visit messages", ChatMessage, {"visit_id": SAMPLE_ID}, [("timestamp", -1), ("_id", -1)]),
+    ("job resume", IngestJob, {"status": "queued"}, [("created_at", 1)]),
+    ("stale job leases", IngestJob, {"status": "running", "updated_at": {"$lt": SAMPLE_DATE}}, None),
+    ("visit job feed", IngestJob, {"visit_id": SAMPLE_ID}, [("created_at", 1)]),
+    ("dedup cache", AnalysisCache, {"key": "x"}, None),
+]
+
+
+def stages(plan: dict):
+    """Yields every stage name in a (nested) winning plan."""
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from stages(child)
+
+
+async def explain_hot_queries() -> list[tuple[str, list[str]]]:
+    """(label, winning plan stages) of every hot query. Beanie must be initialized."""
+    plans = []
+    for label, model, query, sort in HOT_QUERIES:
+        cursor = model.get_motor_collection().find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.limit(50).explain()
+        winning = explain.get("queryPlanner", {}).get("winningPlan", {})
+        plans.append((label, list(stages(winning))))
+    return plans
+
+
+async def main():
+    await init_db()
+
+    failed = False
+    for label, found in await explain_hot_queries():
+        if "COLLSCAN" in found:
+            failed = True
+            print(f"❌ {label:16} COLLSCAN  ({' <- '.join(found)})")
+        elif "SORT" in found:
+            print(f"⚠️ {label:16} in-memory SORT ({' <- '.join(found)})")
+        else:
+            print(f"✅ {label:16} {' <- '.join(found)}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+"""
+Load test for the async AI pipeline.
+
+Fires N concurrent prescription + X-ray uploads through `process_upload` and
+`analyze_xray` with fake Gemini / Pinecone clients injected in place of the
+real `AIClients` registry. Each fake call takes a fixed time to answer. If the pipeline is truly non-blocking, the wall time
+is close to the slowest single upload, NOT the sum of all of them.
+
+Usage (from backend/):
+    python scripts/load_test_uploads.py --uploads 8 --latency 1.0
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+# Make `app` importable when run as a script
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeLLM:
+    """Native-async fake: behaves like ChatGoogleGenerativeAI.ainvoke."""
+    def __init__(self, latency, content):
+        self.latency = latency
+        self.content = content
+
+    async def ainvoke(self, *args, **kwargs):
+        await asyncio.sleep(self.latency)
+        return FakeResponse(self.content)
+
+
+class FakeVectorStore:
+    """Blocking fake: behaves like the sync Pinecone client."""
+    def __init__(self, latency):
+        self.latency = latency
+
+    def add_documents(self, docs, **kwargs):
+        time.sleep(self.latency)
+        return [d.metadata.get("file_id") for d in docs]
+
+
+class FakeClients:
+    def __init__(self, vision_llm, summary_llm, vectorstore):
+        self.vision_llm = vision_llm
+        self.summary_llm = summary_llm
+        self.vectorstore = vectorstore
+        self.keyword_index = None  # store_documents skips the BM25 index
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=8, help="concurrent uploads")
+    parser.add_argument("--latency", type=float, default=1.0, help="fake seconds per model call")
+    args = parser.parse_args()
+
+    # Allow every upload to run at once so we measure the event loop, not the limiter.
+    for key in ("VISION_CONCURRENCY", "LLM_CONCURRENCY", "VECTOR_CONCURRENCY"):
+        os.environ[key] = str(args.uploads)
+    # Measure the remote-model path (local Tesseract would skip the fake vision call)
+    os.environ["OCR_ENGINE"] = "llm"
+
+    from app.services.ingest_service import process_upload, memorize_report
+    from app.services.vision_service import analyze_xray
+
+    lat = args.latency
+    # Same shape as app.core.clients.AIClients
+    ocr_clients = FakeClients(
+        vision_llm=FakeLLM(lat, "Tab. Paracetamol 650mg SOS"),
+        summary_llm=FakeLLM(lat, '{"patient_summary": "ok", "medicines": []}'),
+        vectorstore=FakeVectorStore(lat),
+    )
+    xray_clients = FakeClients(
+        vision_llm=FakeLLM(lat, '{"finding": "Normal", "location": "Chest", "severity": "Mild"}'),
+        summary_llm=None,
+        vectorstore=FakeVectorStore(lat),
+    )
+
+    async def one(i):
+        """Returns (seconds, error or None): a fast failure must not pass as concurrency."""
+        start = time.perf_counter()
+        if i % 2:
+            result = await analyze_xray(b"fake-image", f"xray_{i}.jpg", xray_clients)
+            if result["status"] != "success":
+                return time.perf_counter() - start, f"xray_{i}: {result.get('message')}"
+            file_id = await memorize_report("X-Ray: Normal", f"xray_{i}.jpg", "load_test", xray_clients)
+            if file_id is None:
+                return time.perf_counter() - start, f"xray_{i}: memorize_report stored nothing"
+        else:
+            result = await process_upload(b"fake-image", f"rx_{i}.jpg", ocr_clients, patient_id="load_test")
+            if result["status"] != "success" or not result.get("file_id"):
+                return time.perf_counter() - start, f"rx_{i}: {result.get('message')}"
+        return time.perf_counter() - start, None
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(args.uploads)))
+    wall = time.perf_counter() - start
+    durations = [seconds for seconds, _ in results]
+    errors = [error for _, error in results if error]
+
+    print(f"📊 {args.uploads} concurrent uploads")
+    print(f"   slowest single upload : {max(durations):.2f}s")
+    print(f"   sum of all uploads    : {sum(durations):.2f}s")
+    print(f"   wall time             : {wall:.2f}s")
+
+    if errors:
+        print(f"❌ {len(errors)}/{args.uploads} uploads failed:")
+        for error in errors:
+            print(f"   {error}")
+        sys.exit(1)
+
+    # Serial execution would take ~sum(durations); allow 25% scheduling slack.
+    if wall > max(durations) * 1.25:
+        print("❌ Uploads are serialized: something is blocking the event loop.")
+        sys.exit(1)
+    print("✅ Uploads ran concurrently.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+"""
+One-time migration: moves files / messages embedded in old Visit documents
+into the `visit_files` and `messages` collections, then clears the arrays.
+
+Safe to re-run: each visit is migrated and cleared in turn, so visits that
+were already migrated have empty arrays and are skipped.
+
+Usage (from backend/):
+    python scripts/migrate_visit_children.py
+"""
+import os
+import sys
+import asyncio
+
+# Make `app` importable when run as a script
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.database import init_db
+from app.models import Visit, VisitFile, ChatMessage
+
+
+async def main():
+    await init_db()
+
+    migrated = 0
+    query = Visit.find({"$or": [{"files.0": {"$exists": True}}, {"messages.0": {"$exists": True}}]})
+    async for visit in query:
+        visit_id = str(visit.id)
+        files = [
+            VisitFile(visit_id=visit_id, patient_id=visit.patient_id, created_at=visit.timestamp, **f.model_dump())
+            for f in visit.files
+        ]
+        messages = [
+            ChatMessage(visit_id=visit_id, patient_id=visit.patient_id, **m.model_dump())
+            for m in visit.messages
+        ]
+        if files:
+            await VisitFile.insert_many(files)
+        if messages:
+            await ChatMessage.insert_many(messages)
+        await visit.set({"files": [], "messages": []})
+
+        migrated += 1
+        print(f"📦 Visit {visit_id}: {len(files)} files, {len(messages)} messages")
+
+    print(f"✅ Migrated {migrated} visits")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+"""
+One-time migration: renumbers visits that share a visit_number.
+
+Before visit numbers came from an atomic $inc, two visits opened at once
+for the same patient could get the same number. The unique
+(patient_id, visit_number) index cannot be built over such duplicates, and
+the API builds it on startup (init_db), so RUN THIS BEFORE DEPLOYING the
+version with that index, with the API stopped:
+    python scripts/renumber_visits.py --dry-run
+    python scripts/renumber_visits.py
+
+Only patients with duplicates are touched: their visits are numbered
+1..n again in the order they happened (timestamp, then _id), and the
+patient's total_visits counter is raised to at least n. Safe to re-run.
+"""
+import os
+import sys
+import asyncio
+import argparse
+
+# Make `app` importable when run as a script
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from beanie import PydanticObjectId
+
+from app.database import init_db
+from app.models import Patient, Visit
+
+# Patients with at least one visit_number used twice
+DUPLICATES = [
+    {"$group": {"_id": {"patient_id": "$patient_id", "visit_number": "$visit_number"}, "count": {"$sum": 1}}},
+    {"$match": {"count": {"$gt": 1}}},
+    {"$group": {"_id": "$_id.patient_id"}},
+]
+
+
+async def renumber(patient_id: str, dry_run: bool) -> int:
+    """Renumbers one patient's visits; returns how many changed."""
+    visits = Visit.get_motor_collection().find(
+        {"patient_id": patient_id}, projection={"visit_number": 1}
+    ).sort([("timestamp", 1), ("_id", 1)])
+
+    changed = 0
+    number = 0
+    async for visit in visits:
+        number += 1
+        if visit["visit_number"] != number:
+            changed += 1
+            if not dry_run:
+                await Visit.get_motor_collection().update_one(
+                    {"_id": visit["_id"]}, {"$set": {"visit_number": number}}
+                )
+
+    if not dry_run and PydanticObjectId.is_valid(patient_id):
+        await Patient.get_motor_collection().update_one(
+            {"_id": PydanticObjectId(patient_id)}, {"$max": {"total_visits": number}}
+        )
+    return changed
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    args = parser.parse_args()
+
+    # The unique index can't exist yet: don't let init_db try to build it
+    await init_db(skip_indexes=True)
+
+    patients = await Visit.get_motor_collection().aggregate(DUPLICATES).to_list(None)
+    total = 0
+    for row in patients:
+        changed = await renumber(row["_id"], args.dry_run)
+        total += changed
+        print(f"🔢 Patient {row['_id']}: {changed} visits renumbered")
+
+    verb = "would be renumbered" if args.dry_run else "renumbered"
+    print(f"✅ {len(patients)} patients with duplicate visit numbers, {total} visits {verb}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,4 +1,5 @@
 import os
+import sys
 import time
 from dotenv import load_dotenv
 from pydantic import SecretStr
@@ -6,6 +7,11 @@ from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
 from langchain_core.documents import Document
 
+# Make `app` importable when run as a script
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app.core.config import settings
+from app.core.embedding_cache import CachedEmbeddings
+
 # 1. Load your API Keys from the .env file
 # We go "up one level" (..) because this script is in backend/scripts/
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), "../.env"))
@@ -21,9 +27,15 @@ if not api_key or not google_key:
 print(f"🔌 Connecting to Pinecone Index: {index_name}...")
 
 # 2. Initialize the Embedding Model (Must be 'text-embedding-004' for 768 dimensions)
-embeddings = GoogleGenerativeAIEmbeddings(
-    model="models/text-embedding-004",
-    google_api_key=SecretStr(google_key)
+# Shares the app's embedding cache, so re-seeding doesn't re-embed the same text.
+embeddings = CachedEmbeddings(
+    GoogleGenerativeAIEmbeddings(
+        model=settings.EMBEDDING_MODEL,
+        google_api_key=SecretStr(google_key)
+    ),
+    model_name=settings.EMBEDDING_MODEL,
+    path=settings.EMBEDDING_CACHE_PATH,
+    lru_size=settings.EMBEDDING_CACHE_LRU_SIZE
 )
 
 # 3. The "Golden Dataset" (Dummy Data)
@@ -0,0 +1,53 @@
+"""
+Explain-plan regression test: no hot query may fall back to a collection scan.
+
+Needs a MongoDB (MONGODB_URL, default localhost); skipped when none answers.
+Builds the app's indexes in a throwaway database and drops it afterwards.
+
+    cd backend && python -m pytest tests/
+"""
+import os
+import sys
+import asyncio
+
+import pytest
+
+# Make `app` and the scripts importable
+BACKEND = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, os.path.join(BACKEND, "scripts"))
+
+from check_query_plans import explain_hot_queries  # noqa: E402
+
+TEST_DB = "eparchi_query_plan_test"
+
+
+async def _explain_in_test_db():
+    from beanie import init_beanie
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo.errors import PyMongoError
+    from app.database import DOCUMENT_MODELS
+
+    client = AsyncIOMotorClient(os.getenv("MONGODB_URL") or "mongodb://localhost:27017",
+                                serverSelectionTimeoutMS=2000)
+    try:
+        await client.admin.command("ping")
+    except PyMongoError as e:
+        client.close()
+        return None, str(e)
+
+    try:
+        await init_beanie(database=client[TEST_DB], document_models=DOCUMENT_MODELS)
+        return await explain_hot_queries(), None
+    finally:
+        await client.drop_database(TEST_DB)
+        client.close()
+
+
+def test_hot_queries_use_indexes():
+    plans, error = asyncio.run(_explain_in_test_db())
+    if plans is None:
+        pytest.skip(f"No MongoDB reachable: {error}")
+
+    scans = {label: found for label, found in plans if "COLLSCAN" in found}
+    assert not scans, f"Queries without an index: {scans}"
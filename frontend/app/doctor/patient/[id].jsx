@@ -20,7 +20,8 @@ export default function PatientRecordScreen() {
   const { id, name, age, gender, total_visits } = useLocalSearchParams();
   const router = useRouter();
 
-  const { history, loading, refetch } = useVisitHistory(id);
+  const { history, loading, loadingMore, hasMore, loadMore, refetch } =
+    useVisitHistory(id);
 
   const [createLoading, setCreateLoading] = useState(false);
   const [alertConfig, setAlertConfig] = useState({
@@ -45,7 +46,7 @@ export default function PatientRecordScreen() {
           visitId: result.visit._id,
           patientId: id,
           patientName: name,
-          visitNumber: history.length + 1, // Newest visit
+          visitNumber: result.visit.visit_number,
           mode: "new",
         },
       });
@@ -59,8 +60,9 @@ export default function PatientRecordScreen() {
     }
   };
 
-  const renderVisitItem = ({ item, index }) => {
-    const visitNumber = history.length - index;
+  const renderVisitItem = ({ item }) => {
+    // The timeline is paged: only the server knows the visit's number
+    const visitNumber = item.visit_number;
     const rawDate =
       item.timestamp || item.created_at || item.createdAt || item.date;
     const dateObj = rawDate ? new Date(rawDate) : null;
@@ -186,7 +188,7 @@ export default function PatientRecordScreen() {
               />
               <Text style={{ color: "white", fontWeight: "600", fontSize: 13 }}>
                 Total Visits:{" "}
-                {history.length > 0 ? history.length : total_visits || 0}
+                {Math.max(history[0]?.visit_number || 0, total_visits || 0)}
               </Text>
             </View>
           </View>
@@ -203,6 +205,25 @@ export default function PatientRecordScreen() {
           keyExtractor={(item) => item._id}
           refreshing={loading}
           onRefresh={refetch}
+          onEndReached={loadMore}
+          onEndReachedThreshold={0.5}
+          ListFooterComponent={
+            hasMore ? (
+              <TouchableOpacity
+                onPress={loadMore}
+                disabled={loadingMore}
+                style={{ alignItems: "center", paddingVertical: 12 }}
+              >
+                {loadingMore ? (
+                  <ActivityIndicator color={activeColors.tint} />
+                ) : (
+                  <Text style={{ color: activeColors.tint, fontWeight: "600" }}>
+                    Load older visits
+                  </Text>
+                )}
+              </TouchableOpacity>
+            ) : null
+          }
           contentContainerStyle={{ paddingBottom: 100 }}
           ListEmptyComponent={
             <View style={{ alignItems: "center", marginTop: 40, opacity: 0.6 }}>
@@ -146,8 +146,8 @@ export default function ChatScreen() {
         return;
       }
       try {
-        const allVisits = await api.getHistory(patientId);
-        const currentVisit = allVisits.find((v) => v._id === visitId);
+        // History list is summaries only; full messages come from the visit itself
+        const currentVisit = await api.getVisit(visitId);
         if (currentVisit && currentVisit.messages?.length > 0) {
           const history = currentVisit.messages.map((msg, index) => ({
             id: index + Date.now(),
@@ -186,7 +186,7 @@ export default function ChatScreen() {
   );
 
   const handleFileUpload = async (file) => {
-    const userMsgId = Date.now();
+    const userMsgId = Date.now() + Math.random(); // several files upload at once
     const typeToSend = file.docType || "prescription";
 
     setMessages((prev) => [
@@ -201,20 +201,41 @@ export default function ChatScreen() {
 
     setLoading(true);
     const response = await api.uploadFile(visitId, file.uri, typeToSend);
-    setLoading(false);
-
-    let responseText = response?.chat_message;
-    if (typeof responseText === "object")
-      responseText = JSON.stringify(responseText);
 
+    // 202 Accepted: show the "analyzing" note, then replace it with the result
+    const aiMsgId = userMsgId + 1;
     setMessages((prev) => [
       ...prev,
       {
-        id: Date.now() + 1,
-        text: responseText || (response ? "✅ Done." : "❌ Failed."),
+        id: aiMsgId,
+        text: response?.chat_message || "❌ Failed.",
         sender: "ai",
       },
     ]);
+    if (!response?.job_id) {
+      setLoading(false);
+      return;
+    }
+
+    const job = await api.waitForJob(response.job_id);
+    setLoading(false);
+
+    let responseText = job?.result?.chat_message;
+    if (typeof responseText === "object")
+      responseText = JSON.stringify(responseText);
+    if (!responseText) {
+      responseText = job
+        ? job.status === "done"
+          ? "✅ Done."
+          : "❌ Failed."
+        : "⏳ Still analyzing. The result will appear in this visit shortly.";
+    }
+
+    setMessages((prev) =>
+      prev.map((msg) =>
+        msg.id === aiMsgId ? { ...msg, text: responseText } : msg,
+      ),
+    );
   };
 
   const handleSend = async () => {
@@ -17,7 +17,7 @@ export const usePatients = () => {
         // 1. Prepare Date String (YYYY-MM-DD)
         const dateString = date ? date.toISOString().split("T")[0] : null;
 
-        // 2. Fetch Data from Backend
+        // 2. Fetch Data from Backend (every page; sorted A-Z below)
         const data = await api.getPatients(dateString);
 
         if (data === null) {
@@ -86,31 +86,47 @@ export const usePatients = () => {
   };
 };
 
-// ... (Keep useVisitHistory unchanged)
+// 🪝 HOOK 2: Visit timeline, one page at a time (newest first)
 export const useVisitHistory = (patientId) => {
   const [history, setHistory] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   const fetchHistory = useCallback(async () => {
     if (!patientId) return;
 
-    const data = await api.getHistory(patientId);
+    const page = await api.getHistory(patientId);
 
-    const sortedData = (data || []).sort((a, b) => {
-      const dateA = new Date(a.timestamp || a.created_at || a.date || 0);
-      const dateB = new Date(b.timestamp || b.created_at || b.date || 0);
-      return dateB - dateA;
-    });
-
-    setHistory(sortedData);
+    setHistory(page.items || []);
+    setNextCursor(page.nextCursor);
     setLoading(false);
   }, [patientId]);
 
+  // Appends the next page (FlatList onEndReached / "load more")
+  const loadMore = useCallback(async () => {
+    if (!patientId || !nextCursor || loadingMore) return;
+    setLoadingMore(true);
+
+    const page = await api.getHistory(patientId, nextCursor);
+
+    setHistory((prev) => [...prev, ...(page.items || [])]);
+    setNextCursor(page.nextCursor);
+    setLoadingMore(false);
+  }, [patientId, nextCursor, loadingMore]);
+
   useFocusEffect(
     useCallback(() => {
       fetchHistory();
     }, [fetchHistory]),
   );
 
-  return { history, loading, refetch: fetchHistory };
+  return {
+    history,
+    loading,
+    loadingMore,
+    hasMore: Boolean(nextCursor),
+    loadMore,
+    refetch: fetchHistory,
+  };
 };
@@ -3,8 +3,9 @@
 // UPDATE THIS IF NGROK RESTARTS
 const BASE_URL = "https://semimythic-cosmographic-sherika.ngrok-free.dev";
 
-// Helper to handle response safely
-const safeFetch = async (url, options = {}) => {
+// Helper to handle response safely.
+// withCursor: list endpoints return one page and the next cursor in a header
+const safeFetch = async (url, options = {}, { withCursor = false } = {}) => {
   try {
     const controller = new AbortController();
     const timeoutId = setTimeout(() => controller.abort(), 15000); // 15s timeout
@@ -24,7 +25,11 @@ const safeFetch = async (url, options = {}) => {
     }
 
     try {
-      return JSON.parse(responseText);
+      const data = JSON.parse(responseText);
+      if (withCursor) {
+        return { items: data, nextCursor: response.headers.get("X-Next-Cursor") };
+      }
+      return data;
     } catch (e) {
       console.log(`⚠️ Parse Error on ${url}: Response was not JSON.`);
       return null;
@@ -50,12 +55,26 @@ export const api = {
     });
   },
 
+  // One page: { items, nextCursor } (nextCursor is null on the last page)
+  getPatientsPage: async (date = null, cursor = null) => {
+    const params = [];
+    if (date) params.push(`visit_date=${date}`);
+    if (cursor) params.push(`cursor=${encodeURIComponent(cursor)}`);
+    const query = params.length ? `?${params.join("&")}` : "";
+    return await safeFetch(`${BASE_URL}/patients${query}`, {}, { withCursor: true });
+  },
+
+  // Every patient: follows the cursor until the last page
   getPatients: async (date = null) => {
-    let url = `${BASE_URL}/patients`;
-    if (date) {
-      url += `?visit_date=${date}`;
-    }
-    return await safeFetch(url);
+    const patients = [];
+    let cursor = null;
+    do {
+      const page = await api.getPatientsPage(date, cursor);
+      if (page === null) return null;
+      patients.push(...(page.items || []));
+      cursor = page.nextCursor;
+    } while (cursor);
+    return patients;
   },
 
   // --- B. CLINIC VISIT FLOW ---
@@ -76,9 +95,15 @@ export const api = {
     });
   },
 
-  getHistory: async (patientId) => {
-    const result = await safeFetch(`${BASE_URL}/visits/history/${patientId}`);
-    return result || [];
+  // One page of visits, newest first: { items, nextCursor }
+  getHistory: async (patientId, cursor = null) => {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+    const page = await safeFetch(
+      `${BASE_URL}/visits/history/${patientId}${query}`,
+      {},
+      { withCursor: true },
+    );
+    return page || { items: [], nextCursor: null };
   },
 
   // --- C. AI TOOLS ---
@@ -103,6 +128,24 @@ export const api = {
     });
   },
 
+  // Uploads are analyzed in the background (202 + job_id): poll the job
+  getJob: async (jobId) => {
+    return await safeFetch(`${BASE_URL}/jobs/${jobId}`);
+  },
+
+  // Resolves with the finished job ("done" / "failed"), or null on timeout
+  waitForJob: async (jobId, { intervalMs = 1500, timeoutMs = 180000 } = {}) => {
+    const deadline = Date.now() + timeoutMs;
+    while (Date.now() < deadline) {
+      const job = await api.getJob(jobId);
+      if (job && (job.status === "done" || job.status === "failed")) {
+        return job;
+      }
+      await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    }
+    return null;
+  },
+
   chatWithVisit: async (visitId, query) => {
     const formData = new FormData();
     formData.append("query", query);